@@ -0,0 +1,261 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+import config
+from auth import decode_token
+from metrics import observe, register_callback
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-client token buckets: `rate` requests a second on average, in bursts of up to `burst`.
+    At most `max_clients` are tracked; the least recently seen are forgotten and start over full."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()  # key -> [tokens, updated]
+
+    # Take a token; returns 0, or the seconds until the client has one
+    def take(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+
+class CpuMonitor:
+    """System CPU use through psutil, re-read at most every ADMISSION_INTERVAL. Without psutil,
+    or with ADMISSION_CPU_PERCENT at 0, the CPU never counts as busy."""
+
+    def __init__(self):
+        self.percent = 0.0
+        self._read_at = 0.0
+        self._psutil = None
+        self._checked = False
+
+    def busy(self, now: float) -> bool:
+        if not config.ADMISSION_CPU_PERCENT:
+            return False
+        if not self._checked:
+            self._checked = True
+            try:
+                import psutil
+            except ImportError:
+                return False
+            self._psutil = psutil
+            psutil.cpu_percent(interval=None)  # the first reading is meaningless
+        if self._psutil is None:
+            return False
+        if now - self._read_at >= config.ADMISSION_INTERVAL:
+            self.percent = self._psutil.cpu_percent(interval=None)
+            self._read_at = now
+        return self.percent >= config.ADMISSION_CPU_PERCENT
+
+
+cpu_monitor = CpuMonitor()
+
+
+class RouteLimiter:
+    """Admission for one route: the client's token bucket first, then one of `concurrency` slots,
+    waiting in FIFO order behind at most `max_queue` others for up to ADMISSION_QUEUE_TIMEOUT.
+
+    Adaptive shedding, checked every ADMISSION_INTERVAL:
+    - If even the shortest queue wait in the last interval was above ADMISSION_TARGET_WAIT,
+      the queue is standing rather than absorbing a burst. Until it drains, requests that would
+      have to wait are turned away at once instead of adding to it.
+    - While the CPU is above ADMISSION_CPU_PERCENT, the slots shrink by a quarter each
+      interval, down to one. They grow back by one per interval once it isn't.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, rate: float = 0.0, burst: float = 1.0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.buckets = TokenBuckets(rate, burst, config.ADMISSION_MAX_CLIENTS) if rate > 0 else None
+        self.limit = float(self.concurrency)
+        self.active = 0
+        self.shedding = False
+        self.rejected = {"rate": 0, "overload": 0, "timeout": 0}
+        self.service_time = 0.0  # moving average of how long a request holds its slot
+        self._waiters: deque = deque()  # (enqueued at, future)
+        self._window_start = time.monotonic()
+        self._min_wait = math.inf
+
+    @property
+    def slots(self) -> int:
+        return max(1, int(self.limit))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _tick(self, now: float) -> None:
+        if now - self._window_start < config.ADMISSION_INTERVAL:
+            return
+        wait = self._min_wait
+        if wait == math.inf:
+            # Nobody got in during the interval: judge by whoever has waited longest
+            wait = now - self._waiters[0][0] if self._waiters else 0.0
+        self.shedding = wait > config.ADMISSION_TARGET_WAIT
+        if cpu_monitor.busy(now):
+            self.limit = max(1.0, self.limit * 0.75)
+        else:
+            self.limit = min(float(self.concurrency), self.limit + 1)
+        self._window_start = now
+        self._min_wait = math.inf
+        self._wake(now)
+
+    def _admit(self, wait: float) -> None:
+        self.active += 1
+        self._min_wait = min(self._min_wait, wait)
+        observe(f"admission.{self.name}.wait", wait)
+
+    def _wake(self, now: float) -> None:
+        while self._waiters and self.active < self.slots:
+            enqueued, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._admit(now - enqueued)
+            waiter.set_result(None)
+
+    # Roughly when the backlog ahead of a new request will have cleared
+    def retry_after(self) -> float:
+        return self.service_time * (len(self._waiters) + 1) / self.slots
+
+    async def acquire(self, key: str) -> None:
+        now = time.monotonic()
+        self._tick(now)
+        if self.buckets is not None:
+            wait = self.buckets.take(key, now)
+            if wait:
+                self.rejected["rate"] += 1
+                raise Rejected(429, "Too many requests, please slow down", wait)
+        if self.active < self.slots and not self._waiters:
+            self._admit(0.0)
+            return
+        if self.shedding or len(self._waiters) >= self.max_queue:
+            self.rejected["overload"] += 1
+            raise Rejected(503, "Server is busy, please retry shortly", self.retry_after())
+        entry = (now, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(entry[1], config.ADMISSION_QUEUE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry[1].done() and not entry[1].cancelled():
+                # Handed a slot just as we gave up
+                self.release(0.0)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected["timeout"] += 1
+                raise Rejected(503, "Server is busy, please retry shortly", self.retry_after())
+            raise
+
+    def release(self, held: float) -> None:
+        self.active -= 1
+        if held:
+            self.service_time = held if not self.service_time else 0.9 * self.service_time + 0.1 * held
+        now = time.monotonic()
+        self._tick(now)
+        self._wake(now)
+
+
+# Who a request counts against: the user of a valid bearer token, otherwise the client address.
+# Behind a proxy (ADMISSION_TRUST_FORWARDED, on by default on Vercel), the address it put last in
+# X-Forwarded-For; without it every anonymous client would share the proxy's address and its bucket
+def client_key(scope) -> str:
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"")
+    if authorization[:7].lower() == b"bearer ":
+        try:
+            return "user:" + decode_token(authorization[7:].decode("latin-1"))
+        except HTTPException:
+            pass
+    if config.ADMISSION_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+        return "ip:" + headers[b"x-forwarded-for"].split(b",")[-1].strip().decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+# The guarded routes, by (method, path)
+admission_limiters: dict[tuple[str, str], RouteLimiter] = {
+    ("POST", "/auth/signup"): RouteLimiter(
+        "signup", config.ADMISSION_SIGNUP_CONCURRENCY, config.ADMISSION_MAX_QUEUE,
+        config.ADMISSION_SIGNUP_RATE, config.ADMISSION_SIGNUP_BURST,
+    ),
+    ("POST", "/auth/login"): RouteLimiter(
+        "login", config.ADMISSION_LOGIN_CONCURRENCY, config.ADMISSION_MAX_QUEUE,
+        config.ADMISSION_LOGIN_RATE, config.ADMISSION_LOGIN_BURST,
+    ),
+    ("POST", "/meta/fetch_account_details"): RouteLimiter(
+        "mt5", config.ADMISSION_MT5_CONCURRENCY, config.ADMISSION_MAX_QUEUE,
+        config.ADMISSION_MT5_RATE, config.ADMISSION_MT5_BURST,
+    ),
+}
+
+
+class AdmissionMiddleware:
+    """Admission control for the routes in `limiters` (see RouteLimiter); everything else passes
+    straight through. Plain ASGI, so a rejected request costs no routing, body parsing or
+    database session: just a 429 (client over its rate) or 503 (route overloaded) with Retry-After."""
+
+    def __init__(self, app, limiters: Optional[dict] = None):
+        self.app = app
+        self.limiters = admission_limiters if limiters is None else limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        try:
+            await limiter.acquire(client_key(scope))
+        except Rejected as e:
+            retry_after = str(max(1, math.ceil(min(e.retry_after, config.ADMISSION_MAX_RETRY_AFTER))))
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers={"Retry-After": retry_after})
+            return await response(scope, receive, send)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - started)
+
+
+def _per_route(read) -> dict:
+    return {(limiter.name,): read(limiter) for limiter in admission_limiters.values()}
+
+
+register_callback("admission_in_flight", "Admitted requests running, by route.", lambda: _per_route(lambda l: l.active), labelnames=("route",))
+register_callback("admission_queued", "Requests waiting for admission, by route.", lambda: _per_route(lambda l: l.queued), labelnames=("route",))
+register_callback("admission_concurrency_limit", "Current concurrency limit, by route.", lambda: _per_route(lambda l: l.slots), labelnames=("route",))
+register_callback("admission_shedding", "1 while a route sheds requests that would queue.", lambda: _per_route(lambda l: int(l.shedding)), labelnames=("route",))
+register_callback(
+    "admission_rejected_total", "Requests turned away by route and reason (rate: 429; overload, timeout: 503).",
+    lambda: {
+        (limiter.name, reason): count
+        for limiter in admission_limiters.values() for reason, count in limiter.rejected.items()
+    },
+    "counter", ("route", "reason"),
+)
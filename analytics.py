@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+import numpy as np
+
+# MT5 deal type / entry codes
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+DEAL_TYPE_BALANCE = 2
+DEAL_ENTRY_IN = 0
+
+SECONDS_PER_DAY = 86400
+
+# One row per deal, in time order
+DEAL_DTYPE = np.dtype([
+    ("time", np.int64),
+    ("type", np.int16),
+    ("entry", np.int16),
+    ("profit", np.float64),
+    ("commission", np.float64),
+    ("swap", np.float64),
+    ("symbol", np.int32),  # index into Deals.symbols
+])
+
+
+@dataclass
+class Deals:
+    rows: np.ndarray  # structured array with DEAL_DTYPE
+    symbols: np.ndarray  # symbol names, indexed by rows["symbol"]
+
+    @property
+    def net(self) -> np.ndarray:
+        return self.rows["profit"] + self.rows["commission"] + self.rows["swap"]
+
+    @property
+    def is_trade(self) -> np.ndarray:
+        # Closing buy/sell deals; opening deals and balance operations carry no trade result
+        kind = self.rows["type"]
+        return ((kind == DEAL_TYPE_BUY) | (kind == DEAL_TYPE_SELL)) & (self.rows["entry"] != DEAL_ENTRY_IN)
+
+
+# Build a Deals array from (time, type, entry, profit, commission, swap, symbol) tuples
+def load_deals(records: Iterable[tuple]) -> Deals:
+    records = records if isinstance(records, list) else list(records)
+    codes: dict[str, int] = {}
+    rows = np.fromiter(
+        ((t, kind, entry, profit, commission, swap, codes.setdefault(symbol, len(codes)))
+         for t, kind, entry, profit, commission, swap, symbol in records),
+        dtype=DEAL_DTYPE,
+        count=len(records),
+    )
+    symbols = np.array(list(codes), dtype=object)
+    order = np.argsort(rows["time"], kind="stable")
+    return Deals(rows=rows[order], symbols=symbols)
+
+
+def equity_curve(net: np.ndarray, starting_balance: float) -> np.ndarray:
+    return starting_balance + np.cumsum(net)
+
+
+# Largest fall from a running peak, and largest fall as a fraction of its peak. The two can
+# come from different points: an early halving of a small peak beats a later 10% slip from a
+# much bigger one in percent, not in money
+def max_drawdown(equity: np.ndarray) -> tuple[float, Optional[float]]:
+    if equity.size == 0:
+        return 0.0, None
+    peak = np.maximum.accumulate(equity)
+    drop = peak - equity
+    positive = peak > 0
+    pct = float((drop[positive] / peak[positive]).max()) if positive.any() else None
+    return float(drop.max()), pct
+
+
+# Running maximum that restarts at each group boundary (groups must be contiguous and sorted)
+def _grouped_running_max(values: np.ndarray, group: np.ndarray) -> np.ndarray:
+    # Lift every group above all earlier ones so a single accumulate can't leak across groups
+    span = float(values.max() - values.min()) + 1.0 if values.size else 1.0
+    offset = group.astype(np.float64) * span
+    return np.maximum.accumulate(values + offset) - offset
+
+
+# Per-day drawdown: for each calendar day (UTC, like equity.day_start), the deepest fall below the higher of that day's
+# opening equity and its intraday peak. Returns (days, absolute, fraction-of-peak) arrays.
+def daily_drawdowns(times: np.ndarray, equity: np.ndarray, opening: np.ndarray):
+    days = times // SECONDS_PER_DAY
+    if days.size == 0:
+        return days, np.zeros(0), np.zeros(0)
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    group = np.cumsum(np.r_[False, days[1:] != days[:-1]])
+    peak = np.maximum(_grouped_running_max(equity, group), opening[starts][group])
+    drop = peak - equity
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(peak > 0, drop / peak, np.nan)
+    return days[starts], np.maximum.reduceat(drop, starts), np.fmax.reduceat(pct, starts)
+
+
+def summarize(deals: Deals, starting_balance: float = 0.0) -> dict:
+    rows = deals.rows
+    net = deals.net
+    equity = equity_curve(net, starting_balance)
+    opening = equity - net
+    trade_net = net[deals.is_trade]
+
+    wins = trade_net[trade_net > 0]
+    losses = trade_net[trade_net < 0]
+    gross_profit = float(wins.sum())
+    gross_loss = float(abs(losses.sum()))
+
+    dd_abs, dd_pct = max_drawdown(np.r_[starting_balance, equity])
+    days, day_dd_abs, day_dd_pct = daily_drawdowns(rows["time"], equity, opening)
+    day_index = np.searchsorted(days, rows["time"] // SECONDS_PER_DAY)
+    day_pnl = np.bincount(day_index, weights=net, minlength=days.size)
+    symbol_pnl = np.bincount(rows["symbol"], weights=net, minlength=deals.symbols.size)
+
+    return {
+        "deals": int(rows.size),
+        "trades": int(trade_net.size),
+        "starting_balance": starting_balance,
+        "net_pnl": float(net.sum()),
+        "final_equity": float(equity[-1]) if equity.size else starting_balance,
+        "win_rate": float(wins.size / trade_net.size) if trade_net.size else None,
+        "profit_factor": gross_profit / gross_loss if gross_loss > 0 else None,
+        "gross_profit": gross_profit,
+        "gross_loss": gross_loss,
+        "max_drawdown": dd_abs,
+        "max_drawdown_pct": dd_pct * 100 if dd_pct is not None else None,
+        "daily": [
+            {
+                "date": np.datetime64(int(day), "D").item().isoformat(),
+                "pnl": float(pnl),
+                "drawdown": float(dd),
+                "drawdown_pct": float(pct) * 100 if not np.isnan(pct) else None,
+            }
+            for day, pnl, dd, pct in zip(days, day_pnl, day_dd_abs, day_dd_pct)
+        ],
+        "symbols": {str(symbol): float(pnl) for symbol, pnl in zip(deals.symbols, symbol_pnl)},
+    }
+
+
+# Drawdown so far today, in percent: the curve starts at today's opening balance, walks
+# today's closed deals and ends at the live equity
+def todays_drawdown_pct(balance: float, equity: float, todays_net: np.ndarray) -> Optional[float]:
+    opening = balance - float(todays_net.sum())
+    curve = np.r_[opening, equity_curve(todays_net, opening), equity]
+    _, pct = max_drawdown(curve)
+    return pct * 100 if pct else None
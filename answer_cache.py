@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+import config
+from metrics import register_callback
+from response_cache import response_cache
+
+
+def knowledge_key(bot_id: str) -> str:
+    return f"knowledge:{bot_id}"
+
+
+class _BotAnswers:
+    """A ring of the bot's most recent answers and the embeddings of their questions."""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.vectors = None  # (size, dim) float32, allocated with the first answer
+        self.answers: list[Optional[dict]] = []
+        self.stored_at: list[float] = []
+        self.next = 0
+
+
+class SemanticCache:
+    """Answers to recent questions, per bot. A question whose embedding has cosine similarity of
+    at least ANSWER_CACHE_THRESHOLD with a cached one gets that answer without a model call.
+
+    Entries are tagged with the version of the bot's knowledge base, kept under
+    "knowledge:{bot_id}" in the response cache's version store, so a change to
+    the bot's documents (in any worker, with a shared backend) retires them.
+    At most ANSWER_CACHE_SIZE answers per bot and ANSWER_CACHE_BOTS bots, least
+    recently used first.
+    """
+
+    def __init__(self):
+        self._bots: OrderedDict[str, _BotAnswers] = OrderedDict()
+        self.counts = {"hit": 0, "miss": 0}
+
+    def _bot(self, bot_id: str, version: int) -> _BotAnswers:
+        answers = self._bots.get(bot_id)
+        if answers is None or answers.version != version:
+            answers = self._bots[bot_id] = _BotAnswers(version)
+        self._bots.move_to_end(bot_id)
+        while len(self._bots) > config.ANSWER_CACHE_BOTS:
+            self._bots.popitem(last=False)
+        return answers
+
+    # The cached answer to the closest recent question, if close enough
+    def lookup(self, bot_id: str, vector, version: int) -> Optional[dict]:
+        import numpy as np
+
+        answers = self._bots.get(bot_id)
+        best = None
+        if answers is not None and answers.version == version and answers.answers:
+            scores = answers.vectors[:len(answers.answers)] @ np.asarray(vector, dtype=np.float32)
+            expired = np.asarray(answers.stored_at) < time.monotonic() - config.ANSWER_CACHE_TTL
+            scores[expired] = -np.inf
+            row = int(np.argmax(scores))
+            if scores[row] >= config.ANSWER_CACHE_THRESHOLD:
+                best = answers.answers[row]
+                self._bots.move_to_end(bot_id)
+        self.counts["hit" if best is not None else "miss"] += 1
+        return best
+
+    def store(self, bot_id: str, vector, version: int, answer: dict) -> None:
+        import numpy as np
+
+        answers = self._bot(bot_id, version)
+        vector = np.asarray(vector, dtype=np.float32)
+        if answers.vectors is None or answers.vectors.shape[1] != len(vector):
+            answers.vectors = np.zeros((config.ANSWER_CACHE_SIZE, len(vector)), dtype=np.float32)
+            answers.answers, answers.stored_at, answers.next = [], [], 0
+        slot = answers.next
+        answers.vectors[slot] = vector / (np.linalg.norm(vector) or 1.0)
+        if slot == len(answers.answers):
+            answers.answers.append(answer)
+            answers.stored_at.append(time.monotonic())
+        else:
+            answers.answers[slot] = answer
+            answers.stored_at[slot] = time.monotonic()
+        answers.next = (slot + 1) % config.ANSWER_CACHE_SIZE
+
+    def invalidate(self, bot_id: str) -> None:
+        self._bots.pop(bot_id, None)
+
+    def entries(self) -> int:
+        return sum(len(answers.answers) for answers in self._bots.values())
+
+
+answer_cache = SemanticCache()
+
+register_callback(
+    "answer_cache_lookups_total", "Semantic answer cache lookups by outcome.",
+    lambda: {(outcome,): count for outcome, count in answer_cache.counts.items()}, "counter", ("outcome",),
+)
+register_callback(
+    "answer_cache_hit_ratio", "Share of chat questions answered from the semantic cache.",
+    lambda: answer_cache.counts["hit"] / max(1, sum(answer_cache.counts.values())),
+)
+register_callback("answer_cache_entries", "Answers held in the semantic cache.", answer_cache.entries)
+
+
+async def knowledge_version(bot_id: str) -> int:
+    return await response_cache.version(knowledge_key(bot_id))
+
+
+# The bot's documents changed: retire its cached answers here and, through the version, elsewhere
+def knowledge_changed(bot_id: str) -> None:
+    answer_cache.invalidate(bot_id)
+    response_cache.invalidate({knowledge_key(bot_id)})
@@ -1,50 +1,198 @@
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+import asyncio
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 import config
+from cache import TTLCache, MISSING
+from metrics import timer, register_callback
 from db import get_session
 from models.user import User
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context; hashes whose cost differs from BCRYPT_ROUNDS need an update
+# and are rehashed on the next successful login. passlib loads on the first hash, not at
+# cold start (once per process, including password pool worker processes)
+@lru_cache(maxsize=None)
+def password_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=config.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=config.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=config.BCRYPT_ROUNDS,
+    )
 
 # OAuth2PasswordBearer with the correct token URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")  
 
 # Create a password hash
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
 # Verify the password
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
+
+# Verify the password; also returns a new hash when the stored one uses an outdated cost
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return password_context().verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPool:
+    """Runs bcrypt on a dedicated, size-limited pool and sheds load when it backs up."""
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                # bcrypt releases the GIL, so threads hash in parallel
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": str(config.PASSWORD_POOL_RETRY_AFTER)},
+            )
+        self.in_flight += 1
+        try:
+            # Includes time queued behind other hashes, which is what callers wait for
+            with timer("bcrypt"):
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = PasswordPool(config.PASSWORD_POOL_KIND, config.PASSWORD_POOL_WORKERS, config.PASSWORD_POOL_MAX_QUEUE)
+
+# Authenticated users by id (the token's "sub"); None entries are cached misses
+user_cache = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+register_callback("password_pool_in_flight", "bcrypt jobs running or queued.", lambda: password_pool.in_flight)
+register_callback("password_pool_rejected_total", "bcrypt jobs shed with 503.", lambda: password_pool.rejected, "counter")
+register_callback("user_cache_entries", "Users held in the auth cache.", lambda: len(user_cache))
+register_callback("user_cache_hits_total", "Auth cache hits.", lambda: user_cache.hits, "counter")
+register_callback("user_cache_misses_total", "Auth cache misses.", lambda: user_cache.misses, "counter")
+
+# Fields copied into the token's "usr" claim when AUTH_TRUST_TOKEN_CLAIMS is on
+TOKEN_USER_FIELDS = ("username", "email", "name", "country", "phone_no", "address")
+
+# Drop cached copies whenever a user row changes, whatever code path changed it. The change is
+# noted at flush and the cache entry dropped once it commits: dropped at flush, a concurrent
+# request could cache the old row again before the commit made the new one visible
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User) -> None:
+    session = object_session(target)
+    if session is None:
+        user_cache.invalidate(target.id)
+        return
+    session.info.setdefault("user_cache_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_cached_users(session: Session) -> None:
+    for user_id in session.info.pop("user_cache_ids", ()):
+        user_cache.invalidate(user_id)
 
-# Create a new JWT token
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session: Session, previous_transaction) -> None:
+    session.info.pop("user_cache_ids", None)
+
+# Claims identifying a user in an access token
+def user_token_claims(user: User) -> dict:
+    claims = {"sub": str(user.id)}
+    if config.AUTH_TRUST_TOKEN_CLAIMS:
+        claims["usr"] = {field: getattr(user, field) for field in TOKEN_USER_FIELDS}
+    return claims
+
+# Create a new JWT token (python-jose and its crypto backend load on first use, not at cold start)
 def create_access_token(data: dict) -> str:
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, config.JWT_SECRET_KEY, algorithm=config.ALGORITHM)
     return encoded_jwt
 
-# Decode and verify JWT token
-def decode_token(token: str) -> str:
+# Decode and verify JWT token, returning its full payload
+def decode_payload(token: str) -> dict:
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, config.JWT_SECRET_KEY, algorithms=[config.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
 
-# Get the current logged-in user
-def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
-    user_id = decode_token(token)
-    user = session.exec(select(User).where(User.id == user_id)).first()
-    if user is None:
+# Decode and verify JWT token
+def decode_token(token: str) -> str:
+    return decode_payload(token)["sub"]
+
+def _user_id(payload: dict) -> int:
+    try:
+        return int(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        # A validly signed token can still carry a "sub" that isn't an id (a list, an object, ...)
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def _load_user(user_id: int, session: AsyncSession) -> User:
+    cached = user_cache.get(user_id)
+    if cached is MISSING:
+        user = (await session.exec(select(User).where(User.id == user_id))).first()
+        cached = user.model_dump() if user is not None else None
+        user_cache.set(user_id, cached, ttl=None if user is not None else config.USER_CACHE_NEGATIVE_TTL)
+    if cached is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
\ No newline at end of file
+    # A fresh instance per request so callers can't mutate the cached copy
+    return User(**cached)
+
+# Get the current logged-in user
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> User:
+    return await _load_user(_user_id(decode_payload(token)), session)
+
+# Like get_current_user, but for read-only routes: with AUTH_TRUST_TOKEN_CLAIMS the
+# user is built from the signed token claims and the database is not touched at all
+async def get_token_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> User:
+    payload = decode_payload(token)
+    user_id = _user_id(payload)
+    claims = payload.get("usr")
+    if config.AUTH_TRUST_TOKEN_CLAIMS and isinstance(claims, dict):
+        return User(id=user_id, hashed_password="", **{field: claims.get(field) for field in TOKEN_USER_FIELDS})
+    return await _load_user(user_id, session)
\ No newline at end of file
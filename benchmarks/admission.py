@@ -0,0 +1,69 @@
+"""Cheap-route latency under an overload of signups, logins and MT5 calls, with and without admission control.
+
+    python -m benchmarks.admission --concurrency 64 --duration 20
+    python -m benchmarks.admission --mix "login=3,me=5,list_orders=2" --bcrypt-rounds 13
+
+Runs the benchmarks.load harness (uvicorn, fake SMTP, fake MT5) once with
+ADMISSION_ENABLED=false and once with it on. Per-client rate limits stay off,
+since every simulated client shares one address, so what is measured is the
+per-route concurrency limits and the adaptive shedding. Prints p50/p99 per
+operation for both runs; requests turned away with 429/503 are counted as
+shed, not in the latencies.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load import FakeSMTP, drive, parse_mix, start_server, summarize, wait_ready  # noqa: E402
+
+DEFAULT_MIX = "signup=4,login=16,account_details=10,me=40,list_orders=30"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--bcrypt-rounds", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    args.requests = None
+    args.database_url = None
+    return args
+
+
+def run(args, mix: dict, enabled: bool) -> dict:
+    os.environ["ADMISSION_ENABLED"] = "true" if enabled else "false"
+    workdir = tempfile.mkdtemp(prefix="admission-")
+    with FakeSMTP() as smtp:
+        server, base_url, _ = start_server(args, smtp.port, workdir)
+        try:
+            asyncio.run(wait_ready(base_url, server))
+            results, elapsed = asyncio.run(drive(base_url, args, mix))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return summarize(results, elapsed)
+
+
+def main():
+    args = parse_args()
+    mix = parse_mix(args.mix)
+    reports = {"off": run(args, mix, False), "on": run(args, mix, True)}
+    print(f"{'op':<16} {'admission':<9} {'count':>7} {'shed':>6} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for op in list(mix) + ["total"]:
+        for mode, report in reports.items():
+            s = report["total"] if op == "total" else report["ops"][op]
+            print(f"{op:<16} {mode:<9} {s['count']:>7} {s['shed']:>6} {s['throughput']:>8.1f}"
+                  f" {s['p50_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Time analytics.summarize on a synthetic deal history against the equivalent Python loop.
+
+    python -m benchmarks.analytics_1m --deals 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import DEAL_DTYPE, Deals, load_deals, summarize  # noqa: E402
+
+SYMBOLS = np.array(["EURUSD", "GBPUSD", "XAUUSD", "US30", "BTCUSD", "USDJPY", "NAS100", "ETHUSD"])
+
+
+def synthetic_deals(count: int, seed: int = 7) -> Deals:
+    rng = np.random.default_rng(seed)
+    rows = np.empty(count, dtype=DEAL_DTYPE)
+    rows["time"] = 1_600_000_000 + np.cumsum(rng.integers(1, 300, count))
+    rows["type"] = rng.integers(0, 2, count)
+    rows["entry"] = 1
+    rows["profit"] = np.round(rng.normal(0.5, 40.0, count), 2)
+    rows["commission"] = -0.35
+    rows["swap"] = 0.0
+    rows["symbol"] = rng.integers(0, SYMBOLS.size, count)
+    return Deals(rows=rows, symbols=SYMBOLS)
+
+
+# The same metrics the way routes/meta.py used to compute things: one Python loop per deal
+def python_summary(records: list, starting_balance: float) -> dict:
+    equity = peak = starting_balance
+    max_dd = 0.0
+    wins = trades = 0
+    gross_profit = gross_loss = 0.0
+    by_symbol = defaultdict(float)
+    by_day = defaultdict(float)
+    day_peak = {}
+    day_dd = defaultdict(float)
+    for t, kind, entry, profit, commission, swap, symbol in records:
+        net = profit + commission + swap
+        day = t // 86400
+        day_peak.setdefault(day, equity)
+        equity += net
+        peak = max(peak, equity)
+        max_dd = max(max_dd, peak - equity)
+        day_peak[day] = max(day_peak[day], equity)
+        day_dd[day] = max(day_dd[day], day_peak[day] - equity)
+        by_symbol[symbol] += net
+        by_day[day] += net
+        if kind in (0, 1) and entry != 0:
+            trades += 1
+            if net > 0:
+                wins += 1
+                gross_profit += net
+            elif net < 0:
+                gross_loss -= net
+    return {"max_drawdown": max_dd, "win_rate": wins / trades, "final_equity": equity}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deals", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    deals = synthetic_deals(args.deals)
+    records = [
+        (int(r["time"]), int(r["type"]), int(r["entry"]), float(r["profit"]), float(r["commission"]),
+         float(r["swap"]), str(SYMBOLS[r["symbol"]]))
+        for r in deals.rows
+    ]
+
+    loaded, load_s = timed(load_deals, records)
+    fast, fast_s = timed(summarize, deals, 100_000.0)
+    slow, slow_s = timed(python_summary, records, 100_000.0)
+
+    assert abs(fast["max_drawdown"] - slow["max_drawdown"]) < 1e-6 * max(1.0, slow["max_drawdown"])
+    assert abs(fast["final_equity"] - slow["final_equity"]) < 1e-3
+    print(f"deals: {args.deals:,}  days: {len(fast['daily']):,}")
+    print(f"load_deals (tuples -> arrays): {load_s * 1000:8.1f} ms")
+    print(f"summarize (NumPy):             {fast_s * 1000:8.1f} ms")
+    print(f"python loop:                   {slow_s * 1000:8.1f} ms  ({slow_s / fast_s:.1f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
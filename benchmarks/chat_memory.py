@@ -0,0 +1,112 @@
+"""Prompt size and latency of /chat over a long conversation.
+
+    python -m benchmarks.chat_memory --turns 500 --report-every 50
+
+Ingests a small knowledge base for one bot, then asks it --turns questions
+in a single conversation through the app (fake model, temporary SQLite
+database). Every --report-every turns it prints the median request latency
+and prompt size of that stretch, next to the size the full transcript would
+have reached by then, plus the summaries written so far.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOPICS = ("payouts", "drawdown", "news trading", "lot sizes", "weekend holding", "refunds", "scaling plans")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--report-every", type=int, default=50)
+    return parser.parse_args()
+
+
+def knowledge_base() -> bytes:
+    lines = [
+        f"Section {i}: the rules for {topic} apply to every challenge account. "
+        f"Rule {i} explains limits, deadlines and exceptions for {topic} in detail."
+        for i, topic in enumerate(TOPICS * 30)
+    ]
+    return "\n\n".join(lines).encode()
+
+
+async def ask(client, headers: dict, question: str) -> tuple[float, int, str]:
+    start = time.perf_counter()
+    done, answer = None, ""
+    async with client.stream("POST", "/chat/bench-bot", json={"question": question}, headers=headers) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[7:]
+            elif line.startswith("data:") and event == "token":
+                answer += json.loads(line[6:])["text"]
+            elif line.startswith("data:") and event == "done":
+                done = json.loads(line[6:])
+    return time.perf_counter() - start, done.get("prompt_tokens", 0), answer
+
+
+async def main_async(args) -> None:
+    import httpx
+    import db
+    import migrate  # noqa: F401
+    from auth import create_access_token
+    from conversation import conversation_summarizer, estimate_tokens
+    from hello import app
+    from ingest import ingestion_worker
+    from models.user import User
+
+    await db.create_db_and_tables()
+    async with db.async_session() as session:
+        user = User(username="bench", email="bench@example.com", hashed_password="x", name="Bench",
+                    phone_no="0", country="PK", address="-")
+        session.add(user)
+        await session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+    ingestion_worker.start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await client.post("/bots/bench-bot/documents", files=[("files", ("rules.txt", knowledge_base(), "text/plain"))])
+        await ingestion_worker.join()
+        transcript = 0
+        latencies, prompts = [], []
+        for turn in range(1, args.turns + 1):
+            question = f"Question {turn}: what are the rules for {TOPICS[turn % len(TOPICS)]} in case {turn}?"
+            elapsed, prompt_tokens, answer = await ask(client, headers, question)
+            latencies.append(elapsed)
+            prompts.append(prompt_tokens)
+            transcript += estimate_tokens(question) + estimate_tokens(answer)
+            if turn % args.report_every == 0:
+                await conversation_summarizer.join()
+                print(
+                    f"turns {turn - args.report_every + 1:>4}-{turn:<4}  p50 {statistics.median(latencies) * 1000:6.1f} ms"
+                    f"  prompt {statistics.median(prompts):6.0f} tokens (max {max(prompts)})"
+                    f"  full transcript ~{transcript:>6} tokens  summaries {conversation_summarizer.summarized}"
+                )
+                latencies, prompts = [], []
+    await ingestion_worker.stop()
+    await db.engine.dispose()
+
+
+def main():
+    args = parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "chat.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["VECTOR_INDEX_DIR"] = os.path.join(os.path.dirname(path), "vectors")
+    os.environ["BLOB_DIR"] = os.path.join(os.path.dirname(path), "blobs")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("MAIL_SENDER_ENABLED", "false")
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Cold-start budget: import time of hello.py and time to the first response.
+
+    python -m benchmarks.cold_start --runs 5 --app-import-budget-ms 500 --first-response-budget-ms 2500
+
+Each run is a fresh interpreter, as on a serverless scale-up. The import is
+measured with `python -X importtime -c "import hello"`; time to first response
+is wall time from process launch until GET / has been answered in-process.
+
+Most of the import is the framework itself (fastapi, pydantic, sqlalchemy,
+sqlmodel), which this app cannot defer and which scales with the machine. The
+gating budget is therefore the app's own share: hello's import minus the
+framework floor, measured in its own fresh interpreter on the same machine.
+Pass --import-budget-ms to also budget the whole import on a known target
+runtime. The script exits non-zero when a median exceeds its budget or when a
+module that should load lazily (pandas, numpy, MetaTrader5, ...) is imported
+at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Only ever needed by a few endpoints; none of them may load with the app
+LAZY_MODULES = ("pandas", "numpy", "fastapi_mail", "MetaTrader5", "openpyxl", "boto3", "PIL", "analytics", "vector_index", "bs4", "pypdf", "langchain_google_genai", "psutil")
+
+# What any FastAPI + SQLModel app pays before its own code runs
+FRAMEWORK_MODULES = ("fastapi", "pydantic", "sqlalchemy.ext.asyncio", "sqlmodel.ext.asyncio.session")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app-import-budget-ms", type=float, default=500,
+                        help="budget for hello's import above the framework floor")
+    parser.add_argument("--import-budget-ms", type=float, default=None,
+                        help="budget for the whole import, for a known target runtime")
+    parser.add_argument("--first-response-budget-ms", type=float, default=2500)
+    parser.add_argument("--top", type=int, default=10, help="show the slowest N modules imported by hello")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+# Runs inside the fresh interpreter: import the app and serve one request without a network hop
+def child() -> None:
+    import asyncio
+    import httpx
+
+    start = time.perf_counter()
+    import hello
+
+    imported = time.perf_counter()
+
+    async def first_response():
+        transport = httpx.ASGITransport(app=hello.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.get("/")).raise_for_status()
+
+    asyncio.run(first_response())
+    print(json.dumps({
+        "import_s": imported - start,
+        "lazy_loaded": [name for name in LAZY_MODULES if name in sys.modules],
+    }))
+
+
+# Parse `-X importtime` output into {module: cumulative seconds}, the top-level imports and their direct imports
+def parse_importtime(stderr: str) -> tuple[dict[str, float], list[str], list[str]]:
+    cumulative, top, direct = {}, [], []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part for part in line.replace("import time:", "|").split("|")]
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        cumulative[name] = int(cumulative_us) / 1e6
+        if depth == 0:
+            top.append(name)
+        elif depth == 1:
+            direct.append(name)
+    return cumulative, top, direct
+
+
+def traced_import(statement: str, env: dict) -> tuple[dict[str, float], list[str], list[str]]:
+    traced = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return parse_importtime(traced.stderr)
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    env.setdefault("JWT_SECRET_KEY", "bench")
+    env.setdefault("MAIL_SENDER_ENABLED", "false")
+
+    import_times, floors, first_responses, lazy_loaded = [], [], [], set()
+    cumulative, direct = {}, []
+    for _ in range(args.runs):
+        cumulative, _, direct = traced_import("import hello", env)
+        import_times.append(cumulative["hello"])
+        floor, top, _ = traced_import(f"import {', '.join(FRAMEWORK_MODULES)}", env)
+        floors.append(sum(floor[name] for name in top))
+
+        start = time.perf_counter()
+        served = subprocess.run([sys.executable, "-m", "benchmarks.cold_start", "--child"],
+                                env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+        first_responses.append(time.perf_counter() - start)
+        lazy_loaded.update(json.loads(served.stdout.strip().splitlines()[-1])["lazy_loaded"])
+
+    import_ms = statistics.median(import_times) * 1000
+    floor_ms = statistics.median(floors) * 1000
+    app_ms = import_ms - floor_ms
+    first_ms = statistics.median(first_responses) * 1000
+    whole_budget = "none" if args.import_budget_ms is None else f"{args.import_budget_ms:.0f} ms"
+    print(f"import hello (importtime): median {import_ms:7.1f} ms  budget {whole_budget}")
+    print(f"framework floor:           median {floor_ms:7.1f} ms")
+    print(f"app share above the floor:        {app_ms:7.1f} ms  budget {args.app_import_budget_ms:.0f} ms")
+    print(f"first response (process): median {first_ms:7.1f} ms  budget {args.first_response_budget_ms:.0f} ms")
+    print("slowest imports under hello (last run):")
+    for name in sorted(direct, key=cumulative.get, reverse=True)[:args.top]:
+        print(f"  {cumulative[name] * 1000:7.1f} ms  {name}")
+
+    failures = []
+    if app_ms > args.app_import_budget_ms:
+        failures.append(f"app import time {app_ms:.0f} ms above the framework floor is over budget")
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        failures.append(f"import time {import_ms:.0f} ms is over budget")
+    if first_ms > args.first_response_budget_ms:
+        failures.append(f"time to first response {first_ms:.0f} ms is over budget")
+    if lazy_loaded:
+        failures.append(f"loaded at startup but should be lazy: {', '.join(sorted(lazy_loaded))}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Compare order reads through the old sync Session against the shared AsyncSession.
+
+    python -m benchmarks.db_throughput --requests 2000 --concurrency 50
+    python -m benchmarks.db_throughput --database-url postgresql://user:pw@localhost/bench --latency-ms 20
+
+The "sync" variant reproduces the old routes: a blocking Session inside an
+``async def`` handler. The "async" variant goes through db.get_session.
+--latency-ms puts a TCP proxy in front of Postgres that delays every packet,
+which is what a hosted database looks like from the app.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy.engine import make_url
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added round-trip latency (Postgres only)")
+    return parser.parse_args()
+
+
+# Forward TCP traffic to the real database, delaying each chunk by half the round trip
+def start_latency_proxy(upstream_host: str, upstream_port: int, latency_ms: float) -> int:
+    delay = latency_ms / 2000
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    port = []
+
+    async def pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                loop.call_later(delay, writer.write, data)
+        finally:
+            loop.call_later(delay, writer.close)
+
+    async def handle(client_reader, client_writer):
+        if upstream_host.startswith("/"):
+            server_reader, server_writer = await asyncio.open_unix_connection(f"{upstream_host}/.s.PGSQL.{upstream_port}")
+        else:
+            server_reader, server_writer = await asyncio.open_connection(upstream_host, upstream_port)
+        await asyncio.gather(pipe(client_reader, server_writer), pipe(server_reader, client_writer))
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return port[0]
+
+
+def proxied_url(database_url: str, latency_ms: float) -> str:
+    url = make_url(database_url)
+    host = url.query.get("host") or url.host or "localhost"
+    port = start_latency_proxy(host, url.port or 5432, latency_ms)
+    query = {k: v for k, v in url.query.items() if k != "host"}
+    return url.set(host="127.0.0.1", port=port, query=query).render_as_string(hide_password=False)
+
+
+async def drive(app, requests: int, concurrency: int, rows: int) -> float:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i % rows + 1)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                order_id = queue.get_nowait()
+                response = await client.get(f"/order/{order_id}")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    if args.latency_ms and database_url.startswith("postgres"):
+        database_url = proxied_url(database_url, args.latency_ms)
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+
+    from fastapi import Depends, FastAPI
+    from sqlmodel import Session, SQLModel, create_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+    import db
+    from models.order import OrderModel
+
+    sync_engine = create_engine(database_url)
+    SQLModel.metadata.drop_all(sync_engine)
+    SQLModel.metadata.create_all(sync_engine)
+    with Session(sync_engine) as session:
+        for i in range(args.rows):
+            session.add(OrderModel(
+                username=f"user{i}", email=f"user{i}@example.com", challenge_type="phase-1",
+                account_size="10000", platform="mt5", payment_method="usdt", txid=f"tx{i}",
+                img_blob="0" * 64, img_size=0, img_content_type="image/png",
+            ))
+        session.commit()
+
+    sync_app = FastAPI()
+
+    @sync_app.get("/order/{order_id}")
+    async def sync_get_order(order_id: int):
+        with Session(sync_engine) as session:
+            return {"username": session.get(OrderModel, order_id).username}
+
+    async_app = FastAPI()
+
+    @async_app.get("/order/{order_id}")
+    async def async_get_order(order_id: int, session: AsyncSession = Depends(db.get_session)):
+        return {"username": (await session.get(OrderModel, order_id)).username}
+
+    for name, app in (("sync", sync_app), ("async", async_app)):
+        elapsed = asyncio.run(drive(app, args.requests, args.concurrency, args.rows))
+        print(f"{name:>5}: {args.requests / elapsed:8.1f} req/s  ({args.requests} requests, concurrency {args.concurrency}, +{args.latency_ms:g} ms)")
+
+
+if __name__ == "__main__":
+    main()
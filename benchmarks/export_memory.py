@@ -0,0 +1,151 @@
+"""Peak memory of the order export against row count, on a local SQLite stand-in.
+
+    python -m benchmarks.export_memory --rows 10000 100000 1000000 --mode csv xlsx load-all
+
+Every (mode, rows) pair runs in a fresh child process, which reports its RSS
+before the export and its peak RSS (ru_maxrss) afterwards. "csv" and "xlsx"
+go through GET /order/orders/export. "load-all" is the pattern the export
+replaces: read every OrderModel into memory, then write the CSV.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("csv", "xlsx", "load-all")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--mode", choices=MODES, nargs="+", default=list(MODES))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "ROWS"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Fill the orders table with synthetic rows (plain sqlite3 for speed)
+def seed(path: str, rows: int) -> None:
+    import db
+    import models.order  # noqa: F401
+
+    asyncio.run(db.create_db_and_tables())
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO ordermodel (username, email, challenge_type, account_size, platform, payment_method, txid,"
+        " img_blob, img_size, img_content_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (f"trader{i}", f"trader{i}@example.com", "two-step", "100k", ("mt5", "ctrader")[i % 2], "usdt",
+             f"{i:064x}", f"{i:064x}", 48_213, "image/png", (start + timedelta(seconds=i)).isoformat(" "))
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+# Drive the ASGI app directly and drop each body chunk as it arrives; httpx's
+# ASGITransport would buffer the whole response and hide the streaming
+async def export(mode: str) -> int:
+    from fastapi import FastAPI
+    from routes.order import order_router
+
+    app = FastAPI()
+    app.include_router(order_router)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/order/orders/export", "raw_path": b"/order/orders/export", "root_path": "",
+        "query_string": f"format={mode}".encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    size = 0
+    status = None
+    done = asyncio.Event()
+
+    async def receive():
+        if not done.is_set():
+            done.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal size, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    assert status == 200, status
+    return size
+
+
+async def load_all() -> int:
+    from sqlmodel import select
+    from db import async_session
+    from models.order import OrderModel
+
+    async with async_session() as session:
+        orders = (await session.exec(select(OrderModel))).all()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for order in orders:
+        writer.writerow(order.model_dump().values())
+    return len(buffer.getvalue().encode())
+
+
+def child(mode: str) -> None:
+    import routes.order  # noqa: F401  (import cost is not part of the measurement)
+
+    before = rss_mb()
+    start = time.perf_counter()
+    size = asyncio.run(load_all() if mode == "load-all" else export(mode))
+    elapsed = time.perf_counter() - start
+    print(f"{before:.1f} {peak_rss_mb():.1f} {size} {elapsed:.2f}")
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(args.child[0])
+        return
+
+    print(f"{'mode':<9} {'rows':>10} {'rss before':>11} {'peak':>9} {'growth':>9} {'output':>10} {'time':>8}")
+    for rows in args.rows:
+        path = os.path.join(tempfile.mkdtemp(), "export.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+        env.setdefault("JWT_SECRET_KEY", "bench")
+        env.setdefault("MAIL_SENDER_ENABLED", "false")
+        subprocess.run([sys.executable, "-c", f"from benchmarks.export_memory import seed; seed({path!r}, {rows})"],
+                       env=env, cwd=ROOT, check=True)
+        for mode in args.mode:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.export_memory", "--child", mode, str(rows)],
+                                 env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+            before, peak, size, elapsed = out.stdout.split()
+            growth = float(peak) - float(before)
+            print(f"{mode:<9} {rows:>10,} {float(before):>8.1f} MB {float(peak):>6.1f} MB {growth:>6.1f} MB"
+                  f" {int(size) / 2**20:>7.1f} MB {float(elapsed):>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
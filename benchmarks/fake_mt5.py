@@ -0,0 +1,100 @@
+"""A MetaTrader5 stand-in for tests and benchmarks on machines without a terminal.
+
+Select it with MT5_MODULE=benchmarks.fake_mt5. Like the real module it keeps
+process-global state, so it behaves the same way inside the worker pool.
+Every account gets a deterministic deal history of FAKE_MT5_DEALS deals
+spread over the past FAKE_MT5_DAYS days. FAKE_MT5_LATENCY_MS adds a delay
+to each call, and the password "wrong" always fails to log in.
+"""
+import math
+import os
+import random
+import time
+from collections import namedtuple
+from datetime import datetime
+
+AccountInfo = namedtuple(
+    "AccountInfo", "login balance equity margin margin_free currency leverage name server"
+)
+TradeDeal = namedtuple(
+    "TradeDeal", "ticket order time time_msc type entry magic position_id volume price commission swap profit fee symbol comment"
+)
+
+DEALS = int(os.environ.get("FAKE_MT5_DEALS", "500"))
+DAYS = int(os.environ.get("FAKE_MT5_DAYS", "90"))
+LATENCY = float(os.environ.get("FAKE_MT5_LATENCY_MS", "0")) / 1000
+SYMBOLS = ("EURUSD", "GBPUSD", "XAUUSD", "US30", "BTCUSD")
+
+_state = {"initialized": False, "account": None, "server": None, "error": (1, "Success")}
+_histories: dict[int, list] = {}
+
+
+def _delay():
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+def _history(account: int) -> list:
+    if account not in _histories:
+        rng = random.Random(account)
+        end = int(time.time())
+        start = end - DAYS * 86400
+        times = sorted(rng.randint(start, end) for _ in range(DEALS))
+        _histories[account] = [
+            TradeDeal(
+                ticket=account * 10_000_000 + i + 1, order=i + 1, time=t, time_msc=t * 1000,
+                type=rng.randint(0, 1), entry=1, magic=0, position_id=i + 1,
+                volume=round(rng.choice((0.01, 0.1, 0.5, 1.0)), 2),
+                price=round(rng.uniform(1, 2000), 5), commission=0.0, swap=0.0,
+                profit=round(rng.gauss(5, 120), 2), fee=0.0, symbol=rng.choice(SYMBOLS), comment="",
+            )
+            for i, t in enumerate(times)
+        ]
+    return _histories[account]
+
+
+def initialize(path=None, **kwargs) -> bool:
+    _delay()
+    _state["initialized"] = True
+    return True
+
+
+def login(login, password=None, server=None, timeout=None) -> bool:
+    _delay()
+    if not _state["initialized"] or password == "wrong":
+        _state["error"] = (-6, "Terminal: Authorization failed")
+        return False
+    _state["account"], _state["server"] = login, server
+    return True
+
+
+def shutdown() -> None:
+    _state.update(initialized=False, account=None, server=None)
+
+
+def last_error():
+    return _state["error"]
+
+
+def account_info():
+    _delay()
+    account = _state["account"]
+    if account is None:
+        return None
+    profit = sum(deal.profit for deal in _history(account))
+    balance = round(10_000 + profit, 2)
+    return AccountInfo(
+        # Floating P&L drifts slowly with the clock, so equity snapshots have some shape
+        login=account, balance=balance, equity=round(balance + 50 * math.sin(time.time() / 600 + account), 2), margin=0.0,
+        margin_free=balance, currency="USD", leverage=100, name=f"Trader {account}", server=_state["server"],
+    )
+
+
+def history_deals_get(date_from, date_to, **kwargs):
+    _delay()
+    account = _state["account"]
+    if account is None:
+        return None
+    start = date_from.timestamp() if isinstance(date_from, datetime) else date_from
+    end = date_to.timestamp() if isinstance(date_to, datetime) else date_to
+    return tuple(deal for deal in _history(account) if start <= deal.time <= end)
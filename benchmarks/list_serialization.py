@@ -0,0 +1,156 @@
+"""Serialization cost of large list responses: the default path against JSON_FAST_PATH.
+
+    python -m benchmarks.list_serialization --rows 10000 100000 --repeat 5
+
+Seeds a temporary SQLite database with the largest row count, then requests
+one page of each size (PAGE_MAX_LIMIT is raised to match) from /auth/users,
+/order/orders and /order/completed_orders, as JSON and as NDJSON:
+
+  pydantic  users only: ORM objects validated through List[UserResponse] and
+            encoded by FastAPI, i.e. what a response_model list costs
+  default   row tuples -> format_row dicts -> jsonable_encoder -> json
+  fast      row tuples -> per-selection serializer -> orjson (json without it)
+
+Prints the median time per request and checks that default and fast return the
+same documents.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ("/auth/users", "/order/orders", "/order/completed_orders")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args()
+
+
+def seed(path: str, rows: int) -> None:
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO user (username, email, hashed_password, name, phone_no, country, address, created_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((f"trader{i}", f"trader{i}@example.com", "x", f"Trader {i}", "+920000000", "PK", f"{i} Main Street",
+          (start + timedelta(seconds=i)).isoformat(" ")) for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO ordermodel (username, email, challenge_type, account_size, platform, payment_method, txid,"
+        " img_blob, img_size, img_content_type, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((f"trader{i}", f"trader{i}@example.com", "two-step", "100k", "mt5", "usdt", f"{i:064x}", f"{i:064x}",
+          48_213, "image/png", (start + timedelta(seconds=i)).isoformat(" ")) for i in range(rows)),
+    )
+    conn.executemany(
+        "INSERT INTO completeordermodel (order_id, server, platform_login, platform_password) VALUES (?, ?, ?, ?)",
+        ((i + 1, "Broker-Live", str(5_000_000 + i), "secret") for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def pydantic_app():
+    from typing import List
+    from fastapi import FastAPI
+    from sqlmodel import select
+    from db import async_session
+    from models.user import User
+    from schemas.user import UserResponse
+
+    app = FastAPI()
+
+    @app.get("/auth/users", response_model=List[UserResponse])
+    async def users(limit: int):
+        async with async_session() as session:
+            return (await session.exec(select(User).order_by(User.id).limit(limit))).all()
+
+    return app
+
+
+def app_under_test():
+    from fastapi import FastAPI
+    from routes.auth import auth_router
+    from routes.order import order_router
+
+    app = FastAPI()
+    app.include_router(auth_router)
+    app.include_router(order_router)
+    return app
+
+
+async def timed(client, url: str, repeat: int) -> tuple[float, bytes]:
+    times = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url)
+        times.append(time.perf_counter() - start)
+        response.raise_for_status()
+        body = response.content
+    return statistics.median(times), body
+
+
+def documents(body: bytes, format: str) -> list:
+    if format == "ndjson":
+        return [json.loads(line) for line in body.splitlines()]
+    return json.loads(body)
+
+
+async def run(rows: int, repeat: int) -> None:
+    import httpx
+    import config
+
+    apps = {"pydantic": pydantic_app(), "default": app_under_test(), "fast": app_under_test()}
+    for format in ("json", "ndjson"):
+        for path in ENDPOINTS:
+            url = f"{path}?limit={rows}&format={format}"
+            results = {}
+            for mode, app in apps.items():
+                if mode == "pydantic" and (path != "/auth/users" or format != "json"):
+                    continue
+                config.JSON_FAST_PATH = mode == "fast"
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                    results[mode] = await timed(client, url, repeat)
+            assert documents(results["default"][1], format) == documents(results["fast"][1], format), path
+            base = results["default"][0]
+            line = "  ".join(
+                f"{mode} {elapsed * 1000:7.0f} ms ({base / elapsed:4.1f}x)" for mode, (elapsed, _) in results.items()
+            )
+            print(f"{rows:>8,} {format:<6} {path:<24} {line}")
+
+
+async def main_async(args) -> None:
+    import db
+    import models.user  # noqa: F401
+    import models.order  # noqa: F401
+
+    await db.create_db_and_tables()
+    seed(args.path, max(args.rows))
+    for rows in args.rows:
+        await run(rows, args.repeat)
+    await db.engine.dispose()
+
+
+def main():
+    args = parse_args()
+    args.path = os.path.join(tempfile.mkdtemp(), "lists.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.path}"
+    os.environ["PAGE_MAX_LIMIT"] = str(max(args.rows))
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("MAIL_SENDER_ENABLED", "false")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""Load test the whole app against local stand-ins and save the results as JSON.
+
+    python -m benchmarks.load --mix mixed --concurrency 20 --duration 30 --output load.json
+    python -m benchmarks.load --mix "login=1,me=9" --requests 2000
+    python -m benchmarks.load --database-url postgresql://postgres:@/postgres?host=/tmp/pg
+    python -m benchmarks.load --baseline main.json --max-regression 0.2
+
+Boots `uvicorn hello:app` in a subprocess with these stand-ins:
+- SQLite in a temp dir, or --database-url; the schema comes from migrate.py.
+- A fake SMTP server (aiosmtpd) that accepts and counts every message.
+- benchmarks.fake_mt5 in place of MetaTrader5.
+
+It signs up a pool of users, seeds some orders, then drives a weighted mix of
+requests from --concurrency clients. It reports throughput and p50/p95/p99
+per operation, plus the peak RSS of the server and its MT5 workers. With
+--baseline, it exits non-zero when p95 or throughput regresses by more than
+--max-regression against an earlier run's JSON.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.login_latency import percentile  # noqa: E402
+
+MIXES = {
+    "mixed": {"signup": 2, "login": 8, "me": 30, "create_order": 10, "list_orders": 30, "account_details": 10},
+    "auth": {"signup": 1, "login": 4, "me": 15},
+    "orders": {"create_order": 1, "list_orders": 3},
+    "meta": {"account_details": 1},
+}
+PASSWORD = "load-test-password"
+# A payment screenshot-sized upload
+IMAGE = b"\x89PNG\r\n\x1a\n" + random.Random(0).randbytes(48 * 1024)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mix", default="mixed", help=f"{', '.join(MIXES)} or op=weight,... pairs")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--users", type=int, default=20, help="users signed up before the run")
+    parser.add_argument("--orders", type=int, default=200, help="orders created before the run")
+    parser.add_argument("--accounts", type=int, default=10, help="distinct MT5 accounts for account_details")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS for the server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results here as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    return parser.parse_args()
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    if spec in MIXES:
+        return MIXES[spec]
+    mix = {}
+    for pair in spec.split(","):
+        op, _, weight = pair.partition("=")
+        if op.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation {op!r}; choose from {', '.join(OPERATIONS)}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeSMTP:
+    """aiosmtpd server on a free local port that accepts and counts messages."""
+
+    def __init__(self):
+        from aiosmtpd.controller import Controller
+
+        self.received = 0
+        self.port = free_port()
+        self.controller = Controller(self, hostname="127.0.0.1", port=self.port)
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+    def __enter__(self):
+        self.controller.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.stop()
+
+
+class RSSMonitor:
+    """Peak resident memory of the server process tree, sampled in the background."""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        try:
+            import psutil
+        except ImportError:
+            # No psutil: the server's own high-water mark, without the MT5 workers
+            with open(f"/proc/{self.pid}/status") as f:
+                return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+        process = psutil.Process(self.pid)
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.peak = max(self.peak, self._sample())
+            except (OSError, StopIteration):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# One simulated client's view of the seeded data
+class State:
+    def __init__(self, rng: random.Random, accounts: int):
+        self.rng = rng
+        self.accounts = accounts
+        self.users: list[tuple[str, str]] = []  # (email, token)
+        self.counter = itertools.count()
+
+
+async def op_signup(client, state: State):
+    n = next(state.counter)
+    return await client.post("/auth/signup", json={
+        "username": f"load{n}", "email": f"load-{os.getpid()}-{n}-{time.time_ns()}@example.com", "password": PASSWORD,
+        "name": "Load Test", "phone_no": "000", "country": "PK", "address": "-",
+    })
+
+
+async def op_login(client, state: State):
+    email, _ = state.rng.choice(state.users)
+    return await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+
+
+async def op_me(client, state: State):
+    _, token = state.rng.choice(state.users)
+    return await client.get("/auth/user/me", headers={"Authorization": f"Bearer {token}"})
+
+
+async def op_create_order(client, state: State):
+    n = next(state.counter)
+    return await client.post("/order/order", data={
+        "username": f"load{n}", "email": f"buyer{n % 100}@example.com", "challenge_type": "two-step",
+        "account_size": "100k", "platform": "mt5", "payment_method": "usdt", "txid": f"tx-{time.time_ns()}-{n}",
+    }, files={"img": ("payment.png", IMAGE, "image/png")})
+
+
+async def op_list_orders(client, state: State):
+    return await client.get("/order/orders", params={"limit": 50, "fields": "id,email,platform,created_at"})
+
+
+async def op_account_details(client, state: State):
+    account = 1000 + state.rng.randrange(state.accounts)
+    return await client.post("/meta/fetch_account_details", data={
+        "account_number": account, "password": "load", "server": "Load-Server", "limit": 50,
+    })
+
+
+OPERATIONS = {
+    "signup": op_signup,
+    "login": op_login,
+    "me": op_me,
+    "create_order": op_create_order,
+    "list_orders": op_list_orders,
+    "account_details": op_account_details,
+}
+
+
+async def setup(client, state: State, users: int, orders: int) -> None:
+    for _ in range(users):
+        response = await op_signup(client, state)
+        response.raise_for_status()
+        email = response.json()["email"]
+        token = (await client.post("/auth/login", data={"username": email, "password": PASSWORD})).json()["access_token"]
+        state.users.append((email, token))
+    for _ in range(orders):
+        (await op_create_order(client, state)).raise_for_status()
+
+
+async def drive(base_url: str, args, mix: dict[str, float]) -> tuple[dict, float]:
+    import httpx
+
+    rng = random.Random(args.seed)
+    state = State(rng, args.accounts)
+    samples = {op: [] for op in mix}
+    errors = {op: 0 for op in mix}
+    shed = {op: 0 for op in mix}
+    ops, weights = list(mix), list(mix.values())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        await setup(client, state, args.users, args.orders)
+        remaining = args.requests
+        deadline = time.perf_counter() + args.duration
+
+        async def worker():
+            nonlocal remaining
+            while True:
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                elif time.perf_counter() >= deadline:
+                    return
+                op = rng.choices(ops, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await OPERATIONS[op](client, state)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = None
+                elapsed = time.perf_counter() - start
+                if status in (429, 503):
+                    shed[op] += 1
+                elif status is None or status >= 400:
+                    errors[op] += 1
+                else:
+                    samples[op].append(elapsed)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return {op: {"samples": samples[op], "errors": errors[op], "shed": shed[op]} for op in mix}, elapsed
+
+
+def summarize(results: dict, elapsed: float) -> dict:
+    def stats(samples: list[float], errors: int, shed: int) -> dict:
+        ms = [s * 1000 for s in samples]
+        return {
+            "count": len(ms), "errors": errors, "shed": shed,
+            "throughput": len(ms) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(ms, 50), "p95_ms": percentile(ms, 95), "p99_ms": percentile(ms, 99),
+        }
+
+    ops = {op: stats(r["samples"], r["errors"], r["shed"]) for op, r in results.items()}
+    everything = [s for r in results.values() for s in r["samples"]]
+    total = stats(everything, sum(r["errors"] for r in results.values()), sum(r["shed"] for r in results.values()))
+    return {"ops": ops, "total": total}
+
+
+def start_server(args, smtp_port: int, workdir: str):
+    env = dict(os.environ)
+    env.update(
+        DATABASE_URL=args.database_url or f"sqlite:///{workdir}/load.db",
+        JWT_SECRET_KEY=env.get("JWT_SECRET_KEY", "load-test"),
+        MT5_MODULE="benchmarks.fake_mt5",
+        SMTP_HOST="127.0.0.1", SMTP_PORT=str(smtp_port), SMTP_STARTTLS="false",
+        SMTP_USERNAME="", SMTP_PASSWORD="", MAIL_FROM="load@example.com",
+        MAIL_SENDER_ENABLED="true", MAIL_POLL_INTERVAL="0.5",
+        BLOB_BACKEND="local", BLOB_DIR=os.path.join(workdir, "blobs"),
+    )
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Every simulated client shares one address, so per-client rate limits would throttle the
+    # whole run; concurrency limits and shedding stay on
+    for route in ("SIGNUP", "LOGIN", "MT5"):
+        env.setdefault(f"ADMISSION_{route}_RATE", "0")
+    subprocess.run([sys.executable, "migrate.py"], env=env, cwd=ROOT, check=True, capture_output=True)
+    port = free_port()
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "hello:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return server, f"http://127.0.0.1:{port}", env["DATABASE_URL"]
+
+
+async def wait_ready(base_url: str, server, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise SystemExit("server exited during startup; see server.log")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise SystemExit("server did not become ready")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+# Compare p95 and throughput per operation; returns the regressions beyond the allowed fraction
+def compare(report: dict, baseline: dict, allowed: float) -> list[str]:
+    regressions = []
+    for op, now in report["ops"].items():
+        before = baseline.get("ops", {}).get(op)
+        if not before or not now["count"] or not before["count"]:
+            continue
+        p95 = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rate = 1 - now["throughput"] / before["throughput"] if before["throughput"] else 0.0
+        print(f"  {op:<16} p95 {before['p95_ms']:8.1f} -> {now['p95_ms']:8.1f} ms ({p95:+.0%})"
+              f"  throughput {before['throughput']:7.1f} -> {now['throughput']:7.1f}/s ({-rate:+.0%})")
+        if p95 > allowed:
+            regressions.append(f"{op} p95 up {p95:.0%}")
+        if rate > allowed:
+            regressions.append(f"{op} throughput down {rate:.0%}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    mix = parse_mix(args.mix)
+    workdir = tempfile.mkdtemp(prefix="load-")
+    with FakeSMTP() as smtp:
+        server, base_url, database_url = start_server(args, smtp.port, workdir)
+        try:
+            asyncio.run(wait_ready(base_url, server))
+            with RSSMonitor(server.pid) as rss:
+                results, elapsed = asyncio.run(drive(base_url, args, mix))
+            time.sleep(1.0)  # let the outbox sender catch up before counting mail
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        emails = smtp.received
+
+    report = {
+        "config": {
+            "mix": mix, "concurrency": args.concurrency, "duration": args.duration, "requests": args.requests,
+            "users": args.users, "orders": args.orders, "accounts": args.accounts,
+            "database": database_url.split(":", 1)[0], "bcrypt_rounds": args.bcrypt_rounds,
+            "commit": git_commit(), "python": platform.python_version(), "cpus": os.cpu_count(),
+        },
+        "elapsed_s": elapsed,
+        **summarize(results, elapsed),
+        "peak_rss_mb": rss.peak / 2**20,
+        "emails_received": emails,
+    }
+
+    print(f"{'op':<16} {'count':>7} {'err':>5} {'shed':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, s in list(report["ops"].items()) + [("total", report["total"])]:
+        print(f"{op:<16} {s['count']:>7} {s['errors']:>5} {s['shed']:>5} {s['throughput']:>8.1f}"
+              f" {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    print(f"elapsed {elapsed:.1f}s  peak RSS {report['peak_rss_mb']:.0f} MB  emails received {emails}")
+    print(f"server log: {workdir}/server.log")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Login latency under a concurrent burst, with and without the bounded bcrypt pool.
+
+    python -m benchmarks.login_latency --logins 200 --concurrency 50
+
+Each configuration fires a burst of logins while a second client polls the
+cheap "/" route, and reports p50/p95/p99 for both plus how many logins were
+shed with 503. "unbounded" approximates the old behaviour, where every login
+took one of starlette's 40 threadpool slots.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONFIGS = {
+    "unbounded": {"PASSWORD_POOL_WORKERS": "40", "PASSWORD_POOL_MAX_QUEUE": "100000"},
+    "bounded": {},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--config", choices=sorted(CONFIGS), action="append")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summary(samples: list[float]) -> str:
+    ms = [s * 1000 for s in samples]
+    return f"p50 {percentile(ms, 50):7.1f} ms  p95 {percentile(ms, 95):7.1f} ms  p99 {percentile(ms, 99):7.1f} ms  (n={len(ms)})"
+
+
+async def run(logins: int, concurrency: int):
+    import httpx
+    from fastapi import FastAPI
+    import db
+    from auth import password_pool
+    from routes.auth import auth_router
+
+    app = FastAPI()
+    app.include_router(auth_router)
+
+    @app.get("/")
+    def read_root():
+        return {"ok": True}
+
+    await db.create_db_and_tables()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        await client.post("/auth/signup", json={
+            "username": "bench", "email": "bench@example.com", "password": "hunter22", "name": "Bench",
+            "phone_no": "0", "country": "PK", "address": "-",
+        })
+        login_times, cheap_times, shed = [], [], 0
+        pending = list(range(logins))
+        done = asyncio.Event()
+
+        async def login_worker():
+            nonlocal shed
+            while pending:
+                pending.pop()
+                start = time.perf_counter()
+                response = await client.post("/auth/login", data={"username": "bench@example.com", "password": "hunter22"})
+                if response.status_code == 503:
+                    shed += 1
+                else:
+                    response.raise_for_status()
+                    login_times.append(time.perf_counter() - start)
+
+        async def cheap_poller():
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get("/")).raise_for_status()
+                cheap_times.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        poller = asyncio.create_task(cheap_poller())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await poller
+    password_pool.shutdown()
+    print(f"  logins: {summary(login_times)}  shed {shed}  {len(login_times) / elapsed:.1f}/s")
+    print(f"  '/'   : {summary(cheap_times)}")
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        asyncio.run(run(args.logins, args.concurrency))
+        return
+    import subprocess
+
+    for name in args.config or ["unbounded", "bounded"]:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/bench.db", **CONFIGS[name])
+        env.setdefault("JWT_SECRET_KEY", "bench")
+        env.setdefault("MAIL_SENDER_ENABLED", "false")
+        print(f"{name} (workers={env.get('PASSWORD_POOL_WORKERS', 'default')}, cpus={os.cpu_count()})")
+        cmd = [sys.executable, "-m", "benchmarks.login_latency", "--child", name,
+               "--logins", str(args.logins), "--concurrency", str(args.concurrency)]
+        subprocess.run(cmd, env=env, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+if __name__ == "__main__":
+    main()
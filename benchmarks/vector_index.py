@@ -0,0 +1,112 @@
+"""Recall and latency of the per-bot vector index: exact search against IVF.
+
+    python -m benchmarks.vector_index --rows 100000 1000000 --dim 384 --queries 200
+
+Fills a temporary index with synthetic embeddings (unit vectors scattered around
+random topic centres, like chunks of a few thousand documents), appending in
+ingestion-sized batches. Queries are perturbed copies of stored rows. For each
+size it reports append throughput, exact search latency, the IVF build time,
+and for several nprobe values the latency and recall@k against the exact
+results. A final pass tombstones 10% of the rows and compacts.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+APPEND_BATCH = 4096
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=1.0, help="noise around a topic centre, relative to it")
+    return parser.parse_args()
+
+
+def embeddings(rng, centres, rows: int, spread: float):
+    for start in range(0, rows, APPEND_BATCH):
+        n = min(APPEND_BATCH, rows - start)
+        noise = rng.normal(size=(n, centres.shape[1])) / np.sqrt(centres.shape[1])
+        block = centres[rng.integers(len(centres), size=n)] + spread * noise
+        yield np.arange(start + 1, start + n + 1), block.astype(np.float32)
+
+
+def latencies(search, queries) -> tuple[list, float, float]:
+    results, times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([chunk_id for chunk_id, _ in search(query)])
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return results, statistics.median(times) * 1000, times[int(len(times) * 0.95)] * 1000
+
+
+def run(args, rows: int) -> None:
+    from vector_index import BotIndex, normalize
+
+    rng = np.random.default_rng(rows)
+    centres = normalize(rng.normal(size=(args.topics, args.dim)))
+    path = os.path.join(args.root, f"bench-{rows}")
+    index = BotIndex(path)
+    start = time.perf_counter()
+    for ids, block in embeddings(rng, centres, rows, args.spread):
+        index.add(ids, block)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(os.path.join(path, "vectors.f32")) / 2**20
+    print(f"{rows:>9,} rows  append {rows / elapsed:>9,.0f} rows/s  ({size:,.0f} MB)")
+
+    sample = np.asarray(index._vectors[np.sort(rng.choice(rows, args.queries, replace=False))])
+    queries = normalize(sample + 0.5 * rng.normal(size=sample.shape) / np.sqrt(args.dim))
+    truth, p50, p95 = latencies(lambda q: index.search(q, args.k, nprobe=0), queries)
+    print(f"{'':>15}exact           p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  recall 1.000")
+
+    start = time.perf_counter()
+    index.build_ivf()
+    lists = len(index._ivf["centroids"])
+    print(f"{'':>15}ivf build       {time.perf_counter() - start:7.1f} s   ({lists} lists)")
+    for nprobe in args.nprobe:
+        found, p50, p95 = latencies(lambda q: index.search(q, args.k, nprobe=nprobe), queries)
+        recall = statistics.mean(len(set(a) & set(b)) / len(b) for a, b in zip(found, truth))
+        print(f"{'':>15}ivf nprobe {nprobe:<4} p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  recall {recall:.3f}")
+
+    start = time.perf_counter()
+    reopened = BotIndex(path)
+    reopened.search(queries[0], args.k)
+    print(f"{'':>15}reopen + first search {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+    start = time.perf_counter()
+    index.delete(rng.choice(rows, rows // 10, replace=False) + 1)
+    deleting = time.perf_counter() - start
+    start = time.perf_counter()
+    index.compact()
+    print(f"{'':>15}tombstone 10%   {deleting * 1000:7.1f} ms  compact {time.perf_counter() - start:5.1f} s")
+    shutil.rmtree(path)
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("JWT_SECRET_KEY", "bench")
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    args.root = tempfile.mkdtemp()
+    try:
+        for rows in args.rows:
+            run(args, rows)
+    finally:
+        shutil.rmtree(args.root)
+
+
+if __name__ == "__main__":
+    main()
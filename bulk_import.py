@@ -0,0 +1,67 @@
+import codecs
+import csv
+from typing import Optional
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+import config
+
+IMPORT_FORMATS = ("csv", "xlsx")
+
+
+def _format(upload: UploadFile, format: Optional[str]) -> str:
+    if format is None:
+        name = (upload.filename or "").lower()
+        format = "xlsx" if name.endswith(".xlsx") else "csv"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="format must be csv or xlsx")
+    return format
+
+
+def too_many_items() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {config.BULK_MAX_ITEMS} items per request",
+    )
+
+
+def _read_csv(file) -> list[dict]:
+    reader = csv.DictReader(codecs.getreader("utf-8-sig")(file))
+    rows = []
+    for row in reader:
+        if len(rows) == config.BULK_MAX_ITEMS:
+            raise too_many_items()
+        rows.append(row)
+    return rows
+
+
+# Read-only mode walks the sheet XML instead of building the whole workbook
+def _read_xlsx(file) -> list[dict]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        values = sheet.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(values, ())]
+        rows = []
+        for row in values:
+            if all(value is None for value in row):
+                continue
+            if len(rows) == config.BULK_MAX_ITEMS:
+                raise too_many_items()
+            rows.append({name: value for name, value in zip(header, row) if name})
+        return rows
+    finally:
+        workbook.close()
+
+
+# Rows of an uploaded CSV or XLSX file as dicts keyed by the header row; format defaults to
+# the file extension. Parsing runs in the threadpool, off the event loop
+async def read_rows(upload: UploadFile, format: Optional[str] = None) -> list[dict]:
+    reader = _read_xlsx if _format(upload, format) == "xlsx" else _read_csv
+    try:
+        return await run_in_threadpool(reader, upload.file)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not read the file: {exc}")
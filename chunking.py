@@ -0,0 +1,146 @@
+"""Streaming text extraction and chunking for knowledge-base documents.
+
+Everything here is a generator over bounded pieces of the file, so memory
+stays flat however large the document is. The module only imports the
+standard library (bs4 and pypdf load on use), which keeps process pool
+workers cheap to start.
+"""
+import codecs
+import json
+import re
+from typing import Iterable, Iterator
+
+READ_SIZE = 64 * 1024
+# Upper bound on the HTML handed to one BeautifulSoup parse
+HTML_WINDOW = 256 * 1024
+
+DOCUMENT_KINDS = ("html", "text", "pdf")
+
+
+def iter_text_file(path: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(path, "rb") as f:
+        while data := f.read(READ_SIZE):
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+# Places where an HTML stream can be cut without splitting a paragraph or a script
+_BLOCK_END = re.compile(
+    r"</(?:p|div|li|tr|td|th|h[1-6]|section|article|header|footer|pre|blockquote|table|ul|ol|dl|dd|dt)\s*>"
+    r"|<br\s*/?>",
+    re.IGNORECASE,
+)
+_RAW_TAG = re.compile(r"<(/?)(?:script|style)\b", re.IGNORECASE)
+
+
+def _safe_cut(html: str) -> int:
+    events = sorted(
+        [(m.start(), "raw", m.group(1) != "/") for m in _RAW_TAG.finditer(html)]
+        + [(m.end(), "block", False) for m in _BLOCK_END.finditer(html)]
+    )
+    cut = 0
+    inside_raw = False
+    for position, kind, opening in events:
+        if kind == "raw":
+            inside_raw = opening
+        elif not inside_raw:
+            cut = position
+    return cut
+
+
+# Cut the HTML stream into windows that each end after a block element
+def _html_windows(pieces: Iterable[str]) -> Iterator[str]:
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < HTML_WINDOW:
+            continue
+        cut = _safe_cut(buffer)
+        if not cut and len(buffer) > 4 * HTML_WINDOW:
+            # No block boundary at all; settle for the end of the last tag
+            cut = buffer.rfind(">") + 1
+        if cut:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def iter_html_text(path: str) -> Iterator[str]:
+    from bs4 import BeautifulSoup
+
+    for window in _html_windows(iter_text_file(path)):
+        soup = BeautifulSoup(window, "html.parser")
+        for element in soup(["script", "style", "noscript", "template"]):
+            element.decompose()
+        yield soup.get_text("\n") + "\n"
+
+
+# Page by page; pypdf parses a page's content only when its text is asked for
+def iter_pdf_text(path: str) -> Iterator[str]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("PDF documents need the pypdf package")
+
+    with open(path, "rb") as f:
+        for page in PdfReader(f).pages:
+            yield (page.extract_text() or "") + "\n\n"
+
+
+def iter_document_text(path: str, kind: str) -> Iterator[str]:
+    if kind == "html":
+        return iter_html_text(path)
+    if kind == "pdf":
+        return iter_pdf_text(path)
+    return iter_text_file(path)
+
+
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def _normalize(text: str) -> str:
+    text = _SPACES.sub(" ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+# Split at the last paragraph, sentence or word break in the second half of the window
+def _split_point(text: str, size: int) -> int:
+    for separator in ("\n\n", "\n", ". ", " "):
+        cut = text.rfind(separator, size // 2, size)
+        if cut != -1:
+            return cut + len(separator)
+    return size
+
+
+# Chunks of about `size` characters; consecutive chunks share about `overlap` characters
+def iter_chunks(pieces: Iterable[str], size: int, overlap: int) -> Iterator[str]:
+    buffer = ""
+    for piece in pieces:
+        buffer += _normalize(piece)
+        while len(buffer) >= size:
+            cut = _split_point(buffer, size)
+            chunk = buffer[:cut].strip()
+            if chunk:
+                yield chunk
+            start = max(cut - overlap, 0)
+            # Start the overlap on a word boundary
+            space = buffer.find(" ", start, cut)
+            buffer = buffer[space + 1 if space != -1 else cut:]
+    buffer = buffer.strip()
+    if buffer:
+        yield buffer
+
+
+# Process pool entry point: parse and chunk one file, writing the chunks as JSON lines to
+# `out_path` as they are produced; returns the chunk count
+def chunk_file(path: str, kind: str, out_path: str, size: int, overlap: int) -> int:
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for chunk in iter_chunks(iter_document_text(path, kind), size, overlap):
+            out.write(json.dumps(chunk) + "\n")
+            count += 1
+    return count
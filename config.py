@@ -1,3 +1,4 @@
+import os
 from starlette.config import Config
 
 # Attempt to load .env file
@@ -11,3 +12,197 @@ DATABASE_URL = config("DATABASE_URL", cast=str)
 JWT_SECRET_KEY = config("JWT_SECRET_KEY", cast=str)
 ALGORITHM = config("ALGORITHM", cast=str, default="HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES", cast=int, default=30)
+
+# Outgoing mail (drained from the outbox table by mailer.OutboxSender)
+SMTP_HOST = config("SMTP_HOST", cast=str, default="smtp.gmail.com")
+SMTP_PORT = config("SMTP_PORT", cast=int, default=587)
+# Credentials come from the process environment only, never from .env
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_STARTTLS = config("SMTP_STARTTLS", cast=bool, default=True)
+SMTP_TIMEOUT = config("SMTP_TIMEOUT", cast=float, default=30.0)
+MAIL_FROM = config("MAIL_FROM", cast=str, default=SMTP_USERNAME)
+MAIL_SENDER_ENABLED = config("MAIL_SENDER_ENABLED", cast=bool, default=True)
+MAIL_BATCH_SIZE = config("MAIL_BATCH_SIZE", cast=int, default=50)
+MAIL_POLL_INTERVAL = config("MAIL_POLL_INTERVAL", cast=float, default=5.0)
+MAIL_MAX_ATTEMPTS = config("MAIL_MAX_ATTEMPTS", cast=int, default=8)
+MAIL_RETRY_BASE_SECONDS = config("MAIL_RETRY_BASE_SECONDS", cast=float, default=30.0)
+MAIL_RETRY_MAX_SECONDS = config("MAIL_RETRY_MAX_SECONDS", cast=float, default=3600.0)
+# How long a claimed batch stays reserved for its sender; if that sender dies mid-batch the
+# messages are sent again after this, so it must outlast the slowest batch
+MAIL_LEASE_SECONDS = config("MAIL_LEASE_SECONDS", cast=float, default=MAIL_BATCH_SIZE * SMTP_TIMEOUT)
+
+# Blob storage for uploaded files (order payment screenshots)
+BLOB_BACKEND = config("BLOB_BACKEND", cast=str, default="local")  # local | s3
+BLOB_DIR = config("BLOB_DIR", cast=str, default="blobs")
+BLOB_TMP_DIR = config("BLOB_TMP_DIR", cast=str, default="")
+BLOB_MAX_BYTES = config("BLOB_MAX_BYTES", cast=int, default=10 * 1024 * 1024)
+BLOB_CHUNK_SIZE = config("BLOB_CHUNK_SIZE", cast=int, default=64 * 1024)
+THUMBNAIL_SIZE = config("THUMBNAIL_SIZE", cast=int, default=160)
+S3_BUCKET = config("S3_BUCKET", cast=str, default="")
+S3_PREFIX = config("S3_PREFIX", cast=str, default="blobs/")
+S3_ENDPOINT_URL = config("S3_ENDPOINT_URL", cast=str, default="")
+S3_REGION = config("S3_REGION", cast=str, default="")
+S3_ACCESS_KEY_ID = config("S3_ACCESS_KEY_ID", cast=str, default="")
+S3_SECRET_ACCESS_KEY = config("S3_SECRET_ACCESS_KEY", cast=str, default="")
+
+# List endpoints (keyset pagination)
+PAGE_DEFAULT_LIMIT = config("PAGE_DEFAULT_LIMIT", cast=int, default=100)
+PAGE_MAX_LIMIT = config("PAGE_MAX_LIMIT", cast=int, default=1000)
+# Build list rows with per-field-selection serializers and encode them with orjson (falls back
+# to json when it isn't installed) instead of jsonable_encoder + json
+JSON_FAST_PATH = config("JSON_FAST_PATH", cast=bool, default=False)
+
+# Bulk endpoints (/order/complete_orders, /order/orders/import): items per request
+BULK_MAX_ITEMS = config("BULK_MAX_ITEMS", cast=int, default=5000)
+
+# Database engine and connection pool
+DB_ECHO = config("DB_ECHO", cast=bool, default=False)
+DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=10)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=10)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", cast=float, default=30.0)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", cast=int, default=1800)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", cast=bool, default=True)
+# asyncpg prepared statement cache; set to 0 behind PgBouncer/Neon's pooled endpoint
+DB_STATEMENT_CACHE_SIZE = config("DB_STATEMENT_CACHE_SIZE", cast=int, default=100)
+# Schema creation belongs to `python migrate.py`; only enable this for local development
+DB_CREATE_TABLES = config("DB_CREATE_TABLES", cast=bool, default=False)
+# Report each request's SQL query count and time in a Server-Timing response header
+DB_SERVER_TIMING = config("DB_SERVER_TIMING", cast=bool, default=False)
+
+# Authenticated user cache (auth.get_current_user)
+USER_CACHE_SIZE = config("USER_CACHE_SIZE", cast=int, default=10000)
+USER_CACHE_TTL = config("USER_CACHE_TTL", cast=float, default=60.0)
+USER_CACHE_NEGATIVE_TTL = config("USER_CACHE_NEGATIVE_TTL", cast=float, default=5.0)  # 0 disables negative caching
+# Put the profile in the token and let read-only routes (/auth/user/me) trust it without a lookup
+AUTH_TRUST_TOKEN_CLAIMS = config("AUTH_TRUST_TOKEN_CLAIMS", cast=bool, default=False)
+
+# Cached JSON for hot single-resource reads (/order/order/{id}, /order/account_detail/{id}), with ETags
+RESPONSE_CACHE_ENABLED = config("RESPONSE_CACHE_ENABLED", cast=bool, default=True)
+RESPONSE_CACHE_SIZE = config("RESPONSE_CACHE_SIZE", cast=int, default=10000)
+# "" keeps versions per process, so another instance's writes show up only once they expire
+# (RESPONSE_CACHE_TTL); "redis" shares them (and cached bodies) across workers and instances;
+# "memory" is an in-process stand-in for the shared backend
+RESPONSE_CACHE_BACKEND = config("RESPONSE_CACHE_BACKEND", cast=str, default="")
+# Process-local versions can lag other instances' writes by up to the TTL, so they default to
+# a few seconds; with redis every write bumps the shared version and bodies can live longer
+RESPONSE_CACHE_TTL = config(
+    "RESPONSE_CACHE_TTL", cast=float, default=300.0 if RESPONSE_CACHE_BACKEND == "redis" else 5.0
+)
+RESPONSE_CACHE_REDIS_URL = config("RESPONSE_CACHE_REDIS_URL", cast=str, default="redis://localhost:6379/0")
+
+# Password hashing (bcrypt cost and the dedicated worker pool)
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", cast=int, default=12)
+PASSWORD_POOL_KIND = config("PASSWORD_POOL_KIND", cast=str, default="thread")  # thread | process
+PASSWORD_POOL_WORKERS = config("PASSWORD_POOL_WORKERS", cast=int, default=os.cpu_count() or 1)
+PASSWORD_POOL_MAX_QUEUE = config("PASSWORD_POOL_MAX_QUEUE", cast=int, default=8)
+PASSWORD_POOL_RETRY_AFTER = config("PASSWORD_POOL_RETRY_AFTER", cast=int, default=1)
+
+# MetaTrader5 terminal worker pool
+MT5_MODULE = config("MT5_MODULE", cast=str, default="MetaTrader5")  # import path; point at a stand-in for tests
+MT5_TERMINAL_PATH = config("MT5_TERMINAL_PATH", cast=str, default="")
+MT5_POOL_SIZE = config("MT5_POOL_SIZE", cast=int, default=2)
+MT5_ACQUIRE_TIMEOUT = config("MT5_ACQUIRE_TIMEOUT", cast=float, default=10.0)
+MT5_CALL_TIMEOUT = config("MT5_CALL_TIMEOUT", cast=float, default=60.0)
+MT5_IDLE_TIMEOUT = config("MT5_IDLE_TIMEOUT", cast=float, default=600.0)
+MT5_HEALTH_INTERVAL = config("MT5_HEALTH_INTERVAL", cast=float, default=30.0)
+
+# Admission control for /auth/signup, /auth/login and /meta/fetch_account_details (admission.py).
+# Per route, at most *_CONCURRENCY requests run and ADMISSION_MAX_QUEUE wait; each client (the
+# token's user, else the IP) gets *_RATE requests a second in bursts of *_BURST (0 = no limit)
+ADMISSION_ENABLED = config("ADMISSION_ENABLED", cast=bool, default=True)
+ADMISSION_SIGNUP_CONCURRENCY = config("ADMISSION_SIGNUP_CONCURRENCY", cast=int, default=PASSWORD_POOL_WORKERS)
+ADMISSION_SIGNUP_RATE = config("ADMISSION_SIGNUP_RATE", cast=float, default=0.2)
+ADMISSION_SIGNUP_BURST = config("ADMISSION_SIGNUP_BURST", cast=float, default=5)
+ADMISSION_LOGIN_CONCURRENCY = config("ADMISSION_LOGIN_CONCURRENCY", cast=int, default=PASSWORD_POOL_WORKERS)
+ADMISSION_LOGIN_RATE = config("ADMISSION_LOGIN_RATE", cast=float, default=1.0)
+ADMISSION_LOGIN_BURST = config("ADMISSION_LOGIN_BURST", cast=float, default=10)
+ADMISSION_MT5_CONCURRENCY = config("ADMISSION_MT5_CONCURRENCY", cast=int, default=MT5_POOL_SIZE * 2)
+ADMISSION_MT5_RATE = config("ADMISSION_MT5_RATE", cast=float, default=2.0)
+ADMISSION_MT5_BURST = config("ADMISSION_MT5_BURST", cast=float, default=10)
+ADMISSION_MAX_QUEUE = config("ADMISSION_MAX_QUEUE", cast=int, default=32)
+ADMISSION_QUEUE_TIMEOUT = config("ADMISSION_QUEUE_TIMEOUT", cast=float, default=5.0)
+# Shed requests that would queue once even the shortest wait over an interval exceeds the
+# target; shrink concurrency while CPU use (psutil) is above ADMISSION_CPU_PERCENT (0 = ignore CPU)
+ADMISSION_TARGET_WAIT = config("ADMISSION_TARGET_WAIT", cast=float, default=0.1)
+ADMISSION_INTERVAL = config("ADMISSION_INTERVAL", cast=float, default=0.5)
+ADMISSION_CPU_PERCENT = config("ADMISSION_CPU_PERCENT", cast=float, default=90.0)
+ADMISSION_MAX_RETRY_AFTER = config("ADMISSION_MAX_RETRY_AFTER", cast=float, default=60.0)
+ADMISSION_MAX_CLIENTS = config("ADMISSION_MAX_CLIENTS", cast=int, default=10000)  # token buckets kept
+# Count anonymous clients by the address the proxy in front reports (the last X-Forwarded-For
+# entry) instead of the connection's peer, which behind a proxy is the proxy itself for everyone.
+# On by default on Vercel (VERCEL is set there), whose edge overwrites the header with the client's address
+ADMISSION_TRUST_FORWARDED = config("ADMISSION_TRUST_FORWARDED", cast=bool, default=bool(os.environ.get("VERCEL")))
+
+# Background equity snapshots of every provisioned MT5 account (enable in one process only)
+EQUITY_SNAPSHOT_ENABLED = config("EQUITY_SNAPSHOT_ENABLED", cast=bool, default=False)
+EQUITY_SNAPSHOT_INTERVAL = config("EQUITY_SNAPSHOT_INTERVAL", cast=float, default=60.0)
+# Accounts polled at once; half the MT5 pool, so snapshots never take every terminal from live requests
+EQUITY_SNAPSHOT_CONCURRENCY = config("EQUITY_SNAPSHOT_CONCURRENCY", cast=int, default=max(1, MT5_POOL_SIZE // 2))
+# Days kept per resolution (0 = forever). Raw polls roll up into hourly rows and hourly rows
+# into daily ones, so raw retention must stay above an hour
+EQUITY_RAW_RETENTION_DAYS = config("EQUITY_RAW_RETENTION_DAYS", cast=float, default=2.0)
+EQUITY_HOURLY_RETENTION_DAYS = config("EQUITY_HOURLY_RETENTION_DAYS", cast=float, default=90.0)
+EQUITY_DAILY_RETENTION_DAYS = config("EQUITY_DAILY_RETENTION_DAYS", cast=float, default=0.0)
+
+# Knowledge base ingestion (/bots/{bot_id}/documents)
+INGEST_MAX_BYTES = config("INGEST_MAX_BYTES", cast=int, default=50 * 1024 * 1024)
+INGEST_CONCURRENCY = config("INGEST_CONCURRENCY", cast=int, default=2)  # documents in flight per process
+INGEST_PARSE_WORKERS = config("INGEST_PARSE_WORKERS", cast=int, default=max(1, (os.cpu_count() or 2) // 2))
+INGEST_CHUNK_SIZE = config("INGEST_CHUNK_SIZE", cast=int, default=1000)  # characters
+INGEST_CHUNK_OVERLAP = config("INGEST_CHUNK_OVERLAP", cast=int, default=150)  # keep under half the chunk size
+# A document left parsing or embedding without progress for this long is taken to be abandoned
+# by a worker that stopped, and may be retried
+INGEST_STALE_SECONDS = config("INGEST_STALE_SECONDS", cast=float, default=900.0)
+# While a document is being worked on its updated_at is refreshed this often, so a slow parse
+# that hasn't produced a chunk yet never looks stale; keep it well under INGEST_STALE_SECONDS
+INGEST_HEARTBEAT_SECONDS = config("INGEST_HEARTBEAT_SECONDS", cast=float, default=60.0)
+
+# Embeddings: "hashing" (deterministic and offline), "google" (langchain-google-genai),
+# or "package.module:ClassName" for anything else implementing embeddings.Embedder
+EMBEDDING_PROVIDER = config("EMBEDDING_PROVIDER", cast=str, default="hashing")
+EMBEDDING_MODEL = config("EMBEDDING_MODEL", cast=str, default="models/text-embedding-004")
+EMBEDDING_DIM = config("EMBEDDING_DIM", cast=int, default=384)  # hashing provider only
+EMBEDDING_BATCH_SIZE = config("EMBEDDING_BATCH_SIZE", cast=int, default=64)
+GOOGLE_API_KEY = config("GOOGLE_API_KEY", cast=str, default="")
+
+# Per-bot retrieval indexes: memory-mapped files under VECTOR_INDEX_DIR/<bot_id>/
+VECTOR_INDEX_DIR = config("VECTOR_INDEX_DIR", cast=str, default="vectors")
+VECTOR_INDEX_CACHE_SIZE = config("VECTOR_INDEX_CACHE_SIZE", cast=int, default=64)  # open indexes kept mapped
+VECTOR_INDEX_IDLE_SECONDS = config("VECTOR_INDEX_IDLE_SECONDS", cast=float, default=900.0)
+VECTOR_COMPACT_RATIO = config("VECTOR_COMPACT_RATIO", cast=float, default=0.2)  # tombstoned share that triggers a rewrite
+# Approximate (IVF) search for indexes with at least this many live rows; 0 = always exact
+VECTOR_IVF_MIN_ROWS = config("VECTOR_IVF_MIN_ROWS", cast=int, default=50000)
+VECTOR_IVF_LISTS = config("VECTOR_IVF_LISTS", cast=int, default=0)  # 0 = about sqrt(rows)
+VECTOR_IVF_NPROBE = config("VECTOR_IVF_NPROBE", cast=int, default=16)  # lists scanned per query
+# Rebuild the IVF lists once rows added since the last build exceed this share of it
+VECTOR_IVF_REBUILD_RATIO = config("VECTOR_IVF_REBUILD_RATIO", cast=float, default=0.25)
+
+# Chat (/chat/{bot_id}): "fake" (offline, answers from the retrieved context), "google"
+# (langchain-google-genai), or "package.module:ClassName" for anything implementing llm.ChatModel
+LLM_PROVIDER = config("LLM_PROVIDER", cast=str, default="fake")
+LLM_MODEL = config("LLM_MODEL", cast=str, default="gemini-1.5-flash")
+LLM_FAKE_TOKEN_DELAY = config("LLM_FAKE_TOKEN_DELAY", cast=float, default=0.0)  # seconds between fake tokens
+CHAT_CONTEXT_CHUNKS = config("CHAT_CONTEXT_CHUNKS", cast=int, default=8)  # candidates; those that fit the budget are used
+# Conversation memory: recent turns verbatim plus a rolling summary of older ones, so the
+# prompt stays within CHAT_PROMPT_TOKENS (estimated) however long a conversation runs
+CHAT_PROMPT_TOKENS = config("CHAT_PROMPT_TOKENS", cast=int, default=3000)
+CHAT_HISTORY_SHARE = config("CHAT_HISTORY_SHARE", cast=float, default=0.4)  # of the budget left after the summary
+CHAT_HISTORY_TOKENS = config("CHAT_HISTORY_TOKENS", cast=int, default=1500)  # verbatim history before summarizing
+CHAT_HISTORY_MAX_TURNS = config("CHAT_HISTORY_MAX_TURNS", cast=int, default=40)  # turns read per request
+CHAT_SUMMARY_TOKENS = config("CHAT_SUMMARY_TOKENS", cast=int, default=300)
+
+# Semantic answer cache: reuse the answer to a recent, near-identical question to the same bot
+ANSWER_CACHE_ENABLED = config("ANSWER_CACHE_ENABLED", cast=bool, default=True)
+ANSWER_CACHE_THRESHOLD = config("ANSWER_CACHE_THRESHOLD", cast=float, default=0.95)  # cosine similarity
+ANSWER_CACHE_SIZE = config("ANSWER_CACHE_SIZE", cast=int, default=128)  # answers per bot
+ANSWER_CACHE_BOTS = config("ANSWER_CACHE_BOTS", cast=int, default=256)
+ANSWER_CACHE_TTL = config("ANSWER_CACHE_TTL", cast=float, default=3600.0)
+
+# Metrics: Prometheus text format on /metrics
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=False)
+# With METRICS_ENABLED, log requests slower than this (ms) along with the event loop stacks
+# sampled while they ran; 0 = off
+METRICS_SLOW_REQUEST_MS = config("METRICS_SLOW_REQUEST_MS", cast=float, default=0)
+METRICS_PROFILE_INTERVAL = config("METRICS_PROFILE_INTERVAL", cast=float, default=0.005)
+METRICS_PROFILE_WINDOW = config("METRICS_PROFILE_WINDOW", cast=float, default=60.0)
@@ -0,0 +1,241 @@
+import asyncio
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import delete, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+import config
+from db import async_session
+from llm import get_chat_model
+from metrics import register_callback
+from models.conversation import Conversation, ConversationTurn
+
+SYSTEM_PROMPT = (
+    "You are this bot's assistant. Answer the question from the context below only; "
+    "if the context does not contain the answer, say so.\n\n"
+)
+
+SUMMARY_PROMPT = (
+    "Update the running summary of this conversation between a user and a bot's assistant with "
+    "the new turns below. Keep names, numbers, decisions and open questions; use at most {words} words.\n\n"
+)
+
+# Per-message framing (role markers and separators) on top of the content
+MESSAGE_OVERHEAD = 4
+
+
+# A tokenizer-free estimate: about four characters per token for English prose, and never
+# fewer than four tokens per three words. Cached, since chunk texts come back on every request
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(1, len(text) // 4, len(text.split()) * 4 // 3)
+
+
+# Cut text to about `tokens` tokens, at a word boundary
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    words = text.split()[:tokens * 3 // 4]
+    return " ".join(words)[:tokens * 4]
+
+
+# The user's conversation with the bot (created on first use) and its verbatim recent turns
+async def load_conversation(user_id: int, bot_id: str) -> tuple[Conversation, list[ConversationTurn]]:
+    query = select(Conversation).where(Conversation.user_id == user_id, Conversation.bot_id == bot_id)
+    async with async_session() as session:
+        conversation = (await session.exec(query)).first()
+        if conversation is None:
+            conversation = Conversation(user_id=user_id, bot_id=bot_id)
+            session.add(conversation)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Created by a concurrent request, if it is there now; otherwise the insert failed
+                # for another reason (a foreign key: the user is gone) and that is the error
+                await session.rollback()
+                conversation = (await session.exec(query)).first()
+                if conversation is None:
+                    raise
+        # Newest first and bounded, so a backlog waiting to be summarized can't slow this down
+        turns = (await session.exec(
+            select(ConversationTurn)
+            .where(ConversationTurn.conversation_id == conversation.id)
+            .order_by(ConversationTurn.seq.desc())
+            .limit(config.CHAT_HISTORY_MAX_TURNS)
+        )).all()
+    return conversation, list(reversed(turns))
+
+
+# Store a question and its answer; returns the tokens of verbatim history now kept
+async def record_turns(conversation_id: int, question: str, answer: str) -> int:
+    async with async_session() as session:
+        last = (await session.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(last_seq=Conversation.last_seq + 2, updated_at=datetime.utcnow())
+            .returning(Conversation.last_seq)
+        )).scalar_one()
+        session.add_all([
+            ConversationTurn(
+                conversation_id=conversation_id, seq=last - 1, role="user",
+                content=question, tokens=estimate_tokens(question),
+            ),
+            ConversationTurn(
+                conversation_id=conversation_id, seq=last, role="assistant",
+                content=answer, tokens=estimate_tokens(answer),
+            ),
+        ])
+        await session.flush()
+        pending = (await session.exec(
+            select(func.sum(ConversationTurn.tokens)).where(ConversationTurn.conversation_id == conversation_id)
+        )).one()
+        await session.commit()
+    return pending or 0
+
+
+# Pack the prompt into CHAT_PROMPT_TOKENS: instructions, question and summary first, then the
+# most recent turns (up to CHAT_HISTORY_SHARE of what is left), then the retrieved chunks, best
+# first, that still fit. Returns the messages, the chunks used and the estimated token count
+def build_prompt(
+    question: str, summary: str, turns: list, chunks: list[dict], budget: Optional[int] = None
+) -> tuple[list[dict], list[dict], int]:
+    budget = budget or config.CHAT_PROMPT_TOKENS
+    question = truncate_to_tokens(question, budget // 4)
+    summary = truncate_to_tokens(summary, config.CHAT_SUMMARY_TOKENS)
+    remaining = budget - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(question) - 2 * MESSAGE_OVERHEAD
+    remaining -= estimate_tokens(summary)
+
+    recent = []
+    history_budget = int(remaining * config.CHAT_HISTORY_SHARE)
+    for turn in reversed(turns):
+        if turn.tokens + MESSAGE_OVERHEAD > history_budget:
+            break
+        recent.append(turn)
+        history_budget -= turn.tokens + MESSAGE_OVERHEAD
+        remaining -= turn.tokens + MESSAGE_OVERHEAD
+    recent.reverse()
+
+    used = []
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk["text"]) + 1
+        if tokens <= remaining:
+            used.append(chunk)
+            remaining -= tokens
+
+    system = SYSTEM_PROMPT
+    if summary:
+        system += f"Summary of the conversation so far:\n{summary}\n\n"
+    system += "Context:\n" + "\n\n".join(chunk["text"] for chunk in used)
+    messages = (
+        [{"role": "system", "content": system}]
+        + [{"role": turn.role, "content": turn.content} for turn in recent]
+        + [{"role": "user", "content": question}]
+    )
+    return messages, used, budget - remaining
+
+
+def summary_messages(summary: str, turns: list) -> list[dict]:
+    transcript = "\n".join(f"{turn.role.capitalize()}: {turn.content}" for turn in turns)
+    system = SUMMARY_PROMPT.format(words=config.CHAT_SUMMARY_TOKENS * 3 // 4)
+    if summary:
+        system += f"Summary so far:\n{summary}\n\n"
+    return [{"role": "system", "content": system + "New turns:\n" + transcript}]
+
+
+class ConversationSummarizer:
+    """Folds the oldest turns of a conversation into its rolling summary once the verbatim
+    history passes CHAT_HISTORY_TOKENS. Runs in the background, so no chat request waits for
+    the extra model call; one task per conversation at a time."""
+
+    def __init__(self):
+        self.summarized = 0
+        self.failures = 0
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def schedule(self, conversation_id: int) -> None:
+        if conversation_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(conversation_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def _run(self, conversation_id: int) -> None:
+        try:
+            await self.summarize(conversation_id)
+        except Exception as e:
+            self.failures += 1
+            print(f"Summarizing conversation {conversation_id} failed: {e}")
+
+    # Returns whether the summary moved forward
+    async def summarize(self, conversation_id: int) -> bool:
+        async with async_session() as session:
+            conversation = await session.get(Conversation, conversation_id)
+            turns = (await session.exec(
+                select(ConversationTurn)
+                .where(ConversationTurn.conversation_id == conversation_id)
+                .order_by(ConversationTurn.seq)
+            )).all()
+        total = sum(turn.tokens for turn in turns)
+        if conversation is None or total <= config.CHAT_HISTORY_TOKENS:
+            return False
+        # Oldest first, until what stays verbatim is down to half the budget; whole exchanges only
+        fold = []
+        for turn in turns:
+            if total <= config.CHAT_HISTORY_TOKENS // 2 and turn.role == "user":
+                break
+            fold.append(turn)
+            total -= turn.tokens
+        if len(fold) == len(turns):
+            # Keep the latest exchange verbatim whatever its size
+            fold = fold[:-2]
+        if not fold:
+            return False
+        pieces = [piece async for piece in get_chat_model().stream(summary_messages(conversation.summary, fold))]
+        summary = truncate_to_tokens("".join(pieces).strip(), config.CHAT_SUMMARY_TOKENS)
+        async with async_session() as session:
+            updated = await session.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, Conversation.summarized_through == conversation.summarized_through)
+                .values(summary=summary, summarized_through=fold[-1].seq)
+            )
+            if not updated.rowcount:
+                # Another worker summarized these turns first
+                return False
+            await session.execute(
+                delete(ConversationTurn)
+                .where(ConversationTurn.conversation_id == conversation_id, ConversationTurn.seq <= fold[-1].seq)
+            )
+            await session.commit()
+        self.summarized += 1
+        return True
+
+    # Wait for the summaries in progress (tests and benchmarks)
+    async def join(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = {}
+
+
+conversation_summarizer = ConversationSummarizer()
+
+register_callback(
+    "conversation_summaries_total", "Rolling conversation summaries written.",
+    lambda: conversation_summarizer.summarized, "counter",
+)
+register_callback(
+    "conversation_summary_failures_total", "Conversation summaries that failed.",
+    lambda: conversation_summarizer.failures, "counter",
+)
@@ -1,13 +1,110 @@
-from sqlmodel import SQLModel, Session, create_engine
-import config 
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+import metrics
 
-# Create the SQLAlchemy engine
-engine = create_engine(config.DATABASE_URL, echo=True)
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+# Map a plain DATABASE_URL onto its async driver (asyncpg for Postgres, aiosqlite for SQLite)
+def async_database_url(url: str):
+    url = make_url(url)
+    connect_args = {}
+    if url.drivername in ("postgresql", "postgres", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    if url.drivername == "postgresql+asyncpg":
+        # asyncpg takes ssl=..., not libpq's sslmode=...
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode and sslmode != "disable":
+            connect_args["ssl"] = sslmode
+        query.pop("channel_binding", None)
+        url = url.set(query=query)
+        connect_args["statement_cache_size"] = config.DB_STATEMENT_CACHE_SIZE
+    return url, connect_args
 
 
-def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+def make_engine(database_url: str = config.DATABASE_URL):
+    url, connect_args = async_database_url(database_url)
+    options = {"echo": config.DB_ECHO, "pool_pre_ping": config.DB_POOL_PRE_PING, "connect_args": connect_args}
+    if url.get_backend_name() == "postgresql":
+        options.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    return create_async_engine(url, **options)
+
+
+# The one engine and session factory shared by every router and background task
+engine = make_engine()
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# Indexes added to models after their table exists are not created by create_all
+def _create_missing_indexes(conn) -> None:
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+# Count and time the SQL statements run inside the block (per request, or in a test):
+#     with track_queries() as stats:
+#         ...
+#     assert stats.count == 1
+@contextmanager
+def track_queries():
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if config.METRICS_ENABLED or _query_stats.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics.observe("db.query", elapsed)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+
+async def get_session():
+    async with async_session() as session:
+        yield session
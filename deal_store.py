@@ -0,0 +1,144 @@
+import asyncio
+import weakref
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models.deal import Deal, AccountSync
+from mt5_pool import TerminalSession
+from pagination import FieldSpec, column_field, fetch_page, decode_cursor
+
+if TYPE_CHECKING:
+    from analytics import Deals
+
+# Where the very first sync of an account starts
+HISTORY_START = datetime(2000, 1, 1)
+
+# One sync per account at a time within this process. Weakly held: a lock disappears once no
+# sync holds or waits on it, so accounts seen once don't pile up
+_sync_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _sync_lock(account: int) -> asyncio.Lock:
+    lock = _sync_locks.get(account)
+    if lock is None:
+        lock = _sync_locks[account] = asyncio.Lock()
+    return lock
+
+
+def _trade_type(deal_type: int) -> str:
+    return "Buy" if deal_type == 0 else "Sell" if deal_type == 1 else str(deal_type)
+
+
+# Shape of one entry in trade_details, read straight from the deal table
+DEAL_FIELDS: FieldSpec = {
+    "ticket": column_field(Deal.ticket),
+    "time": column_field(Deal.time),
+    "date": ([Deal.time], lambda row: datetime.fromtimestamp(row.time, timezone.utc).strftime('%Y-%m-%d')),
+    "type": column_field(Deal.type),
+    "trade_type": ([Deal.type], lambda row: _trade_type(row.type)),
+    "volume": column_field(Deal.volume),
+    "price": column_field(Deal.price),
+    "profit": column_field(Deal.profit),
+    "symbol": column_field(Deal.symbol),
+}
+
+
+# Pull only the deals newer than the account's high-water mark and fold them into the totals
+async def sync_deals(session: AsyncSession, terminal: TerminalSession, account: int, balance: Optional[float] = None) -> AccountSync:
+    async with _sync_lock(account):
+        state = await session.get(AccountSync, account) or AccountSync(account=account)
+        since = datetime.fromtimestamp(state.last_deal_time) if state.last_deal_time else HISTORY_START
+        fetched = await terminal.call("history_deals_get", since, datetime.now()) or []
+
+        # The window starts at the mark itself, so skip deals from that second we already have
+        known = set()
+        if state.last_deal_time:
+            known = set((await session.exec(
+                select(Deal.ticket).where(Deal.account == account, Deal.time >= state.last_deal_time)
+            )).all())
+        new_deals = [deal for deal in fetched if deal["ticket"] not in known]
+
+        session.add_all(
+            Deal(
+                account=account,
+                ticket=deal["ticket"],
+                time=deal["time"],
+                type=deal["type"],
+                entry=deal.get("entry", 0),
+                volume=deal["volume"],
+                price=deal["price"],
+                profit=deal["profit"],
+                commission=deal.get("commission", 0.0),
+                swap=deal.get("swap", 0.0),
+                symbol=deal["symbol"],
+            )
+            for deal in new_deals
+        )
+        if new_deals:
+            state.deal_count += len(new_deals)
+            state.total_pnl += sum(deal["profit"] for deal in new_deals)
+            state.last_deal_time = max(state.last_deal_time, max(deal["time"] for deal in new_deals))
+        if balance is not None:
+            state.balance = balance
+        state.synced_at = datetime.utcnow()
+        session.add(state)
+        await session.commit()
+        return state
+
+
+def deal_filters(account: int, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> list:
+    filters = [Deal.account == account]
+    if date_from:
+        filters.append(Deal.time >= int(date_from.timestamp()))
+    if date_to:
+        filters.append(Deal.time < int(date_to.timestamp()))
+    return filters
+
+
+# One page of stored deals in time order; returns (items, next_cursor)
+async def query_deals(
+    session: AsyncSession,
+    account: int,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+):
+    key_columns = [Deal.time, Deal.ticket]
+    after = decode_cursor(cursor, key_columns) if cursor else None
+    return await fetch_page(session, DEAL_FIELDS, key_columns, deal_filters(account, date_from, date_to), after, limit)
+
+
+async def deals_since(session: AsyncSession, account: int, since: datetime) -> list[Deal]:
+    return list((await session.exec(
+        select(Deal).where(*deal_filters(account, since)).order_by(Deal.time, Deal.ticket)
+    )).all())
+
+
+# Stored deals as NumPy arrays for the analytics engine
+async def load_account_deals(
+    session: AsyncSession, account: int, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None
+) -> "Deals":
+    # NumPy loads on first use, not at cold start
+    from analytics import load_deals
+
+    result = await session.execute(
+        select(Deal.time, Deal.type, Deal.entry, Deal.profit, Deal.commission, Deal.swap, Deal.symbol)
+        .where(*deal_filters(account, date_from, date_to))
+        .order_by(Deal.time, Deal.ticket)
+    )
+    return load_deals(result.all())
+
+
+# Balance the account had just before date_from (or before its first stored deal), implied
+# from the last synced balance minus the net result of every deal after that point
+async def opening_balance(session: AsyncSession, account: int, date_from: Optional[datetime] = None) -> float:
+    state = await session.get(AccountSync, account)
+    if state is None or state.balance is None:
+        return 0.0
+    net = Deal.profit + Deal.commission + Deal.swap
+    after = deal_filters(account, date_from)
+    total_after = (await session.execute(select(func.coalesce(func.sum(net), 0.0)).where(*after))).scalar_one()
+    return state.balance - float(total_after)
@@ -0,0 +1,93 @@
+import hashlib
+import importlib
+import re
+from typing import TYPE_CHECKING, Optional, Protocol
+from starlette.concurrency import run_in_threadpool
+import config
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class Embedder(Protocol):
+    """Turns a batch of texts into a float32 matrix with one row per text."""
+
+    name: str
+    dim: int
+
+    async def embed(self, texts: list[str]) -> "np.ndarray":
+        ...
+
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Deterministic, offline embeddings: signed feature hashing of words and word pairs,
+    L2-normalized. Texts sharing vocabulary land close together, which is enough for
+    tests and local development without an API key."""
+
+    name = "hashing"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = _TOKEN.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_sync(self, texts: list[str]) -> "np.ndarray":
+        import numpy as np
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                matrix[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    async def embed(self, texts: list[str]) -> "np.ndarray":
+        return await run_in_threadpool(self.embed_sync, texts)
+
+
+class GoogleEmbedder:
+    """Google Generative AI embeddings through langchain-google-genai."""
+
+    name = "google"
+
+    def __init__(self, model: str):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self.client = GoogleGenerativeAIEmbeddings(model=model, google_api_key=config.GOOGLE_API_KEY or None)
+        self.model = model
+        self.dim = 0  # known after the first call
+
+    async def embed(self, texts: list[str]) -> "np.ndarray":
+        import numpy as np
+
+        matrix = np.asarray(await self.client.aembed_documents(texts), dtype=np.float32)
+        self.dim = matrix.shape[1]
+        return matrix
+
+
+def _make_embedder():
+    provider = config.EMBEDDING_PROVIDER
+    if provider == "hashing":
+        return HashingEmbedder(config.EMBEDDING_DIM)
+    if provider == "google":
+        return GoogleEmbedder(config.EMBEDDING_MODEL)
+    # "package.module:ClassName", constructed without arguments
+    module, _, name = provider.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+_embedder: Optional[Embedder] = None
+
+
+# The configured provider, created on first use
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        _embedder = _make_embedder()
+    return _embedder
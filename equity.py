@@ -0,0 +1,216 @@
+import asyncio
+import time
+from itertools import groupby
+from typing import Optional
+from sqlalchemy import delete, func, insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+from db import async_session
+from metrics import register_callback, timer
+from models.equity import EquitySnapshot
+from models.order import OrderModel, CompleteOrderModel
+from mt5_pool import terminal_pool, MT5Error
+
+RAW = 0
+HOUR = 3600
+DAY = 86400
+
+# Start of the current day in unix seconds. Days are UTC everywhere: the daily rollups, the
+# analytics per-day rows and both daily_drawdown figures in routes/meta.py
+def day_start(now: Optional[float] = None) -> int:
+    now = int(time.time() if now is None else now)
+    return now - now % DAY
+
+
+# Rollup levels: bucket width -> the resolution it is built from
+ROLLUPS = {HOUR: RAW, DAY: HOUR}
+
+
+def retention_days(resolution: int) -> float:
+    return {
+        RAW: config.EQUITY_RAW_RETENTION_DAYS,
+        HOUR: config.EQUITY_HOURLY_RETENTION_DAYS,
+        DAY: config.EQUITY_DAILY_RETENTION_DAYS,
+    }[resolution]
+
+
+# Credentials of every completed MT5 order, one entry per account
+async def provisioned_accounts(session: AsyncSession) -> dict[int, tuple[str, str]]:
+    rows = (await session.execute(
+        select(CompleteOrderModel.platform_login, CompleteOrderModel.platform_password, CompleteOrderModel.server)
+        .join(OrderModel, OrderModel.id == CompleteOrderModel.order_id)
+        .where(func.lower(OrderModel.platform) == "mt5")
+    )).all()
+    return {int(login): (password, server) for login, password, server in rows if login.strip().isdigit()}
+
+
+# Fold one resolution into the next: every complete bucket after the newest existing rollup.
+# A bucket is only complete once its end has passed, so a rolled-up bucket never changes again
+async def downsample(session: AsyncSession, resolution: int, now: int) -> int:
+    source = ROLLUPS[resolution]
+    last = (await session.exec(
+        select(func.max(EquitySnapshot.time)).where(EquitySnapshot.resolution == resolution)
+    )).one()
+    start = last + resolution if last is not None else 0
+    end = now - now % resolution
+    if start >= end:
+        return 0
+    rows = (await session.exec(
+        select(EquitySnapshot)
+        .where(EquitySnapshot.resolution == source, EquitySnapshot.time >= start, EquitySnapshot.time < end)
+        .order_by(EquitySnapshot.account, EquitySnapshot.time)
+    )).all()
+    buckets = []
+    for (account, bucket), points in groupby(rows, key=lambda row: (row.account, row.time - row.time % resolution)):
+        points = list(points)
+        buckets.append({
+            "account": account,
+            "resolution": resolution,
+            "time": bucket,
+            "equity": points[-1].equity,
+            "equity_min": min(point.equity_min for point in points),
+            "equity_max": max(point.equity_max for point in points),
+            "balance": points[-1].balance,
+        })
+    if buckets:
+        await session.execute(insert(EquitySnapshot), buckets)
+    return len(buckets)
+
+
+async def apply_retention(session: AsyncSession, now: int) -> None:
+    for resolution in (RAW, HOUR, DAY):
+        days = retention_days(resolution)
+        if days:
+            await session.execute(
+                delete(EquitySnapshot)
+                .where(EquitySnapshot.resolution == resolution, EquitySnapshot.time < now - int(days * DAY))
+            )
+
+
+# Points for [start, end) at one resolution; the stretch after the newest rollup (the bucket
+# still in progress) is filled in from the finer resolution below it
+async def equity_points(session: AsyncSession, account: int, resolution: int, start: int, end: int) -> list:
+    rows = list((await session.exec(
+        select(EquitySnapshot)
+        .where(
+            EquitySnapshot.account == account,
+            EquitySnapshot.resolution == resolution,
+            EquitySnapshot.time >= start,
+            EquitySnapshot.time < end,
+        )
+        .order_by(EquitySnapshot.time)
+    )).all())
+    if resolution in ROLLUPS:
+        tail_start = max(start, rows[-1].time + resolution) if rows else start
+        rows += await equity_points(session, account, ROLLUPS[resolution], tail_start, end)
+    return rows
+
+
+# The finest resolution still retained back to `start`
+def resolution_for(start: int, now: int) -> int:
+    for resolution in (RAW, HOUR):
+        days = retention_days(resolution)
+        if not days or start >= now - days * DAY:
+            return resolution
+    return DAY
+
+
+# Deepest fall from the running equity peak, in percent. Rollup rows only know their range,
+# so a bucket's low is compared with the peak up to and including that bucket
+def max_drawdown_pct(points: list) -> float:
+    peak = 0.0
+    deepest = 0.0
+    for point in points:
+        peak = max(peak, point.equity_max)
+        if peak > 0:
+            deepest = max(deepest, (peak - point.equity_min) / peak * 100)
+    return round(deepest, 2)
+
+
+class EquitySnapshotter:
+    """Polls account_info() for every provisioned MT5 account on a fixed cadence and appends
+    equity/balance snapshots; rolls them up hourly and daily and applies retention."""
+
+    def __init__(self):
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._maintained_hour: Optional[int] = None
+
+    async def _account_info(self, account: int, password: str, server: str) -> Optional[dict]:
+        async with self._limit:
+            try:
+                async with terminal_pool.session(account, password, server) as terminal:
+                    return await terminal.call("account_info")
+            except MT5Error:
+                self.failures += 1
+                return None
+
+    # One polling round; returns how many snapshots were stored
+    async def snapshot_once(self, now: Optional[int] = None) -> int:
+        now = int(time.time()) if now is None else now
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(config.EQUITY_SNAPSHOT_CONCURRENCY)
+        async with async_session() as session:
+            accounts = await provisioned_accounts(session)
+        with timer("equity.snapshot"):
+            infos = await asyncio.gather(
+                *(self._account_info(account, password, server) for account, (password, server) in accounts.items())
+            )
+        rows = [
+            {
+                "account": account, "resolution": RAW, "time": now, "equity": info["equity"],
+                "equity_min": info["equity"], "equity_max": info["equity"], "balance": info["balance"],
+            }
+            for account, info in zip(accounts, infos) if info
+        ]
+        if rows:
+            async with async_session() as session:
+                await session.execute(insert(EquitySnapshot), rows)
+                await session.commit()
+        return len(rows)
+
+    async def maintain(self, now: Optional[int] = None) -> None:
+        now = int(time.time()) if now is None else now
+        async with async_session() as session:
+            for resolution in ROLLUPS:
+                await downsample(session, resolution, now)
+            await apply_retention(session, now)
+            await session.commit()
+
+    async def run(self) -> None:
+        next_round = time.monotonic()
+        while True:
+            now = int(time.time())
+            try:
+                await self.snapshot_once(now)
+                if now // HOUR != self._maintained_hour:
+                    await self.maintain(now)
+                    self._maintained_hour = now // HOUR
+            except Exception as e:
+                print(f"Equity snapshot failed: {e}")
+            # Fixed cadence; after a round that overran its interval, start again from now
+            next_round = max(next_round + config.EQUITY_SNAPSHOT_INTERVAL, time.monotonic())
+            await asyncio.sleep(next_round - time.monotonic())
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._limit = None
+
+
+equity_snapshotter = EquitySnapshotter()
+
+register_callback(
+    "equity_snapshot_failures_total", "Accounts whose account_info() poll failed.",
+    lambda: equity_snapshotter.failures, "counter",
+)
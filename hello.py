@@ -7,26 +7,57 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, APIRouter, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from sqlmodel import Field, SQLModel, Session, create_engine, select
 from routes.auth import auth_router
 from routes.order import order_router
 from routes.meta import meta_router
-from db import create_db_and_tables
+from routes.metrics import metrics_router
+from routes.bot import bot_router
+from routes.chat import chat_router
+from db import create_db_and_tables, track_queries
+from mailer import outbox_sender
+from auth import password_pool
+from mt5_pool import terminal_pool
+from equity import equity_snapshotter
+from ingest import ingestion_worker
+from conversation import conversation_summarizer
+from metrics import MetricsMiddleware, sampler
+from admission import AdmissionMiddleware
 from contextlib import asynccontextmanager
+import config
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Creating tables...")
-    create_db_and_tables()
-    print("Table created")
+    if config.DB_CREATE_TABLES:
+        print("Creating tables...")
+        await create_db_and_tables()
+        print("Table created")
+    if config.MAIL_SENDER_ENABLED:
+        outbox_sender.start()
+    terminal_pool.start()
+    if config.EQUITY_SNAPSHOT_ENABLED:
+        equity_snapshotter.start()
+    ingestion_worker.start()
+    if config.METRICS_ENABLED and config.METRICS_SLOW_REQUEST_MS:
+        sampler.start()
     try:
         yield
     finally:
+        sampler.stop()
+        await outbox_sender.stop()
+        password_pool.shutdown()
+        await equity_snapshotter.stop()
+        await ingestion_worker.stop()
+        await conversation_summarizer.stop()
+        await terminal_pool.close()
         print("Lifespan context ended")
 
 app = FastAPI(lifespan=lifespan)
 
+# Added before CORS so it runs inside it: rejections still carry the CORS headers
+if config.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -34,11 +65,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Per-request SQL count and time as a Server-Timing header (queries run while a streamed
+# body is still being sent are not included)
+if config.DB_SERVER_TIMING:
+    @app.middleware("http")
+    async def db_server_timing(request, call_next):
+        with track_queries() as stats:
+            response = await call_next(request)
+        response.headers["Server-Timing"] = f'db;desc="{stats.count} queries";dur={stats.seconds * 1000:.1f}'
+        return response
+
+# Outermost, so latency covers the other middleware and streamed bodies
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
 app.include_router(auth_router)
 app.include_router(order_router)
 app.include_router(meta_router)
+app.include_router(bot_router)
+app.include_router(chat_router)
 
 @app.get("/")
 def read_root():
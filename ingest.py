@@ -0,0 +1,273 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from sqlalchemy import delete, insert, update
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+import config
+from chunking import chunk_file
+from db import async_session
+from embeddings import get_embedder
+from metrics import register_callback, timer
+from models.knowledge import Document, DocumentChunk
+from retrieval import embedder_label, forget_chunks, index_chunks, maintain_index
+from storage import blob_store, LocalBlobStore
+
+# How often to look for new chunks while the parser is still writing
+TAIL_INTERVAL = 0.05
+
+
+def _download(key: str, size: int) -> str:
+    fd, path = tempfile.mkstemp(dir=config.BLOB_TMP_DIR or None)
+    with os.fdopen(fd, "wb") as f:
+        if size:
+            for piece in blob_store.iter_range(key, 0, size - 1):
+                f.write(piece)
+    return path
+
+
+# A path the parser can open: the stored file itself, or a temporary copy of an S3 object
+@asynccontextmanager
+async def local_blob(key: str, size: int):
+    if isinstance(blob_store, LocalBlobStore):
+        yield blob_store.path(key)
+        return
+    path = await run_in_threadpool(_download, key, size)
+    try:
+        yield path
+    finally:
+        os.unlink(path)
+
+
+class SpoolReader:
+    """Follows the JSON-lines file a parser process is writing, so embedding starts with
+    the first chunks instead of waiting for the whole document."""
+
+    def __init__(self, path: str, parsing: asyncio.Future):
+        self.path = path
+        self.parsing = parsing
+        self.count = 0
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        with open(self.path, encoding="utf-8") as f:
+            partial = ""
+            while True:
+                finished = self.parsing.done()
+                line = f.readline()
+                if line:
+                    partial += line
+                    if partial.endswith("\n"):
+                        self.count += 1
+                        yield json.loads(partial)
+                        partial = ""
+                    continue
+                if finished:
+                    break
+                await asyncio.sleep(TAIL_INTERVAL)
+        # Surface the parser's exception, if any
+        await self.parsing
+
+
+async def batched(chunks: AsyncIterator[str], size: int) -> AsyncIterator[list[str]]:
+    batch = []
+    async for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestionWorker:
+    """Works through uploaded documents: parse and chunk in a process pool, embed the chunks
+    in batches as they arrive, and store them. Progress is kept on the Document row."""
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            # spawn: the parent has threads (threadpool, DB driver) that fork would copy mid-state
+            self._executor = ProcessPoolExecutor(
+                max_workers=config.INGEST_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    # Take the document from queued to parsing; None when another worker already has it
+    async def _claim(self, document_id: int) -> Optional[Document]:
+        async with async_session() as session:
+            claimed = await session.execute(
+                update(Document)
+                .where(Document.id == document_id, Document.status == "queued")
+                .values(
+                    status="parsing", chunk_count=0, embedded_count=0, error=None, finished_at=None,
+                    updated_at=datetime.utcnow(),
+                )
+            )
+            if not claimed.rowcount:
+                return None
+            # Start clean if an earlier attempt left chunks behind
+            stale = (await session.exec(
+                select(DocumentChunk.id).where(DocumentChunk.document_id == document_id)
+            )).all()
+            await session.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document_id))
+            await session.commit()
+            document = await session.get(Document, document_id)
+        await forget_chunks(document.bot_id, stale)
+        return document
+
+    # Keep updated_at fresh for as long as this worker has the document, so retry doesn't take
+    # a slow parse for an abandoned one
+    async def _heartbeat(self, document_id: int) -> None:
+        while True:
+            await asyncio.sleep(config.INGEST_HEARTBEAT_SECONDS)
+            try:
+                async with async_session() as session:
+                    await session.execute(
+                        update(Document)
+                        .where(Document.id == document_id, Document.status.in_(("parsing", "embedding")))
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    await session.commit()
+            except Exception as e:
+                print(f"Heartbeat for document {document_id} failed: {e}")
+
+    async def _finish(self, document_id: int, **values) -> None:
+        async with async_session() as session:
+            await session.execute(
+                update(Document).where(Document.id == document_id).values(
+                    finished_at=datetime.utcnow(), updated_at=datetime.utcnow(), **values
+                )
+            )
+            await session.commit()
+
+    async def ingest(self, document_id: int) -> None:
+        document = await self._claim(document_id)
+        if document is None:
+            return
+        embedder = get_embedder()
+        label = embedder_label(embedder)
+        fd, spool = tempfile.mkstemp(suffix=".jsonl", dir=config.BLOB_TMP_DIR or None)
+        os.close(fd)
+        heartbeat = asyncio.create_task(self._heartbeat(document.id))
+        try:
+            async with local_blob(document.blob, document.size) as path:
+                parsing = asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), chunk_file, path, document.kind, spool,
+                    config.INGEST_CHUNK_SIZE, config.INGEST_CHUNK_OVERLAP,
+                )
+                reader = SpoolReader(spool, parsing)
+                embedded = 0
+                async for batch in batched(reader, config.EMBEDDING_BATCH_SIZE):
+                    with timer("embed"):
+                        vectors = await embedder.embed(batch)
+                    rows = [
+                        {
+                            "document_id": document.id, "bot_id": document.bot_id, "position": embedded + i,
+                            "text": text, "embedding": vector.astype("<f4").tobytes(),
+                        }
+                        for i, (text, vector) in enumerate(zip(batch, vectors))
+                    ]
+                    embedded += len(rows)
+                    async with async_session() as session:
+                        ids = (await session.execute(
+                            insert(DocumentChunk).returning(DocumentChunk.id, sort_by_parameter_order=True), rows
+                        )).scalars().all()
+                        await session.execute(
+                            update(Document).where(Document.id == document.id).values(
+                                status="embedding" if parsing.done() else "parsing",
+                                chunk_count=reader.count,
+                                embedded_count=embedded,
+                                embedder=label,
+                                updated_at=datetime.utcnow(),
+                            )
+                        )
+                        await session.commit()
+                    await index_chunks(document.bot_id, ids, vectors, label)
+            await self._finish(document.id, status="ready", chunk_count=reader.count, embedded_count=embedded)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            await self._finish(document.id, status="failed", error=f"{type(e).__name__}: {e}"[:500])
+        finally:
+            heartbeat.cancel()
+            os.unlink(spool)
+        # Compact or re-cluster the index once the document's appends are in
+        await maintain_index(document.bot_id)
+
+    async def _work(self) -> None:
+        while True:
+            document_id = await self._queue.get()
+            try:
+                await self.ingest(document_id)
+            except Exception as e:
+                print(f"Ingestion of document {document_id} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(config.INGEST_CONCURRENCY)]
+
+    def submit(self, document_id: int) -> None:
+        self._ensure_started()
+        self._queue.put_nowait(document_id)
+
+    async def _resume(self) -> None:
+        try:
+            async with async_session() as session:
+                queued = (await session.exec(
+                    select(Document.id).where(Document.status == "queued").order_by(Document.id)
+                )).all()
+        except Exception as e:
+            print(f"Could not resume queued documents: {e}")
+            return
+        for document_id in queued:
+            self.submit(document_id)
+
+    # Start the workers and pick up documents that were still queued when the last process
+    # stopped (in the background, so startup doesn't wait on the database)
+    def start(self) -> None:
+        self._ensure_started()
+        self._tasks.append(asyncio.create_task(self._resume()))
+
+    # Wait until everything submitted so far has been processed
+    async def join(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+ingestion_worker = IngestionWorker()
+
+register_callback(
+    "ingest_queue_depth", "Documents waiting for ingestion.",
+    lambda: ingestion_worker._queue.qsize() if ingestion_worker._queue is not None else 0,
+)
+register_callback("ingest_documents_total", "Documents ingested.", lambda: ingestion_worker.processed, "counter")
+register_callback("ingest_failures_total", "Documents that failed ingestion.", lambda: ingestion_worker.failed, "counter")
@@ -0,0 +1,85 @@
+import asyncio
+import importlib
+import re
+from typing import AsyncIterator, Optional, Protocol
+import config
+
+
+class ChatModel(Protocol):
+    """Streams the reply to a list of {"role", "content"} messages (system, user, assistant)
+    as text pieces, in order."""
+
+    name: str
+
+    def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        ...
+
+
+_WORD = re.compile(r"\S+\s*")
+
+
+class FakeChatModel:
+    """Offline stand-in: answers with the start of the text after the system prompt's last
+    "Context:" or "New turns:" heading, a word at a time, LLM_FAKE_TOKEN_DELAY seconds apart.
+    Deterministic, for tests and local runs."""
+
+    name = "fake"
+
+    def __init__(self, delay: float = 0.0, words: int = 40):
+        self.delay = delay
+        self.words = words
+        self.calls = 0
+
+    def reply(self, messages: list[dict]) -> str:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        context = re.split(r"^(?:Context|New turns):$", system, flags=re.MULTILINE)[-1] if system else ""
+        context = " ".join(context.split()[:self.words])
+        if not context:
+            return f"I could not find anything about \"{question}\" in this bot's documents."
+        return context
+
+    async def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        self.calls += 1
+        for word in _WORD.findall(self.reply(messages)):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield word
+
+
+class GoogleChatModel:
+    """Gemini chat through langchain-google-genai."""
+
+    name = "google"
+
+    def __init__(self, model: str):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        self.client = ChatGoogleGenerativeAI(model=model, google_api_key=config.GOOGLE_API_KEY or None)
+
+    async def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        async for chunk in self.client.astream([(m["role"], m["content"]) for m in messages]):
+            if chunk.content:
+                yield chunk.content
+
+
+def _make_chat_model():
+    provider = config.LLM_PROVIDER
+    if provider == "fake":
+        return FakeChatModel(config.LLM_FAKE_TOKEN_DELAY)
+    if provider == "google":
+        return GoogleChatModel(config.LLM_MODEL)
+    # "package.module:ClassName", constructed without arguments
+    module, _, name = provider.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+_chat_model: Optional[ChatModel] = None
+
+
+# The configured provider, created on first use
+def get_chat_model() -> ChatModel:
+    global _chat_model
+    if _chat_model is None:
+        _chat_model = _make_chat_model()
+    return _chat_model
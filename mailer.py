@@ -0,0 +1,216 @@
+import asyncio
+import smtplib
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from sqlalchemy import event
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+from metrics import timer
+from db import async_session
+from models.mail import OutboxMail
+
+
+# Queue an email in the caller's session; it is sent once the caller commits
+def queue_email(session: AsyncSession, to_email: str, subject: str, body: str) -> OutboxMail:
+    mail = OutboxMail(to_email=to_email, subject=subject, body=body)
+    session.add(mail)
+    event.listen(session.sync_session, "after_commit", lambda _: outbox_sender.notify(), once=True)
+    return mail
+
+
+def build_message(mail: OutboxMail) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = mail.subject
+    message["From"] = config.MAIL_FROM
+    message["To"] = mail.to_email
+    message.attach(MIMEText(mail.body, "plain"))
+    return message
+
+
+# Delay before the next attempt: exponential backoff capped at MAIL_RETRY_MAX_SECONDS
+def retry_delay(attempts: int) -> timedelta:
+    delay = config.MAIL_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, config.MAIL_RETRY_MAX_SECONDS))
+
+
+class SMTPUnavailable(Exception):
+    """The SMTP server could not be reached or refused the login."""
+
+
+class SMTPConnection:
+    """A long-lived SMTP connection that is reopened only when it goes stale."""
+
+    def __init__(self):
+        self._server: smtplib.SMTP | None = None
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT)
+        if config.SMTP_STARTTLS:
+            server.starttls()
+        if config.SMTP_USERNAME:
+            server.login(config.SMTP_USERNAME, config.SMTP_PASSWORD)
+        return server
+
+    def get(self) -> smtplib.SMTP:
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        try:
+            self._server = self._connect()
+        except (smtplib.SMTPException, OSError) as e:
+            raise SMTPUnavailable(str(e) or type(e).__name__) from e
+        return self._server
+
+    def send(self, mail: OutboxMail) -> None:
+        message = build_message(mail)
+        try:
+            self.get().sendmail(config.MAIL_FROM, [mail.to_email], message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection between noop() and sendmail()
+            self.close()
+            self.get().sendmail(config.MAIL_FROM, [mail.to_email], message.as_string())
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+
+class OutboxSender:
+    """Drains pending OutboxMail rows in batches over a reused SMTP connection."""
+
+    def __init__(self):
+        self.connection = SMTPConnection()
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    # Send a batch over the pooled connection; returns the error (or None) for each message sent,
+    # and the SMTPUnavailable that stopped the batch early, if the server couldn't be reached
+    def _send_batch(self, batch: list[OutboxMail]) -> tuple[list[Exception | None], SMTPUnavailable | None]:
+        results = []
+        for mail in batch:
+            try:
+                with timer("smtp.send"):
+                    self.connection.send(mail)
+            except SMTPUnavailable as e:
+                return results, e
+            except (smtplib.SMTPException, OSError) as e:
+                self.connection.close()
+                results.append(e)
+            else:
+                results.append(None)
+        return results, None
+
+    # Lease up to MAIL_BATCH_SIZE due messages to this sender: they are marked "sending" until
+    # MAIL_LEASE_SECONDS from now and the claim is committed at once, so no row lock is held
+    # while talking to the SMTP server. Messages whose lease ran out (their sender died) are due again
+    async def _claim(self) -> list[OutboxMail]:
+        now = datetime.utcnow()
+        async with async_session() as session:
+            statement = (
+                select(OutboxMail)
+                .where(OutboxMail.status.in_(("pending", "sending")), OutboxMail.next_attempt_at <= now)
+                .order_by(OutboxMail.id)
+                .limit(config.MAIL_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            batch = (await session.exec(statement)).all()
+            lease = now + timedelta(seconds=config.MAIL_LEASE_SECONDS)
+            for mail in batch:
+                mail.status = "sending"
+                mail.next_attempt_at = lease
+                session.add(mail)
+            await session.commit()
+            return batch
+
+    # Claim and send one batch of due messages; returns how many were processed
+    async def drain_once(self) -> int:
+        batch = await self._claim()
+        if not batch:
+            return 0
+        results, unavailable = await asyncio.to_thread(self._send_batch, batch)
+        now = datetime.utcnow()
+        async with async_session() as session:
+            for index, mail in enumerate(batch):
+                if index >= len(results):
+                    # Not sent because the server was unreachable: back in the queue without using an attempt
+                    mail.status = "pending"
+                    mail.last_error = str(unavailable)[:500]
+                    mail.next_attempt_at = now + retry_delay(max(mail.attempts, 1))
+                    session.add(mail)
+                    continue
+                error = results[index]
+                mail.attempts += 1
+                if error is not None:
+                    mail.last_error = str(error)[:500]
+                    if mail.attempts >= config.MAIL_MAX_ATTEMPTS:
+                        mail.status = "failed"
+                    else:
+                        mail.status = "pending"
+                        mail.next_attempt_at = now + retry_delay(mail.attempts)
+                else:
+                    mail.status = "sent"
+                    mail.sent_at = now
+                    mail.last_error = None
+                session.add(mail)
+            await session.commit()
+        return len(results)
+
+    # Wake the sender early; safe to call from the event loop or a threadpool route
+    def notify(self) -> None:
+        if self._loop is None or self._wakeup is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                print(f"Outbox drain failed: {e}")
+                processed = 0
+            # A full batch means there is probably more waiting; go again right away
+            if processed >= config.MAIL_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.MAIL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await asyncio.to_thread(self.connection.close)
+
+
+outbox_sender = OutboxSender()
@@ -0,0 +1,240 @@
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+import config
+
+# Innermost frames kept per stack sample
+STACK_DEPTH = 8
+
+# Latency buckets in seconds, from a cache hit to a slow MT5 sync
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        # Snapshot under the lock: a request adding a label set mid-iteration would break the loop
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        # The bucket lists are updated in place, so copy them too
+        with self._lock:
+            values = [(labels, (list(counts), total)) for labels, (counts, total) in self._values.items()]
+        for labels, (counts, total) in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """A value read at scrape time, e.g. a pool's in-flight count or a cache's hit total.
+
+    With labelnames, read() returns {label values tuple: value} instead of a single value.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable, kind: str = "gauge", labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        self.labelnames = labelnames
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if not self.labelnames:
+            return lines + [f"{self.name} {self.read():g}"]
+        for labels, value in sorted(self.read().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+requests_total = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+operation_seconds = Histogram("app_operation_duration_seconds", "Latency of named hot-path operations.", ("op",))
+
+_registry: list = [requests_total, request_seconds, operation_seconds]
+
+
+def register_callback(name: str, help: str, read: Callable, kind: str = "gauge", labelnames: tuple = ()) -> None:
+    _registry.append(Callback(name, help, read, kind, labelnames))
+
+
+# Prometheus text exposition format
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def _timed(op: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation_seconds.observe(time.perf_counter() - start, op)
+
+
+_disabled = nullcontext()
+
+
+# Time a hot path under app_operation_duration_seconds{op=...}; a shared no-op when metrics are off:
+#     with timer("bcrypt"):
+#         ...
+def timer(op: str):
+    if not config.METRICS_ENABLED:
+        return _disabled
+    return _timed(op)
+
+
+def observe(op: str, seconds: float) -> None:
+    if config.METRICS_ENABLED:
+        operation_seconds.observe(seconds, op)
+
+
+class StackSampler:
+    """Samples the event loop thread's stack every few ms into a short ring buffer.
+
+    When a request turns out slow, the samples taken while it ran show where the
+    loop was spending its time (for this request or whatever was blocking it).
+    """
+
+    def __init__(self, interval: float, window: float):
+        self.interval = interval
+        self._samples: deque = deque(maxlen=max(1, int(window / interval)))
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_name == "_run_once":
+                    # Everything below is the event loop itself
+                    break
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            idle = stack and stack[0].startswith("selectors.py:select:")
+            self._samples.append((time.perf_counter(), "<idle>" if idle else ";".join(reversed(stack[:STACK_DEPTH]))))
+
+    # Collapsed stacks sampled between start and end, most frequent first
+    def report(self, start: float, end: float, top: int = 10) -> list[tuple[str, int]]:
+        tally = Tally(stack for at, stack in list(self._samples) if start <= at <= end)
+        return tally.most_common(top)
+
+
+sampler = StackSampler(config.METRICS_PROFILE_INTERVAL, config.METRICS_PROFILE_WINDOW)
+
+
+def _report_slow(method: str, route: str, start: float, end: float) -> None:
+    stacks = sampler.report(start, end)
+    print(f"Slow request: {method} {route} took {(end - start) * 1000:.0f} ms; {sum(n for _, n in stacks)} samples")
+    for stack, count in stacks:
+        print(f"  {count:4d}  {stack}")
+
+
+class MetricsMiddleware:
+    """Per-route request count, status and latency; plain ASGI so streamed bodies are timed to the last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            requests_total.inc(scope["method"], route, status)
+            request_seconds.observe(end - start, scope["method"], route)
+            threshold = config.METRICS_SLOW_REQUEST_MS
+            if threshold and (end - start) * 1000 >= threshold:
+                _report_slow(scope["method"], route, start, end)
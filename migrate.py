@@ -0,0 +1,166 @@
+"""Create the database schema and bring an existing one up to date.
+
+Run once per deploy, before the new release takes traffic:
+
+    python migrate.py
+
+The app itself no longer touches the schema on startup (see DB_CREATE_TABLES),
+so serverless cold starts skip the round trips create_all makes.
+
+create_all only creates missing tables (and db.py the missing indexes), so the
+changes it can't make to a database that already has data run first:
+- columns added to existing tables are added, and filled in where needed;
+- order screenshots move out of ordermodel.img into the blob store, and img
+  is dropped;
+- before the unique indexes on user.email, ordermodel.txid and
+  completeordermodel.order_id are created, existing duplicates stop the
+  migration with a list of them to clean up.
+Every step checks the live schema first, so running it again is a no-op, and
+an interrupted screenshot move picks up where it stopped.
+"""
+import asyncio
+from datetime import datetime
+from sqlalchemy import column, func, inspect, select
+from sqlmodel import SQLModel
+from db import create_db_and_tables, engine
+from storage import blob_store, make_thumbnail, sniff_image_type
+# Every table model must be imported so SQLModel.metadata knows about it
+import models.user  # noqa: F401
+import models.order  # noqa: F401
+import models.mail  # noqa: F401
+import models.deal  # noqa: F401
+import models.equity  # noqa: F401
+import models.knowledge  # noqa: F401
+import models.conversation  # noqa: F401
+
+# Columns added to tables that existed before them: (table, column, value for existing rows)
+ADDED_COLUMNS = (
+    ("ordermodel", "img_blob", None),
+    ("ordermodel", "img_size", None),
+    ("ordermodel", "img_content_type", None),
+    ("ordermodel", "img_thumb", None),
+    ("ordermodel", "created_at", datetime.utcnow),
+    ("accountsync", "balance", None),
+    ("document", "updated_at", datetime.utcnow),
+)
+
+# Unique indexes added over columns that may already hold duplicates: (table, column)
+UNIQUE_COLUMNS = (
+    ("user", "email"),
+    ("ordermodel", "txid"),
+    ("completeordermodel", "order_id"),
+)
+
+# Screenshots moved to the blob store per transaction
+IMAGE_BATCH_SIZE = 100
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _columns(conn, table: str) -> set[str]:
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return set()
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+# Add the missing columns as nullable and fill them in; the model's NOT NULL is applied once
+# the data is there (Postgres only: SQLite can't alter a column in place). The screenshot
+# columns are filled by _move_order_images
+def _add_columns(conn) -> None:
+    for name, column_name, fill in ADDED_COLUMNS:
+        existing = _columns(conn, name)
+        if not existing or column_name in existing:
+            continue
+        table = SQLModel.metadata.tables[name]
+        sql_type = table.c[column_name].type.compile(dialect=conn.dialect)
+        quoted = conn.dialect.identifier_preparer.format_table(table)
+        conn.exec_driver_sql(f"ALTER TABLE {quoted} ADD COLUMN {column_name} {sql_type}")
+        if fill is not None:
+            conn.execute(table.update().values({column_name: fill()}))
+            if not table.c[column_name].nullable and conn.dialect.name == "postgresql":
+                conn.exec_driver_sql(f"ALTER TABLE {quoted} ALTER COLUMN {column_name} SET NOT NULL")
+        print(f"Added {name}.{column_name}")
+        conn.commit()
+
+
+# Move the bytes in ordermodel.img into the blob store, a batch per transaction, then drop img
+def _move_order_images(conn) -> None:
+    if "img" not in _columns(conn, "ordermodel"):
+        return
+    table = SQLModel.metadata.tables["ordermodel"]
+    img = column("img")
+    moved = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, img).select_from(table).where(table.c.img_blob.is_(None))
+            .order_by(table.c.id).limit(IMAGE_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for order_id, data in rows:
+            data = bytes(data or b"")
+            key = blob_store.put_bytes(data)
+            conn.execute(table.update().where(table.c.id == order_id).values(
+                img_blob=key,
+                img_size=len(data),
+                # Served as application/octet-stream if it isn't an image (see get_order_image)
+                img_content_type=sniff_image_type(data[:12]) or "application/octet-stream",
+                img_thumb=make_thumbnail(key),
+            ))
+        conn.commit()
+        moved += len(rows)
+        print(f"Moved {moved} order screenshots to the blob store")
+    if conn.dialect.name == "postgresql":
+        for name in ("img_blob", "img_size", "img_content_type"):
+            conn.exec_driver_sql(f"ALTER TABLE ordermodel ALTER COLUMN {name} SET NOT NULL")
+    conn.exec_driver_sql("ALTER TABLE ordermodel DROP COLUMN img")
+    conn.commit()
+    print("Dropped ordermodel.img")
+
+
+# Refuse to go on while a column about to get a unique index still has duplicates
+def _check_unique(conn) -> None:
+    problems = []
+    for name, column_name in UNIQUE_COLUMNS:
+        if column_name not in _columns(conn, name):
+            continue
+        indexes = inspect(conn).get_indexes(name)
+        if any(index["unique"] and index["column_names"] == [column_name] for index in indexes):
+            continue
+        table = SQLModel.metadata.tables[name]
+        values = table.c[column_name]
+        duplicates = conn.execute(
+            select(values, func.count()).group_by(values).having(func.count() > 1).limit(10)
+        ).all()
+        if duplicates:
+            listed = ", ".join(f"{value!r} ({count} rows)" for value, count in duplicates)
+            problems.append(f"{name}.{column_name} must be unique before its index is created; duplicates: {listed}")
+    if problems:
+        raise MigrationError("\n".join(problems))
+
+
+def upgrade(conn) -> None:
+    _add_columns(conn)
+    _move_order_images(conn)
+    _check_unique(conn)
+
+
+async def main():
+    print("Updating existing tables...")
+    try:
+        async with engine.connect() as conn:
+            await conn.run_sync(upgrade)
+    except MigrationError as e:
+        await engine.dispose()
+        raise SystemExit(f"Migration stopped:\n{e}")
+    print("Creating tables...")
+    await create_db_and_tables()
+    await engine.dispose()
+    print("Tables created")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
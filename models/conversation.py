@@ -0,0 +1,29 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
+from datetime import datetime
+from typing import Optional
+
+# A user's conversation with one bot: a rolling summary of the older turns; the recent
+# ones are kept verbatim as ConversationTurn rows until they are folded into it
+class Conversation(SQLModel, table=True):
+    __table_args__ = (Index("ix_conversation_user_bot", "user_id", "bot_id", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    bot_id: str
+    summary: str = ""
+    summarized_through: int = 0  # seq of the last turn folded into the summary
+    last_seq: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+# One message of a conversation; seq counts up from 1 per conversation
+class ConversationTurn(SQLModel, table=True):
+    __table_args__ = (Index("ix_conversationturn_conversation_seq", "conversation_id", "seq", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: int = Field(foreign_key="conversation.id")
+    seq: int
+    role: str  # user | assistant
+    content: str
+    tokens: int  # estimated when stored, so packing a prompt never re-counts history
+    created_at: datetime = Field(default_factory=datetime.utcnow)
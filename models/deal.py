@@ -0,0 +1,29 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import BigInteger, Index
+from datetime import datetime
+from typing import Optional
+
+# A closed MT5 deal, stored once per (account, ticket)
+class Deal(SQLModel, table=True):
+    __table_args__ = (Index("ix_deal_account_time", "account", "time"),)
+
+    account: int = Field(sa_type=BigInteger, primary_key=True)
+    ticket: int = Field(sa_type=BigInteger, primary_key=True)
+    time: int = Field(sa_type=BigInteger)  # unix seconds, as reported by the terminal
+    type: int
+    entry: int = 0
+    volume: float
+    price: float
+    profit: float
+    commission: float = 0.0
+    swap: float = 0.0
+    symbol: str
+
+# Per-account sync state: the high-water mark plus running totals over every stored deal
+class AccountSync(SQLModel, table=True):
+    account: int = Field(sa_type=BigInteger, primary_key=True)
+    last_deal_time: int = Field(default=0, sa_type=BigInteger)
+    deal_count: int = 0
+    total_pnl: float = 0.0
+    balance: Optional[float] = None  # account balance reported at the last sync
+    synced_at: Optional[datetime] = None
@@ -0,0 +1,17 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import BigInteger, Index
+
+# One equity/balance point of an MT5 account. resolution 0 rows are raw polls; a rollup row
+# (resolution = bucket width in seconds) holds the bucket's closing equity and balance plus
+# the lowest and highest equity seen in it
+class EquitySnapshot(SQLModel, table=True):
+    # Rollups and retention walk one resolution by time
+    __table_args__ = (Index("ix_equitysnapshot_resolution_time", "resolution", "time"),)
+
+    account: int = Field(sa_type=BigInteger, primary_key=True)
+    resolution: int = Field(default=0, primary_key=True)
+    time: int = Field(sa_type=BigInteger, primary_key=True)  # unix seconds; bucket start for rollups
+    equity: float
+    equity_min: float
+    equity_max: float
+    balance: float
@@ -0,0 +1,33 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, LargeBinary
+from datetime import datetime
+from typing import Optional
+
+# A file uploaded to a bot's knowledge base; the bytes live in the blob store.
+# status: queued -> parsing -> embedding -> ready (or failed, with error)
+class Document(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    bot_id: str = Field(index=True)
+    filename: str
+    kind: str  # html | text | pdf
+    blob: str
+    size: int
+    status: str = Field(default="queued", index=True)
+    chunk_count: int = 0  # chunks produced by the parser so far
+    embedded_count: int = 0
+    embedder: Optional[str] = None  # provider name and dimension the chunks were embedded with
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)  # last status or progress change
+    finished_at: Optional[datetime] = None
+
+# One chunk of a document's text and its embedding (float32, little-endian)
+class DocumentChunk(SQLModel, table=True):
+    __table_args__ = (Index("ix_documentchunk_document_position", "document_id", "position", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    document_id: int = Field(foreign_key="document.id")
+    bot_id: str = Field(index=True)
+    position: int
+    text: str
+    embedding: bytes = Field(sa_type=LargeBinary)
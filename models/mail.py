@@ -1,19 +1,18 @@
-def send_email(email: str, subject: str, message: str):
-    sender_email = "raibadar37218@gmail.com"
-    receiver_email = email
-    password = "aqojinprzpqfhlxk"
+from sqlmodel import SQLModel, Field
+from datetime import datetime
+from typing import Optional
 
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = receiver_email
-    msg["Subject"] = subject
-
-    msg.attach(MIMEText(message, "plain"))
-
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, msg.as_string())
-    except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+# Outgoing email, written in the same transaction as the row that triggered it
+# and delivered later by mailer.OutboxSender
+class OutboxMail(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    to_email: str
+    subject: str
+    body: str
+    status: str = Field(default="pending", index=True)  # pending | sending | sent | failed
+    attempts: int = 0
+    last_error: Optional[str] = None
+    # When it is next due; while "sending", when the sender's lease on it runs out
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
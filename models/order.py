@@ -0,0 +1,75 @@
+from sqlmodel import SQLModel, Field
+from sqlalchemy import event
+from datetime import datetime
+from typing import Optional
+
+class OrderModel(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    username: str
+    email: str = Field(index=True)
+    challenge_type: str
+    account_size: str
+    platform: str
+    payment_method: str
+    txid: str = Field(unique=True, index=True)  # a payment can only pay for one order
+    # Payment screenshot, stored in the blob store under its sha256
+    img_blob: str
+    img_size: int
+    img_content_type: str
+    img_thumb: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class CompleteOrderModel(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    order_id: int = Field(foreign_key="ordermodel.id", unique=True, index=True)  # one account per order
+    server: str
+    platform_login: str
+    platform_password: str
+
+# Search indexes for /order/orders/search (see order_search.py), created next to the tables.
+# Postgres: a stored tsvector of username, email (also split at "@" and "." so its user and
+# domain parts are words), txid and challenge type, under a GIN index; stored so ranking
+# doesn't re-parse every match
+ORDER_SEARCH_POSTGRES = (
+    "ALTER TABLE ordermodel ADD COLUMN IF NOT EXISTS search_document tsvector GENERATED ALWAYS AS ("
+    "to_tsvector('simple'::regconfig, username || ' ' || email || ' ' || translate(email, '@.', '  ')"
+    " || ' ' || txid || ' ' || challenge_type)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_ordermodel_search ON ordermodel USING gin (search_document)",
+)
+
+# SQLite: an FTS5 trigram table over the same fields, kept in step with ordermodel by triggers
+# and filled from it when first created
+ORDER_SEARCH_SQLITE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ordermodel_search USING fts5("
+    "username, email, txid, challenge_type, content='ordermodel', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS ordermodel_search_insert AFTER INSERT ON ordermodel BEGIN "
+    "INSERT INTO ordermodel_search(rowid, username, email, txid, challenge_type) "
+    "VALUES (new.id, new.username, new.email, new.txid, new.challenge_type); END",
+    "CREATE TRIGGER IF NOT EXISTS ordermodel_search_delete AFTER DELETE ON ordermodel BEGIN "
+    "INSERT INTO ordermodel_search(ordermodel_search, rowid, username, email, txid, challenge_type) "
+    "VALUES ('delete', old.id, old.username, old.email, old.txid, old.challenge_type); END",
+    "CREATE TRIGGER IF NOT EXISTS ordermodel_search_update AFTER UPDATE ON ordermodel BEGIN "
+    "INSERT INTO ordermodel_search(ordermodel_search, rowid, username, email, txid, challenge_type) "
+    "VALUES ('delete', old.id, old.username, old.email, old.txid, old.challenge_type); "
+    "INSERT INTO ordermodel_search(rowid, username, email, txid, challenge_type) "
+    "VALUES (new.id, new.username, new.email, new.txid, new.challenge_type); END",
+)
+
+# Runs on every create_all, so existing databases get the indexes too
+@event.listens_for(SQLModel.metadata, "after_create")
+def _create_order_search_index(target, connection, **kw) -> None:
+    if connection.dialect.name == "postgresql":
+        # ALTER TABLE locks the table even when there is nothing to do
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM information_schema.columns"
+            " WHERE table_schema = current_schema() AND table_name = 'ordermodel' AND column_name = 'search_document'"
+        ).first()
+        statements = ORDER_SEARCH_POSTGRES[1:] if exists else ORDER_SEARCH_POSTGRES
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+    elif connection.dialect.name == "sqlite":
+        exists = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'ordermodel_search'").first()
+        for statement in ORDER_SEARCH_SQLITE:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            connection.exec_driver_sql("INSERT INTO ordermodel_search(ordermodel_search) VALUES ('rebuild')")
@@ -1,12 +1,15 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Index
 from datetime import datetime
 from typing import Optional  # Keep the import for Optional
 from pydantic import EmailStr
 
 class User(SQLModel, table=True):
+    # /auth/users?sort=created_at walks (created_at, id)
+    __table_args__ = (Index("ix_user_created_at_id", "created_at", "id"),)
+
     id: int | None = Field(default=None, primary_key=True)
     username: str
-    email: EmailStr
+    email: EmailStr = Field(unique=True, index=True)  # signup and login look users up by email
     hashed_password: str
     name: str
     phone_no: str
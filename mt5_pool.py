@@ -0,0 +1,262 @@
+import asyncio
+import importlib
+import multiprocessing
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+import config
+from metrics import timer
+
+
+class MT5Error(Exception):
+    """A MetaTrader5 call failed inside a terminal worker."""
+
+
+class MT5InitError(MT5Error):
+    pass
+
+
+class MT5LoginError(MT5Error):
+    pass
+
+
+class MT5BusyError(MT5Error):
+    """No terminal worker became free within MT5_ACQUIRE_TIMEOUT."""
+
+
+# Turn MT5 namedtuples (and tuples of them) into plain, picklable dicts
+def _to_plain(value: Any) -> Any:
+    if hasattr(value, "_asdict"):
+        return value._asdict()
+    if isinstance(value, (tuple, list)):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+# Body of a worker process: owns one MetaTrader5 module (and so one terminal session)
+def _worker_main(conn, module_name: str, terminal_path: str) -> None:
+    mt5 = importlib.import_module(module_name)
+    initialized = False
+    credentials = None
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            op, payload = message
+            try:
+                if op == "ping":
+                    conn.send(("ok", True))
+                    continue
+                if not initialized:
+                    initialized = bool(mt5.initialize(terminal_path) if terminal_path else mt5.initialize())
+                    if not initialized:
+                        conn.send(("init", f"initialize() failed: {mt5.last_error()}"))
+                        continue
+                account, password, server = payload["credentials"]
+                if credentials != (account, password, server):
+                    credentials = None
+                    if not mt5.login(account, password=password, server=server):
+                        conn.send(("login", f"login() failed: {mt5.last_error()}"))
+                        continue
+                    credentials = (account, password, server)
+                result = getattr(mt5, payload["method"])(*payload.get("args", ()))
+                conn.send(("ok", _to_plain(result)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        if initialized:
+            mt5.shutdown()
+
+
+class TerminalWorker:
+    """Parent-side handle for one worker process."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.lock = asyncio.Lock()
+        self.account: Optional[int] = None
+        self.last_used = time.monotonic()
+        self._process = None
+        self._conn = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    # Runs in a thread; the process and its pipe are published together once the process is up
+    def start(self) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, config.MT5_MODULE, config.MT5_TERMINAL_PATH),
+            name=f"mt5-worker-{self.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self.account = None
+        self._process, self._conn = process, parent_conn
+
+    def stop(self) -> None:
+        process, conn = self._process, self._conn
+        self._process = None
+        self._conn = None
+        self.account = None
+        if process is None or conn is None:
+            # Never started, or start() hasn't finished (see TerminalPool.close)
+            return
+        try:
+            conn.send(None)
+            process.join(timeout=5)
+        except (OSError, EOFError):
+            pass
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _roundtrip(self, message, timeout: float):
+        self._conn.send(message)
+        if not self._conn.poll(timeout):
+            raise TimeoutError(f"MT5 worker {self.index} did not answer within {timeout}s")
+        return self._conn.recv()
+
+    async def request(self, op: str, payload: Optional[dict] = None) -> Any:
+        try:
+            with timer(f"mt5.{payload['method']}" if op == "call" else f"mt5.{op}"):
+                reply = await asyncio.to_thread(self._roundtrip, (op, payload), config.MT5_CALL_TIMEOUT)
+        except (TimeoutError, OSError, EOFError) as e:
+            # A hung or crashed terminal is not trusted again
+            await asyncio.to_thread(self.stop)
+            raise MT5Error(str(e))
+        status, value = reply
+        if status == "ok":
+            return value
+        if status == "init":
+            raise MT5InitError(value)
+        if status == "login":
+            self.account = None
+            raise MT5LoginError(value)
+        raise MT5Error(value)
+
+
+class TerminalSession:
+    """A worker checked out for one account; calls go to that account's terminal."""
+
+    def __init__(self, worker: TerminalWorker, credentials: tuple):
+        self.worker = worker
+        self.credentials = credentials
+
+    async def call(self, method: str, *args) -> Any:
+        return await self.worker.request("call", {"credentials": self.credentials, "method": method, "args": args})
+
+
+class TerminalPool:
+    """Long-lived MT5 worker processes, routed by account, with idle eviction and health checks."""
+
+    def __init__(self, size: int):
+        self.workers = [TerminalWorker(i) for i in range(size)]
+        self._reaper: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._closed = False
+
+    def _pick(self, account: int) -> TerminalWorker:
+        free = [w for w in self.workers if not w.lock.locked()]
+        # Prefer the worker already logged into this account, then any started one, then the least recently used
+        for worker in free:
+            if worker.account == account and worker.alive:
+                return worker
+        started = [w for w in free if w.alive and w.account is None]
+        if started:
+            return started[0]
+        return min(free, key=lambda w: (w.alive, w.last_used))
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise MT5Error("The MetaTrader5 pool is shut down")
+
+    @asynccontextmanager
+    async def session(self, account: int, password: str, server: str):
+        self._check_open()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(len(self.workers))
+        slots = self._slots
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=config.MT5_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise MT5BusyError("All MetaTrader5 terminals are busy")
+        try:
+            # close() takes the worker locks without slots, so it may have started meanwhile
+            self._check_open()
+            worker = self._pick(account)
+            async with worker.lock:
+                self._check_open()
+                if not worker.alive:
+                    await asyncio.to_thread(worker.start)
+                try:
+                    yield TerminalSession(worker, (account, password, server))
+                    worker.account = account
+                finally:
+                    worker.last_used = time.monotonic()
+        finally:
+            slots.release()
+
+    # Ping idle workers, and stop those that are dead or idle past MT5_IDLE_TIMEOUT
+    async def check(self) -> None:
+        if self._slots is None or self._closed:
+            return
+        for worker in self.workers:
+            if worker.lock.locked() or worker._process is None:
+                continue
+            # Hold a slot like a request would, so session() always finds a free worker
+            async with self._slots:
+                if worker.lock.locked():
+                    continue
+                async with worker.lock:
+                    if time.monotonic() - worker.last_used > config.MT5_IDLE_TIMEOUT or not worker.alive:
+                        await asyncio.to_thread(worker.stop)
+                        continue
+                    try:
+                        await worker.request("ping")
+                    except MT5Error:
+                        pass
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(config.MT5_HEALTH_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"MT5 pool health check failed: {e}")
+
+    def start(self) -> None:
+        self._closed = False
+        self._reaper = asyncio.create_task(self._reap())
+
+    # New sessions fail with MT5Error from here on; those already running finish first
+    async def close(self) -> None:
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for worker in self.workers:
+            # Let a worker that is starting up or answering a call finish first
+            try:
+                await asyncio.wait_for(worker.lock.acquire(), timeout=config.MT5_CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(worker.stop)
+                continue
+            try:
+                await asyncio.to_thread(worker.stop)
+            finally:
+                worker.lock.release()
+        self._slots = None
+
+
+terminal_pool = TerminalPool(config.MT5_POOL_SIZE)
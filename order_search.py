@@ -0,0 +1,39 @@
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import column, func, join, literal_column, table
+from models.order import OrderModel
+
+# Words of a query that count; the rest are ignored
+MAX_SEARCH_TERMS = 8
+
+# Trigram matching can't use anything shorter
+MIN_TERM_LENGTH = 3
+
+_search_table = table("ordermodel_search", column("rowid"), column("rank"))
+
+
+# Postgres: every word must prefix-match a word of username, email, txid or challenge type, best
+# ts_rank_cd first, through the GIN index on ordermodel.search_document
+def _postgres_search(terms: list[str]) -> tuple[list, object, None]:
+    query = " & ".join("'" + term.replace("\\", "\\\\").replace("'", "''") + "':*" for term in terms)
+    tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), query)
+    document = literal_column("ordermodel.search_document")
+    return [document.op("@@")(tsquery)], -func.ts_rank_cd(document, tsquery), None
+
+
+# SQLite: every word must occur somewhere in those fields (FTS5 trigrams), best bm25 first
+def _sqlite_search(terms: list[str]) -> tuple[list, object, object]:
+    terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        raise HTTPException(status_code=400, detail=f"Search words need at least {MIN_TERM_LENGTH} characters")
+    query = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    source = join(OrderModel, _search_table, _search_table.c.rowid == OrderModel.id)
+    return [literal_column("ordermodel_search").op("MATCH")(query)], _search_table.c.rank, source
+
+
+# Filters, rank (ascending is best first) and FROM clause of an order search, for list_response
+def order_search(dialect: str, q: str) -> tuple[list, object, Optional[object]]:
+    terms = q.lower().split()[:MAX_SEARCH_TERMS]
+    if dialect == "postgresql":
+        return _postgres_search(terms)
+    return _sqlite_search(terms)
@@ -0,0 +1,216 @@
+import base64
+import json
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Callable, Optional
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import and_, or_, select
+import config
+
+# Public field name -> (columns it needs, function turning a result row into the value)
+FieldSpec = dict[str, tuple[list, Callable[[Any], Any]]]
+
+NDJSON_BATCH_SIZE = 1000
+
+
+class ColumnValue:
+    """Renders a field that is one column as stored; compiled serializers read it by position instead."""
+
+    def __init__(self, key: str):
+        self.key = key
+
+    def __call__(self, row):
+        return getattr(row, self.key)
+
+
+def column_field(column) -> tuple[list, Callable[[Any], Any]]:
+    return [column], ColumnValue(column.key)
+
+
+# Resolve ?fields=a,b,c against a spec; no fields means every field
+def parse_fields(fields: Optional[str], spec: FieldSpec) -> FieldSpec:
+    if not fields:
+        return spec
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in spec]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(spec)}",
+        )
+    return {name: spec[name] for name in names}
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_columns: list) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(key_columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(v) if _python_type(column) is datetime else v
+            for column, v in zip(key_columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# Lexicographic "(k1, k2, ...) > (v1, v2, ...)" that works on both Postgres and SQLite
+def _after(key_columns: list, values: list):
+    clauses = []
+    for i, column in enumerate(key_columns):
+        equal = [key_columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+
+# Columns a field selection reads, in SELECT order, one entry per (table, column)
+def _columns(selected: FieldSpec) -> dict:
+    columns = {}
+    for needed, _ in selected.values():
+        for column in needed:
+            columns.setdefault((column.table.name, column.key), column)
+    return columns
+
+
+# source: an explicit FROM (e.g. a join) when the fields span more than one table
+def select_statement(
+    selected: FieldSpec, key_columns: list, filters: list, after: Optional[list], limit: Optional[int], source=None
+):
+    columns = _columns(selected)
+    key_labels = [column.label(f"_k{i}") for i, column in enumerate(key_columns)]
+    statement = select(*columns.values(), *key_labels)
+    if source is not None:
+        statement = statement.select_from(source)
+    statement = statement.where(*filters)
+    if after is not None:
+        statement = statement.where(_after(key_columns, after))
+    statement = statement.order_by(*key_columns)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def _row_keys(row, key_columns: list) -> list:
+    return [getattr(row, f"_k{i}") for i in range(len(key_columns))]
+
+
+def format_row(row, selected: FieldSpec) -> dict:
+    return {name: render(row) for name, (_, render) in selected.items()}
+
+
+_serializers: dict[tuple, Callable[[list], list]] = {}
+
+
+# JSON_FAST_PATH: rows -> dicts through a closure built once per field selection over
+# (name, getter) pairs. Plain columns are read by position with an itemgetter; other fields
+# still go through their renderer
+def compile_serializer(selected: FieldSpec) -> Callable[[list], list]:
+    cache_key = tuple((name, render) for name, (_, render) in selected.items())
+    serializer = _serializers.get(cache_key)
+    if serializer is None:
+        positions = {key: i for i, key in enumerate(_columns(selected))}
+        getters = [
+            (name, itemgetter(positions[needed[0].table.name, needed[0].key]) if isinstance(render, ColumnValue) else render)
+            for name, (needed, render) in selected.items()
+        ]
+
+        def serializer(rows: list) -> list:
+            return [{name: get(row) for name, get in getters} for row in rows]
+
+        _serializers[cache_key] = serializer
+    return serializer
+
+
+def format_rows(rows: list, selected: FieldSpec) -> list[dict]:
+    if config.JSON_FAST_PATH:
+        return compile_serializer(selected)(rows)
+    return [format_row(row, selected) for row in rows]
+
+
+# Fast path encoder: orjson when it is installed (the fast-json extra; it handles datetimes
+# natively), otherwise compact json. jsonable_encoder covers anything either doesn't know
+def fast_dumps(value) -> bytes:
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(value, default=jsonable_encoder, separators=(",", ":")).encode()
+    return orjson.dumps(value, default=jsonable_encoder)
+
+
+# Fetch one page; returns the items and the cursor for the next page (None on the last page)
+async def fetch_page(
+    session, selected: FieldSpec, key_columns: list, filters: list, after: Optional[list], limit: int, source=None
+):
+    rows = (await session.execute(select_statement(selected, key_columns, filters, after, limit + 1, source))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_row_keys(rows[-1], key_columns))
+    return format_rows(rows, selected), next_cursor
+
+
+# Stream every matching row as NDJSON, walking the keyset in batches so memory stays flat
+async def iter_ndjson(
+    session_factory, selected: FieldSpec, key_columns: list, filters: list, after: Optional[list], limit: Optional[int],
+    source=None,
+):
+    remaining = limit
+    async with session_factory() as session:
+        while remaining is None or remaining > 0:
+            batch = NDJSON_BATCH_SIZE if remaining is None else min(NDJSON_BATCH_SIZE, remaining)
+            rows = (await session.execute(select_statement(selected, key_columns, filters, after, batch, source))).all()
+            if config.JSON_FAST_PATH:
+                yield b"".join(fast_dumps(item) + b"\n" for item in format_rows(rows, selected))
+            else:
+                for row in rows:
+                    yield json.dumps(jsonable_encoder(format_row(row, selected))) + "\n"
+            if len(rows) < batch:
+                break
+            after = _row_keys(rows[-1], key_columns)
+            if remaining is not None:
+                remaining -= len(rows)
+
+
+# Shared response for list endpoints: a JSON array with X-Next-Cursor, or NDJSON when format=ndjson
+async def list_response(
+    session_factory,
+    spec: FieldSpec,
+    key_columns: list,
+    filters: list,
+    fields: Optional[str],
+    cursor: Optional[str],
+    limit: Optional[int],
+    format: str,
+    source=None,
+):
+    selected = parse_fields(fields, spec)
+    after = decode_cursor(cursor, key_columns) if cursor else None
+    if format == "ndjson":
+        return StreamingResponse(
+            iter_ndjson(session_factory, selected, key_columns, filters, after, limit, source),
+            media_type="application/x-ndjson",
+        )
+    if format != "json":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="format must be json or ndjson")
+    limit = min(limit or config.PAGE_DEFAULT_LIMIT, config.PAGE_MAX_LIMIT)
+    async with session_factory() as session:
+        items, next_cursor = await fetch_page(session, selected, key_columns, filters, after, limit, source)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if config.JSON_FAST_PATH:
+        return Response(fast_dumps(items), media_type="application/json", headers=headers)
+    return JSONResponse(jsonable_encoder(items), headers=headers)
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Optional
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+import config
+from cache import TTLCache, MISSING
+from metrics import register_callback
+from models.order import OrderModel, CompleteOrderModel
+
+
+class MemoryBackend:
+    """Process-local versions and entries: the default, and a stand-in for a shared backend.
+
+    Versions expire with the bodies (RESPONSE_CACHE_TTL), since a write in another process
+    never bumps them; an expired version is reissued from the clock, which retires every
+    ETag and body cached under the old one.
+    """
+
+    def __init__(self):
+        self._versions = TTLCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL)
+        self._entries = TTLCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL)
+
+    # Versions start at the current time, so a restart never reissues an ETag for older content
+    def version_now(self, key: str) -> int:
+        version = self._versions.get(key)
+        if version is MISSING:
+            version = time.time_ns()
+            self._versions.set(key, version)
+        return version
+
+    def bump_now(self, key: str) -> None:
+        self._versions.set(key, max(self.version_now(key) + 1, time.time_ns()))
+
+    async def version(self, key: str) -> int:
+        return self.version_now(key)
+
+    async def bump(self, key: str) -> None:
+        self.bump_now(key)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        return None if value is MISSING else value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries.set(key, value, ttl)
+
+
+class RedisBackend:
+    """Versions and entries in Redis, shared by every worker process."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+
+    async def version(self, key: str) -> int:
+        value = await self.client.get(f"v:{key}")
+        if value is None:
+            await self.client.set(f"v:{key}", time.time_ns(), nx=True)
+            value = await self.client.get(f"v:{key}")
+        return int(value)
+
+    async def bump(self, key: str) -> None:
+        await self.client.incr(f"v:{key}")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"e:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(f"e:{key}", value, px=int(ttl * 1000))
+
+
+def make_backend(name: str):
+    if name == "redis":
+        return RedisBackend(config.RESPONSE_CACHE_REDIS_URL)
+    if name == "memory":
+        return MemoryBackend()
+    return None
+
+
+class ResponseCache:
+    """JSON responses keyed by resource ("order:12"), tagged with a version that changes on every write.
+
+    The version is the ETag. A matching If-None-Match is answered with 304 only
+    while the body for that version is still cached, so a 304 is never older than
+    a cached body. Bodies live in an in-process LRU, and also in the shared
+    backend when one is configured.
+
+    Without a shared backend, versions are per process: a write in another worker
+    or instance doesn't reach them, and this process keeps serving what it cached
+    until its version expires, up to RESPONSE_CACHE_TTL after it was issued. Set
+    RESPONSE_CACHE_BACKEND=redis when several processes serve the same data and
+    that is too stale.
+    """
+
+    def __init__(self, shared=None):
+        self.local = TTLCache(config.RESPONSE_CACHE_SIZE, config.RESPONSE_CACHE_TTL)
+        self.shared = shared
+        self.versions = shared or MemoryBackend()
+        self.counts: dict[tuple[str, str], int] = {}
+        self._pending: set[asyncio.Task] = set()
+
+    def _count(self, kind: str, outcome: str) -> None:
+        self.counts[kind, outcome] = self.counts.get((kind, outcome), 0) + 1
+
+    async def version(self, key: str) -> int:
+        if self._pending:
+            # Finish invalidations from this process's own commits before trusting a version
+            await asyncio.gather(*list(self._pending))
+        return await self.versions.version(key)
+
+    async def get(self, key: str, version: int) -> Optional[bytes]:
+        entry = self.local.get(key)
+        if entry is not MISSING and entry[0] == version:
+            return entry[1]
+        if self.shared is not None:
+            body = await self.shared.get(f"{key}:{version}")
+            if body is not None:
+                self.local.set(key, (version, body))
+                return body
+        return None
+
+    async def store(self, key: str, version: int, body: bytes) -> None:
+        self.local.set(key, (version, body))
+        if self.shared is not None:
+            await self.shared.set(f"{key}:{version}", body, config.RESPONSE_CACHE_TTL)
+
+    # Called after a commit that changed the resources behind these keys
+    def invalidate(self, keys: set[str]) -> None:
+        for key in keys:
+            self.local.invalidate(key)
+        if self.shared is None:
+            for key in keys:
+                self.versions.bump_now(key)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # A commit outside the app (a script); the TTL covers it
+            return
+        task = loop.create_task(self._bump(keys))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _bump(self, keys: set[str]) -> None:
+        await asyncio.gather(*(self.shared.bump(key) for key in keys))
+
+    def stats(self) -> dict:
+        kinds = sorted({kind for kind, _ in self.counts})
+        report = {}
+        for kind in kinds:
+            hits = self.counts.get((kind, "hit"), 0)
+            not_modified = self.counts.get((kind, "not_modified"), 0)
+            misses = self.counts.get((kind, "miss"), 0)
+            lookups = hits + not_modified + misses
+            report[kind] = {
+                "hits": hits, "not_modified": not_modified, "misses": misses,
+                "hit_ratio": (hits + not_modified) / lookups if lookups else 0.0,
+            }
+        return report
+
+
+response_cache = ResponseCache(make_backend(config.RESPONSE_CACHE_BACKEND))
+
+register_callback(
+    "response_cache_lookups_total", "Cached response lookups by resource and outcome (hit, not_modified, miss).",
+    lambda: response_cache.counts, "counter", ("kind", "outcome"),
+)
+register_callback(
+    "response_cache_hit_ratio", "Share of cached response lookups answered without the database.",
+    lambda: {(kind,): stats["hit_ratio"] for kind, stats in response_cache.stats().items()}, "gauge", ("kind",),
+)
+
+
+# Serve a JSON resource through the cache; build() reads it from the database and returns
+# None when it doesn't exist (not cached, and passed back as None)
+async def cached_json(request: Request, key: str, build: Callable[[], Awaitable[Optional[dict]]]) -> Optional[Response]:
+    if not config.RESPONSE_CACHE_ENABLED:
+        value = await build()
+        return None if value is None else Response(json.dumps(value), media_type="application/json")
+    kind = key.split(":", 1)[0]
+    version = await response_cache.version(key)
+    etag = f'"{key}:{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    body = await response_cache.get(key, version)
+    # Only while the body is cached: past its TTL the client gets a fresh read, not a 304
+    if body is not None and request.headers.get("if-none-match") == etag:
+        response_cache._count(kind, "not_modified")
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        value = await build()
+        if value is None:
+            return None
+        body = json.dumps(value).encode()
+        await response_cache.store(key, version, body)
+        response_cache._count(kind, "miss")
+        headers["X-Cache"] = "MISS"
+    else:
+        response_cache._count(kind, "hit")
+        headers["X-Cache"] = "HIT"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# Mark cached views as changed by this session; their versions move once it commits.
+# Mapper events do this for ORM flushes; bulk INSERT/UPDATE statements must call it themselves
+def mark_changed(session, *keys: str) -> None:
+    session.info.setdefault("response_cache_keys", set()).update(keys)
+
+
+def _mark(target, *keys: str) -> None:
+    session = object_session(target)
+    if session is not None:
+        mark_changed(session, *keys)
+
+
+@event.listens_for(OrderModel, "after_insert")
+@event.listens_for(OrderModel, "after_update")
+@event.listens_for(OrderModel, "after_delete")
+def _order_changed(mapper, connection, target: OrderModel) -> None:
+    _mark(target, f"order:{target.id}", f"account_detail:{target.id}")
+
+
+@event.listens_for(CompleteOrderModel, "after_insert")
+@event.listens_for(CompleteOrderModel, "after_update")
+@event.listens_for(CompleteOrderModel, "after_delete")
+def _completion_changed(mapper, connection, target: CompleteOrderModel) -> None:
+    _mark(target, f"account_detail:{target.order_id}")
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    keys = session.info.pop("response_cache_keys", None)
+    if keys:
+        response_cache.invalidate(keys)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop("response_cache_keys", None)
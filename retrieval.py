@@ -0,0 +1,103 @@
+import asyncio
+from contextlib import asynccontextmanager
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+from answer_cache import knowledge_changed
+from db import async_session
+from embeddings import get_embedder
+from models.knowledge import DocumentChunk
+
+# Chunks read per query while loading an index from the database
+REBUILD_BATCH = 5000
+
+_rebuild_lock = asyncio.Lock()
+
+
+def embedder_label(embedder) -> str:
+    return f"{embedder.name}:{embedder.dim}"
+
+
+# Load every stored chunk of the bot into an empty index
+async def rebuild_index(bot_id: str, index) -> None:
+    import numpy as np
+
+    await run_in_threadpool(index.clear)
+    label = embedder_label(get_embedder())
+    last = 0
+    while True:
+        async with async_session() as session:
+            rows = (await session.exec(
+                select(DocumentChunk.id, DocumentChunk.embedding)
+                .where(DocumentChunk.bot_id == bot_id, DocumentChunk.id > last)
+                .order_by(DocumentChunk.id)
+                .limit(REBUILD_BATCH)
+            )).all()
+        if not rows:
+            break
+        ids = [chunk_id for chunk_id, _ in rows]
+        vectors = np.frombuffer(b"".join(embedding for _, embedding in rows), dtype="<f4").reshape(len(rows), -1)
+        await run_in_threadpool(index.add, ids, vectors, label)
+        last = ids[-1]
+    index.loaded_through = last
+    index.needs_rebuild = False
+    await run_in_threadpool(index.maintain)
+
+
+# The bot's open index, loaded from the database first if its files are missing or damaged.
+# The registry keeps it open (never evicts it) until the block exits
+@asynccontextmanager
+async def bot_index(bot_id: str):
+    from vector_index import vector_indexes
+
+    index = await run_in_threadpool(vector_indexes.acquire, bot_id)
+    try:
+        if index.needs_rebuild:
+            async with _rebuild_lock:
+                if index.needs_rebuild:
+                    await rebuild_index(bot_id, index)
+        yield index
+    finally:
+        vector_indexes.release(bot_id)
+
+
+async def index_chunks(bot_id: str, ids: list[int], vectors, label: str) -> None:
+    async with bot_index(bot_id) as index:
+        await run_in_threadpool(index.add, ids, vectors, label)
+    knowledge_changed(bot_id)
+
+
+async def forget_chunks(bot_id: str, ids: list[int]) -> None:
+    if ids:
+        async with bot_index(bot_id) as index:
+            await run_in_threadpool(index.delete, ids)
+        knowledge_changed(bot_id)
+
+
+async def maintain_index(bot_id: str) -> None:
+    async with bot_index(bot_id) as index:
+        await run_in_threadpool(index.maintain)
+
+
+# The k chunks of the bot's knowledge base closest to an embedded query, best first
+async def search_chunks(bot_id: str, query, k: int) -> list[dict]:
+    async with bot_index(bot_id) as index:
+        hits = await run_in_threadpool(index.search, query, k)
+    if not hits:
+        return []
+    async with async_session() as session:
+        rows = (await session.exec(
+            select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.position, DocumentChunk.text)
+            .where(DocumentChunk.id.in_([chunk_id for chunk_id, _ in hits]))
+        )).all()
+    chunks = {row.id: row for row in rows}
+    return [
+        {
+            "chunk_id": chunk_id, "document_id": chunks[chunk_id].document_id,
+            "position": chunks[chunk_id].position, "score": round(score, 4), "text": chunks[chunk_id].text,
+        }
+        for chunk_id, score in hits if chunk_id in chunks
+    ]
+
+
+async def retrieve(bot_id: str, text: str, k: int) -> list[dict]:
+    return await search_chunks(bot_id, (await get_embedder().embed([text]))[0], k)
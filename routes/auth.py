@@ -1,32 +1,29 @@
-from typing import Annotated, List
+from typing import Annotated, List, Literal, Optional
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status , Query
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from schemas.user import UserCreate, UserResponse, Token
 from models.user import User
-from auth import get_password_hash, verify_password, create_access_token, get_current_user
-from db import get_session
+from auth import password_pool, create_access_token, get_current_user, get_token_user, user_token_claims
+from db import get_session, async_session
+from pagination import FieldSpec, column_field, list_response
+from export import export_response
 from sqlmodel import select
-import pandas as pd
-from fastapi.responses import StreamingResponse
-import io
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from pydantic import EmailStr
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from sqlalchemy.exc import IntegrityError
+from mailer import queue_email
 auth_router = APIRouter(prefix = "/auth")
  
 # Signup Endpoint
 @auth_router.post("/signup", response_model=UserResponse)
-def signup(user_create: UserCreate, session: Session = Depends(get_session)):
+async def signup(user_create: UserCreate, session: AsyncSession = Depends(get_session)):
     # Check if user already exists
-    user_exists = session.exec(select(User).where(User.email == user_create.email)).first()
+    user_exists = (await session.exec(select(User.id).where(User.email == user_create.email))).first()
     if user_exists:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
 
     # Hash the password and create user
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await password_pool.hash(user_create.password)
     new_user = User(
         username=user_create.username,
         email=user_create.email,
@@ -37,60 +34,103 @@ def signup(user_create: UserCreate, session: Session = Depends(get_session)):
         address=user_create.address
     )
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
-
-    # Send confirmation email
-    sender_email = "raibadar37218@gmail.com"
-    receiver_email = user_create.email
-    password = "aqojinprzpqfhlxk"
-
-    message = MIMEMultipart("alternative")
-    message["Subject"] = "Welcome to Funded Horizon"
-    message["From"] = sender_email
-    message["To"] = receiver_email
 
+    # Queue the confirmation email; it is committed with the user and sent by the outbox sender
     text = f"Hello {user_create.name},\n\nThank you for signing up at Funded Horizon"
-    part = MIMEText(text, "plain")
-    message.attach(part)
-
+    queue_email(session, user_create.email, "Welcome to Funded Horizon", text)
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.sendmail(sender_email, receiver_email, message.as_string())
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to send email")
+        await session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent signup for the same email (unique ix_user_email)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
 
     return new_user
 
 # Login Endpoint
 #NOTE: You have to tell the frontend developer that he has to send the email in the key of username and should ask from the user the email but put it against the username key in the header.
 @auth_router.post("/login", response_model=Token)
-def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends(OAuth2PasswordRequestForm)], session: Session = Depends(get_session)):
-    db_user = session.exec(select(User).where(User.email == form_data.username)).first()
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
+async def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends(OAuth2PasswordRequestForm)], session: AsyncSession = Depends(get_session)):
+    db_user = (await session.exec(select(User).where(User.email == form_data.username))).first()
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid credentials")
+    valid, new_hash = await password_pool.verify_and_update(form_data.password, db_user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid credentials")
+
+    # Transparently upgrade hashes made with an older cost factor
+    if new_hash:
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
     
     # Create JWT token
-    access_token = create_access_token(data={"sub": str(db_user.id)})
+    access_token = create_access_token(data=user_token_claims(db_user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Token Refresh Endpoint
 @auth_router.post("/token/refresh", response_model=Token)
-def refresh_token(current_user: User = Depends(get_current_user)):
-    access_token = create_access_token(data={"sub": str(current_user.id)})
+async def refresh_token(current_user: User = Depends(get_current_user)):
+    access_token = create_access_token(data=user_token_claims(current_user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+# Fields exposed by /auth/users; ?fields= selects a subset and only their columns are read
+USER_FIELDS: FieldSpec = {
+    "id": column_field(User.id),
+    "username": column_field(User.username),
+    "email": column_field(User.email),
+    "name": column_field(User.name),
+    "country": column_field(User.country),
+    "phone_no": column_field(User.phone_no),
+    "address": column_field(User.address),
+    "created_at": column_field(User.created_at),
+}
+
+# Filters shared by /auth/users and its export
+def user_filters(
+    email: Optional[str] = None,
+    country: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> list:
+    filters = []
+    if email:
+        filters.append(User.email == email)
+    if country:
+        filters.append(User.country == country)
+    if created_from:
+        filters.append(User.created_at >= created_from)
+    if created_to:
+        filters.append(User.created_at < created_to)
+    return filters
+
     # Get All Users Endpoint
 @auth_router.get("/users", response_model=List[UserResponse])
-def get_all_users(session: Session = Depends(get_session)):
-        users = session.exec(select(User)).all()
-        return users
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[str] = None,
+    format: str = "json",
+    sort: Literal["id", "created_at"] = "id",
+    filters: list = Depends(user_filters),
+):
+        key_columns = [User.created_at, User.id] if sort == "created_at" else [User.id]
+        return await list_response(
+            async_session, USER_FIELDS, key_columns, filters, fields, cursor, limit, format
+        )
+
+    # Export Users Endpoint (CSV or XLSX, streamed from a server-side cursor)
+@auth_router.get("/users/export")
+async def export_users(
+    format: Literal["csv", "xlsx"] = "csv",
+    fields: Optional[str] = None,
+    filters: list = Depends(user_filters),
+    current_user: User = Depends(get_current_user),
+):
+        return await export_response(async_session, USER_FIELDS, [User.id], filters, fields, format, "users")
 
 
     # Get Current User Details Endpoint
 @auth_router.get("/user/me", response_model=UserResponse)
-def get_current_user_details(current_user: User = Depends(get_current_user)):
+async def get_current_user_details(current_user: User = Depends(get_token_user)):
         return current_user
\ No newline at end of file
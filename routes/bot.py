@@ -0,0 +1,174 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Path, Query, UploadFile
+from sqlalchemy import and_, delete, or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+from chunking import DOCUMENT_KINDS
+from auth import get_current_user
+from db import get_session, async_session
+from ingest import ingestion_worker
+from models.knowledge import Document, DocumentChunk
+from models.user import User
+from pagination import FieldSpec, column_field, list_response
+from retrieval import forget_chunks, maintain_index, retrieve
+from storage import delete_unreferenced, save_upload
+
+bot_router = APIRouter(prefix="/bots")
+
+# Bot ids end up in file names (per-bot indexes), so keep them to a safe alphabet
+BotId = Path(..., pattern=r"^[A-Za-z0-9_-]{1,64}$")
+
+_EXTENSIONS = {".html": "html", ".htm": "html", ".txt": "text", ".md": "text", ".pdf": "pdf"}
+_CONTENT_TYPES = {"text/html": "html", "text/plain": "text", "text/markdown": "text", "application/pdf": "pdf"}
+
+
+def document_kind(upload: UploadFile) -> str:
+    extension = os.path.splitext(upload.filename or "")[1].lower()
+    content_type = (upload.content_type or "").split(";")[0].strip().lower()
+    kind = _EXTENSIONS.get(extension) or _CONTENT_TYPES.get(content_type)
+    if kind is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"{upload.filename}: unsupported document type; expected one of {', '.join(DOCUMENT_KINDS)}",
+        )
+    return kind
+
+
+def _progress(row) -> Optional[float]:
+    if row.status == "ready":
+        return 1.0
+    if row.status == "embedding" and row.chunk_count:
+        return round(row.embedded_count / row.chunk_count, 3)
+    return None
+
+
+# Shape of a document's status; progress is known once parsing has finished
+DOCUMENT_FIELDS: FieldSpec = {
+    "id": column_field(Document.id),
+    "filename": column_field(Document.filename),
+    "kind": column_field(Document.kind),
+    "size": column_field(Document.size),
+    "status": column_field(Document.status),
+    "chunk_count": column_field(Document.chunk_count),
+    "embedded_count": column_field(Document.embedded_count),
+    "progress": ([Document.status, Document.chunk_count, Document.embedded_count], _progress),
+    "embedder": column_field(Document.embedder),
+    "error": column_field(Document.error),
+    "created_at": column_field(Document.created_at),
+    "updated_at": column_field(Document.updated_at),
+    "finished_at": column_field(Document.finished_at),
+}
+
+
+def document_status(document: Document) -> dict:
+    return {name: render(document) for name, (_, render) in DOCUMENT_FIELDS.items()}
+
+
+# Upload HTML, text or PDF files to a bot's knowledge base. The files are stored and queued;
+# parsing, chunking and embedding happen in the background (see GET .../documents/{id})
+@bot_router.post("/{bot_id}/documents", status_code=202)
+async def upload_documents(
+    bot_id: str = BotId,
+    files: list[UploadFile] = File(...),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    kinds = [document_kind(upload) for upload in files]
+    documents = []
+    for upload, kind in zip(files, kinds):
+        blob = await save_upload(upload, config.INGEST_MAX_BYTES)
+        documents.append(Document(
+            bot_id=bot_id, filename=upload.filename or blob.key, kind=kind, blob=blob.key, size=blob.size
+        ))
+    session.add_all(documents)
+    await session.commit()
+    for document in documents:
+        ingestion_worker.submit(document.id)
+    return {"documents": [document_status(document) for document in documents]}
+
+@bot_router.get("/{bot_id}/documents")
+async def list_documents(
+    bot_id: str = BotId,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[str] = None,
+):
+    filters = [Document.bot_id == bot_id]
+    if status:
+        filters.append(Document.status == status)
+    return await list_response(async_session, DOCUMENT_FIELDS, [Document.id], filters, fields, cursor, limit, "json")
+
+async def _get_document(session: AsyncSession, bot_id: str, document_id: int) -> Document:
+    document = await session.get(Document, document_id)
+    if document is None or document.bot_id != bot_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
+
+@bot_router.get("/{bot_id}/documents/{document_id}")
+async def get_document(document_id: int, bot_id: str = BotId, session: AsyncSession = Depends(get_session)):
+    return document_status(await _get_document(session, bot_id, document_id))
+
+# Queue a failed document again, or one left half-done by a process that stopped mid-way
+# (no heartbeat for INGEST_STALE_SECONDS); one still being worked on is left alone
+@bot_router.post("/{bot_id}/documents/{document_id}/retry", status_code=202)
+async def retry_document(
+    document_id: int,
+    bot_id: str = BotId,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    document = await _get_document(session, bot_id, document_id)
+    stale = datetime.utcnow() - timedelta(seconds=config.INGEST_STALE_SECONDS)
+    requeued = await session.execute(
+        update(Document)
+        .where(
+            Document.id == document.id,
+            or_(
+                Document.status == "failed",
+                and_(Document.status.in_(("parsing", "embedding")), Document.updated_at < stale),
+            ),
+        )
+        .values(status="queued", updated_at=datetime.utcnow())
+    )
+    await session.commit()
+    if not requeued.rowcount:
+        raise HTTPException(status_code=409, detail=f"Document is {document.status}")
+    ingestion_worker.submit(document.id)
+    await session.refresh(document)
+    return document_status(document)
+
+# Remove a document, its chunks and its stored file (unless another upload has the same
+# content); its rows in the bot's index become tombstones
+@bot_router.delete("/{bot_id}/documents/{document_id}", status_code=204)
+async def delete_document(
+    background_tasks: BackgroundTasks,
+    document_id: int,
+    bot_id: str = BotId,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+):
+    document = await _get_document(session, bot_id, document_id)
+    if document.status in ("parsing", "embedding"):
+        raise HTTPException(status_code=409, detail=f"Document is {document.status}")
+    blob = document.blob
+    chunk_ids = (await session.exec(select(DocumentChunk.id).where(DocumentChunk.document_id == document.id))).all()
+    await session.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document.id))
+    await session.delete(document)
+    await session.commit()
+    await forget_chunks(bot_id, chunk_ids)
+    await delete_unreferenced(session, [blob])
+    background_tasks.add_task(maintain_index, bot_id)
+
+# The chunks of the bot's knowledge base closest to the query text
+@bot_router.get("/{bot_id}/search")
+async def search_documents(q: str = Query(..., min_length=1), k: int = Query(5, ge=1, le=100), bot_id: str = BotId):
+    from vector_index import VectorIndexError
+
+    try:
+        return {"results": await retrieve(bot_id, q, k)}
+    except VectorIndexError as e:
+        raise HTTPException(status_code=409, detail=f"{e}; the documents need re-ingesting with the current embedder")
@@ -0,0 +1,115 @@
+import json
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+from answer_cache import answer_cache, knowledge_version
+from auth import get_token_user
+from conversation import build_prompt, conversation_summarizer, load_conversation, record_turns
+from db import get_session
+from embeddings import get_embedder
+from llm import get_chat_model
+from metrics import observe
+from models.conversation import Conversation, ConversationTurn
+from models.user import User
+from retrieval import search_chunks
+from routes.bot import BotId
+from schemas.chat import ChatRequest
+
+chat_router = APIRouter(prefix="/chat")
+
+# No proxy buffering, so each token reaches the client as it is produced
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def remember(conversation_id: int, question: str, answer: str) -> None:
+    if await record_turns(conversation_id, question, answer) > config.CHAT_HISTORY_TOKENS:
+        conversation_summarizer.schedule(conversation_id)
+
+
+# Answer a question from the bot's knowledge base, in the user's conversation with the bot, as
+# server-sent events: "token" events with the text as it is generated, then "done" with the
+# sources (or "error" if the model failed)
+@chat_router.post("/{bot_id}")
+async def chat(body: ChatRequest, bot_id: str = BotId, current_user: User = Depends(get_token_user)):
+    from vector_index import VectorIndexError
+
+    started = time.perf_counter()
+    conversation, turns = await load_conversation(current_user.id, bot_id)
+    vector = (await get_embedder().embed([body.question]))[0]
+    version = await knowledge_version(bot_id)
+    # Only an opening question stands on its own; later ones may lean on the conversation
+    opening = not turns and not conversation.summary
+    cached = None
+    if config.ANSWER_CACHE_ENABLED and opening:
+        cached = answer_cache.lookup(bot_id, vector, version)
+    if cached is not None:
+        async def replay():
+            yield sse("token", {"text": cached["text"]})
+            await remember(conversation.id, body.question, cached["text"])
+            yield sse("done", {"cached": True, "sources": cached["sources"]})
+
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    try:
+        chunks = await search_chunks(bot_id, vector, config.CHAT_CONTEXT_CHUNKS)
+    except VectorIndexError as e:
+        raise HTTPException(status_code=409, detail=f"{e}; the documents need re-ingesting with the current embedder")
+    messages, used, prompt_tokens = build_prompt(body.question, conversation.summary, turns, chunks)
+    sources = [
+        {"chunk_id": chunk["chunk_id"], "document_id": chunk["document_id"], "score": chunk["score"]}
+        for chunk in used
+    ]
+
+    async def generate():
+        pieces = []
+        try:
+            async for piece in get_chat_model().stream(messages):
+                if not pieces:
+                    observe("chat.first_token", time.perf_counter() - started)
+                pieces.append(piece)
+                yield sse("token", {"text": piece})
+        except Exception as e:
+            yield sse("error", {"detail": f"{type(e).__name__}: {e}"})
+            return
+        observe("chat.answer", time.perf_counter() - started)
+        # Only complete answers are kept; a client that disconnects cancels this generator
+        answer = "".join(pieces)
+        await remember(conversation.id, body.question, answer)
+        if config.ANSWER_CACHE_ENABLED and opening and pieces:
+            answer_cache.store(bot_id, vector, version, {"text": answer, "sources": sources})
+        yield sse("done", {"cached": False, "sources": sources, "prompt_tokens": prompt_tokens})
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@chat_router.get("/{bot_id}/conversation")
+async def get_conversation(bot_id: str = BotId, current_user: User = Depends(get_token_user)):
+    conversation, turns = await load_conversation(current_user.id, bot_id)
+    return {
+        "summary": conversation.summary,
+        "summarized_through": conversation.summarized_through,
+        "turns": [{"seq": turn.seq, "role": turn.role, "content": turn.content} for turn in turns],
+    }
+
+# Forget the conversation; the next question starts a new one
+@chat_router.delete("/{bot_id}/conversation", status_code=204)
+async def delete_conversation(
+    bot_id: str = BotId,
+    current_user: User = Depends(get_token_user),
+    session: AsyncSession = Depends(get_session)
+):
+    conversation = (await session.exec(
+        select(Conversation).where(Conversation.user_id == current_user.id, Conversation.bot_id == bot_id)
+    )).first()
+    if conversation is not None:
+        await session.execute(delete(ConversationTurn).where(ConversationTurn.conversation_id == conversation.id))
+        await session.delete(conversation)
+        await session.commit()
@@ -1,7 +1,19 @@
-from fastapi import FastAPI, HTTPException, Form, APIRouter
+from fastapi import FastAPI, HTTPException, Form, APIRouter, Depends, Query
 from pydantic import BaseModel
-import MetaTrader5 as mt5
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Literal, Optional
+import time
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import config
+from auth import get_token_user
+from db import get_session
+from models.order import CompleteOrderModel, OrderModel
+from models.user import User
+from starlette.concurrency import run_in_threadpool
+from deal_store import sync_deals, query_deals, deals_since, load_account_deals, opening_balance
+from mt5_pool import terminal_pool, MT5Error, MT5InitError, MT5LoginError, MT5BusyError
+from equity import RAW, HOUR, DAY, day_start, equity_points, resolution_for, max_drawdown_pct
 
 meta_router = APIRouter(prefix="/meta")
 
@@ -12,93 +24,159 @@ class MT5Request(BaseModel):
     password: str
     server: str
 
-# Function to calculate daily drawdown
-def calculate_daily_drawdown(current_equity):
-    today = datetime.now().date()
-    trades_today = mt5.history_deals_get(datetime(today.year, today.month, today.day), datetime.now())
-    
-    if not trades_today:
-        return None  # No trades today, so no drawdown
-    
-    max_equity = current_equity
-    for trade in trades_today:
-        max_equity = max(max_equity, trade.profit + current_equity)
-    
-    drawdown = (max_equity - current_equity) / max_equity * 100
-    return drawdown if drawdown > 0 else None
+# Function to calculate daily drawdown: the deepest fall today from the running peak of
+# today's equity curve (opening balance, then each closed deal, then live equity), in percent
+def calculate_daily_drawdown(current_balance, current_equity, trades_today):
+    # NumPy and the analytics engine load on first use, not at cold start
+    import numpy as np
+    from analytics import todays_drawdown_pct
+
+    todays_net = np.array([trade.profit + trade.commission + trade.swap for trade in trades_today], dtype=np.float64)
+    return todays_drawdown_pct(current_balance, current_equity, todays_net)
 
 # Endpoint to fetch account details, total trades, and daily drawdown
 @meta_router.post("/fetch_account_details")
 async def fetch_account_details(
     account_number: int = Form(...),
     password: str = Form(...),
-    server: str = Form(...)
+    server: str = Form(...),
+    cursor: Optional[str] = Form(None),
+    limit: Optional[int] = Form(None, ge=1),
+    date_from: Optional[datetime] = Form(None),
+    date_to: Optional[datetime] = Form(None),
+    session: AsyncSession = Depends(get_session)
 ):
-    # Initialize MetaTrader5
-    if not mt5.initialize():
+    # Borrow a long-lived terminal worker for this account (logs in only if it isn't already)
+    # and pull just the deals closed since the last sync into the local store
+    try:
+        async with terminal_pool.session(account_number, password, server) as terminal:
+            account_info = await terminal.call("account_info")
+            if account_info is None:
+                raise HTTPException(status_code=500, detail="Failed to retrieve account information.")
+            sync = await sync_deals(session, terminal, account_number, account_info["balance"])
+    except MT5BusyError:
+        raise HTTPException(status_code=503, detail="All MetaTrader5 terminals are busy, please retry shortly", headers={"Retry-After": "1"})
+    except MT5InitError:
         raise HTTPException(status_code=500, detail="MetaTrader5 initialization failed")
-    
-    # Login to MetaTrader5 account
-    if not mt5.login(account_number, password=password, server=server):
-        mt5.shutdown()
+    except MT5LoginError:
         raise HTTPException(status_code=401, detail="Login failed. Check your credentials and server.")
-    
-    # Fetch account information
-    account_info = mt5.account_info()
-    if account_info is None:
-        mt5.shutdown()
+    except MT5Error:
         raise HTTPException(status_code=500, detail="Failed to retrieve account information.")
     
     # Gather account details
     account_details = {
-        "balance": account_info.balance,
-        "equity": account_info.equity,
-        "margin": account_info.margin,
-        "free_margin": account_info.margin_free,
-        "currency": account_info.currency,
-        "leverage": account_info.leverage,
-        "name": account_info.name,
+        "balance": account_info["balance"],
+        "equity": account_info["equity"],
+        "margin": account_info["margin"],
+        "free_margin": account_info["margin_free"],
+        "currency": account_info["currency"],
+        "leverage": account_info["leverage"],
+        "name": account_info["name"],
     }
-    
-    # Fetch total closed trades
-    closed_trades = mt5.history_deals_get(datetime(2000, 1, 1), datetime.now())
-    total_trades = len(closed_trades) if closed_trades else 0
 
-    # Calculate total profit/loss
-    total_pnl = 0
-    
-    # Fetch trade details
-    trade_details = []
-    if closed_trades:
-        for trade in closed_trades:
-            total_pnl += trade.profit
-            # Convert timestamp to date string
-            trade_date = datetime.fromtimestamp(trade.time).strftime('%Y-%m-%d')
-            # Map trade type number to descriptive string
-            trade_type = "Buy" if trade.type == 0 else "Sell" if trade.type == 1 else str(trade.type)
-            trade_details.append({
-                "ticket": trade.ticket,
-                "time": trade.time,
-                "date": trade_date,
-                "type": trade.type,
-                "trade_type": trade_type,
-                "volume": trade.volume,
-                "price": trade.price,
-                "profit": trade.profit,
-                "symbol": trade.symbol,
-            })
+    # Trade details come from the local store, one page at a time
+    limit = min(limit or config.PAGE_DEFAULT_LIMIT, config.PAGE_MAX_LIMIT)
+    trade_details, next_cursor = await query_deals(session, account_number, date_from, date_to, cursor, limit)
 
     # Calculate daily drawdown
-    drawdown = calculate_daily_drawdown(account_info.equity)
-
-    # Shutdown MetaTrader5
-    mt5.shutdown()
+    today_start = datetime.fromtimestamp(day_start(), timezone.utc)
+    drawdown = calculate_daily_drawdown(
+        account_info["balance"], account_info["equity"], await deals_since(session, account_number, today_start)
+    )
 
-    # Return response
+    # Return response; totals are maintained incrementally by sync_deals
     return {
         "account_details": account_details,
-        "total_closed_trades": total_trades,
+        "total_closed_trades": sync.deal_count,
         "trade_details": trade_details,
+        "next_cursor": next_cursor,
         "daily_drawdown": drawdown,
-        "total_profit_loss": total_pnl
+        "total_profit_loss": sync.total_pnl
+    }
+
+# The routes below read stored data without the account password, so the caller must be the
+# user the account was provisioned for: an order of theirs (by email) was completed with it
+async def owned_account(
+    account_number: int,
+    current_user: User = Depends(get_token_user),
+    session: AsyncSession = Depends(get_session)
+) -> int:
+    owned = (await session.exec(
+        select(CompleteOrderModel.id)
+        .join(OrderModel, CompleteOrderModel.order_id == OrderModel.id)
+        .where(OrderModel.email == current_user.email, CompleteOrderModel.platform_login == str(account_number))
+        .limit(1)
+    )).first()
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return account_number
+
+# Stored deal history for an account, without touching the terminal
+@meta_router.get("/deals/{account_number}")
+async def get_deals(
+    account_number: int = Depends(owned_account),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    limit = min(limit or config.PAGE_DEFAULT_LIMIT, config.PAGE_MAX_LIMIT)
+    deals, next_cursor = await query_deals(session, account_number, date_from, date_to, cursor, limit)
+    return {"deals": deals, "next_cursor": next_cursor}
+
+# Trade analytics over the stored history: equity curve drawdowns, per-day and per-symbol P&L,
+# win rate and profit factor. starting_balance defaults to the balance implied by the last sync.
+@meta_router.get("/analytics/{account_number}")
+async def get_analytics(
+    account_number: int = Depends(owned_account),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    starting_balance: Optional[float] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    from analytics import summarize
+
+    deals = await load_account_deals(session, account_number, date_from, date_to)
+    if starting_balance is None:
+        starting_balance = await opening_balance(session, account_number, date_from)
+    return await run_in_threadpool(summarize, deals, starting_balance)
+
+EQUITY_RESOLUTIONS = {"raw": RAW, "hour": HOUR, "day": DAY}
+
+# Equity and balance history from the background snapshots (EQUITY_SNAPSHOT_ENABLED), without
+# the terminal or the account password. The resolution defaults to the finest one still
+# retained for date_from; the default range is the last day
+@meta_router.get("/equity/{account_number}")
+async def get_equity_history(
+    account_number: int = Depends(owned_account),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    resolution: Optional[Literal["raw", "hour", "day"]] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    now = int(time.time())
+    end = int(date_to.timestamp()) if date_to else now + 1
+    start = int(date_from.timestamp()) if date_from else now - DAY
+    step = EQUITY_RESOLUTIONS[resolution] if resolution else resolution_for(start, now)
+    points = await equity_points(session, account_number, step, start, end)
+
+    # Same (UTC) day boundary as fetch_account_details
+    today_start = day_start(now)
+    today = await equity_points(session, account_number, RAW, today_start, now + 1)
+    return {
+        "resolution": next(name for name, value in EQUITY_RESOLUTIONS.items() if value == step),
+        "points": [
+            {
+                "time": point.time,
+                "resolution": point.resolution,
+                "equity": point.equity,
+                "equity_min": point.equity_min,
+                "equity_max": point.equity_max,
+                "balance": point.balance,
+            }
+            for point in points
+        ],
+        "max_drawdown": max_drawdown_pct(points),
+        "daily_drawdown": max_drawdown_pct(today),
     }
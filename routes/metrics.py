@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from metrics import render
+
+metrics_router = APIRouter()
+
+# Prometheus scrape endpoint; only mounted when METRICS_ENABLED is on
+@metrics_router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,4 @@
+from sqlmodel import SQLModel, Field
+
+class ChatRequest(SQLModel):
+    question: str = Field(min_length=1, max_length=4000)
@@ -0,0 +1,7 @@
+from sqlmodel import SQLModel
+
+class CompleteOrderItem(SQLModel):
+    order_id: int
+    server: str
+    platform_login: str
+    platform_password: str
@@ -0,0 +1,321 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from fastapi import HTTPException, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+import config
+from metrics import timer
+from models.knowledge import Document
+from models.order import OrderModel
+
+
+@dataclass
+class BlobInfo:
+    key: str  # sha256 hex digest of the content
+    size: int
+    content_type: str
+
+
+# Stream an upload into a spooled temp file, hashing as it arrives and enforcing the size cap
+async def _spool_upload(upload: UploadFile, max_bytes: int):
+    digest = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(delete=False, dir=config.BLOB_TMP_DIR or None)
+    try:
+        while True:
+            chunk = await upload.read(config.BLOB_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds the {max_bytes} byte limit",
+                )
+            digest.update(chunk)
+            await run_in_threadpool(tmp.write, chunk)
+        tmp.close()
+        return tmp.name, digest.hexdigest(), size
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+
+
+class LocalBlobStore:
+    """Content-addressed blobs on disk: <root>/<k[0:2]>/<k[2:4]>/<key>."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[0:2], key[2:4], key)
+
+    def _store_file(self, tmp_path: str, key: str) -> None:
+        target = self.path(key)
+        if os.path.exists(target):
+            # Same content already stored
+            os.unlink(tmp_path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    def put_bytes(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        target = self.path(key)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with tempfile.NamedTemporaryFile(delete=False, dir=os.path.dirname(target)) as tmp:
+                tmp.write(data)
+            os.replace(tmp.name, target)
+        return key
+
+    def get_bytes(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(config.BLOB_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    """Content-addressed blobs in an S3-compatible bucket (needs boto3)."""
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=config.S3_ENDPOINT_URL or None,
+            aws_access_key_id=config.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=config.S3_SECRET_ACCESS_KEY or None,
+            region_name=config.S3_REGION or None,
+        )
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _store_file(self, tmp_path: str, key: str) -> None:
+        try:
+            if not self.exists(key):
+                self.client.upload_file(tmp_path, self.bucket, self.object_key(key))
+        finally:
+            os.unlink(tmp_path)
+
+    def put_bytes(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        if not self.exists(key):
+            self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+        return key
+
+    def get_bytes(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"].read()
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes={start}-{end}"
+        )
+        yield from response["Body"].iter_chunks(config.BLOB_CHUNK_SIZE)
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+
+def _make_store():
+    if config.BLOB_BACKEND == "s3":
+        return S3BlobStore(config.S3_BUCKET, config.S3_PREFIX)
+    return LocalBlobStore(config.BLOB_DIR)
+
+
+blob_store = _make_store()
+
+
+# Stream an upload into the blob store and return its content address
+async def save_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> BlobInfo:
+    tmp_path, key, size = await _spool_upload(upload, max_bytes or config.BLOB_MAX_BYTES)
+    await run_in_threadpool(blob_store._store_file, tmp_path, key)
+    return BlobInfo(key=key, size=size, content_type=upload.content_type or "application/octet-stream")
+
+
+# Delete stored blobs that no row refers to. Keys are shared by every upload of the same bytes,
+# so a key still used by an order screenshot, thumbnail or knowledge-base document is kept
+async def delete_unreferenced(session, keys) -> None:
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    used = set((await session.exec(select(OrderModel.img_blob).where(OrderModel.img_blob.in_(keys)))).all())
+    used.update((await session.exec(select(OrderModel.img_thumb).where(OrderModel.img_thumb.in_(keys)))).all())
+    used.update((await session.exec(select(Document.blob).where(Document.blob.in_(keys)))).all())
+    for key in keys - used:
+        await run_in_threadpool(blob_store.delete, key)
+
+
+# Image types the API serves back inline; anything else (HTML, SVG, ...) would run in its origin
+IMAGE_CONTENT_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp")
+
+# Leading bytes of each of those types
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+# The image type of a file from its first 12 bytes, or None when it isn't one we serve
+def sniff_image_type(head: bytes) -> Optional[str]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+# Image types of the stored blobs among `keys` (None for those that aren't images); missing keys are left out
+def sniff_blobs(keys) -> dict[str, Optional[str]]:
+    return {
+        key: sniff_image_type(b"".join(blob_store.iter_range(key, 0, 11)))
+        for key in keys if blob_store.exists(key)
+    }
+
+
+# Sniff a spooled file, then let Pillow (if installed) check that it actually decodes
+def _check_image(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        content_type = sniff_image_type(f.read(12))
+    if content_type is None:
+        return None
+    try:
+        from PIL import Image
+    except ImportError:
+        return content_type
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        return None
+    return content_type
+
+
+# Like save_upload, for images served back to browsers: the content type comes from the bytes,
+# never the client, and anything that isn't a PNG, JPEG, GIF or WebP is refused with 415
+async def save_image_upload(upload: UploadFile, max_bytes: Optional[int] = None) -> BlobInfo:
+    tmp_path, key, size = await _spool_upload(upload, max_bytes or config.BLOB_MAX_BYTES)
+    try:
+        content_type = await run_in_threadpool(_check_image, tmp_path)
+        if content_type is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="The image must be a PNG, JPEG, GIF or WebP file",
+            )
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    await run_in_threadpool(blob_store._store_file, tmp_path, key)
+    return BlobInfo(key=key, size=size, content_type=content_type)
+
+
+# Build a small JPEG thumbnail blob if Pillow is installed; returns None otherwise
+def make_thumbnail(key: str) -> Optional[str]:
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    import io
+
+    try:
+        with timer("thumbnail"):
+            image = Image.open(io.BytesIO(blob_store.get_bytes(key)))
+            image.thumbnail((config.THUMBNAIL_SIZE, config.THUMBNAIL_SIZE))
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=70)
+    except Exception:
+        return None
+    return blob_store.put_bytes(out.getvalue())
+
+
+# Parse a single "bytes=start-end" Range header; returns None when absent or unsupported
+def _parse_range(header: Optional[str], size: int):
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: the last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={"Content-Range": f"bytes */{size}"})
+    if start >= size or end < start:
+        raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+# Stream a blob with ETag, If-None-Match and single-range support
+def blob_response(request: Request, key: str, size: int, content_type: str) -> Response:
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-addressed, so the bytes behind a key never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range and if_range.strip() != etag:
+        byte_range = None
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(blob_store.iter_range(key, 0, size - 1), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        blob_store.iter_range(key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=content_type,
+        headers=headers,
+    )
@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+# Settings are read when config is first imported, so they go in before any app module
+_workdir = tempfile.mkdtemp(prefix="rag-be-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "JWT_SECRET_KEY": "test-secret",
+    "BLOB_DIR": os.path.join(_workdir, "blobs"),
+    "VECTOR_INDEX_DIR": os.path.join(_workdir, "vectors"),
+    "MAIL_SENDER_ENABLED": "false",
+    "SMTP_HOST": "127.0.0.1",
+    "SMTP_USERNAME": "",
+    "SMTP_STARTTLS": "false",
+    "MAIL_FROM": "noreply@example.com",
+    "LLM_PROVIDER": "fake",
+    "EMBEDDING_PROVIDER": "hashing",
+    "BCRYPT_ROUNDS": "4",
+    "ADMISSION_ENABLED": "false",
+    "MT5_MODULE": "benchmarks.fake_mt5",
+    "FAKE_MT5_DEALS": "200",
+})
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from datetime import datetime  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+import db  # noqa: E402
+import migrate  # noqa: E402, F401  (imports every table model)
+import response_cache  # noqa: E402
+from auth import create_access_token, user_cache, user_token_claims  # noqa: E402
+from models.order import CompleteOrderModel, OrderModel  # noqa: E402
+from models.user import User  # noqa: E402
+from routes.auth import auth_router  # noqa: E402
+from routes.bot import bot_router  # noqa: E402
+from routes.chat import chat_router  # noqa: E402
+from routes.meta import meta_router  # noqa: E402
+from routes.order import order_router  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+# Every test starts from empty tables and empty caches; the engine's connections belong to the
+# test's event loop, so they are closed after it
+@pytest.fixture(autouse=True)
+async def database(anyio_backend, monkeypatch):
+    await db.create_db_and_tables()
+    async with db.engine.begin() as conn:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            await conn.execute(table.delete())
+    monkeypatch.setattr(response_cache, "response_cache", response_cache.ResponseCache())
+    user_cache.clear()
+    yield
+    await db.engine.dispose()
+
+
+# The routers without hello.py's lifespan and middleware (which tracks queries per request)
+@pytest.fixture
+async def client():
+    app = FastAPI()
+    for router in (auth_router, order_router, meta_router, bot_router, chat_router):
+        app.include_router(router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+# Insert orders directly: add_orders(3, email="a@example.com") -> their ids
+@pytest.fixture
+def add_orders():
+    async def add(count: int, completed: bool = False, created_at: datetime = None, **values) -> list[int]:
+        async with db.async_session() as session:
+            orders = []
+            for i in range(count):
+                fields = {
+                    "username": f"trader{i}", "email": f"trader{i}@example.com", "challenge_type": "phase one",
+                    "account_size": "100k", "platform": "mt5", "payment_method": "usdt",
+                    "txid": f"0x{os.urandom(16).hex()}", "img_blob": "0" * 64, "img_size": 1,
+                    "img_content_type": "image/png",
+                }
+                if created_at is not None:
+                    fields["created_at"] = created_at
+                fields.update(values)
+                orders.append(OrderModel(**fields))
+            session.add_all(orders)
+            await session.commit()
+            if completed:
+                session.add_all([
+                    CompleteOrderModel(
+                        order_id=order.id, server="Demo-1", platform_login=str(1000 + order.id), platform_password="pw",
+                    )
+                    for order in orders
+                ])
+                await session.commit()
+            return [order.id for order in orders]
+
+    return add
+
+
+# Insert a user and return it with a bearer token for it
+@pytest.fixture
+def add_user():
+    async def add(email: str = "user@example.com", **values) -> tuple[User, dict]:
+        fields = {
+            "username": email.split("@")[0], "email": email, "hashed_password": "x", "name": "Test User",
+            "phone_no": "0", "country": "PK", "address": "Street 1",
+        }
+        fields.update(values)
+        async with db.async_session() as session:
+            user = User(**fields)
+            session.add(user)
+            await session.commit()
+        token = create_access_token(user_token_claims(user))
+        return user, {"Authorization": f"Bearer {token}"}
+
+    return add
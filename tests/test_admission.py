@@ -0,0 +1,110 @@
+import asyncio
+import httpx
+import pytest
+from starlette.responses import PlainTextResponse
+import config
+from admission import AdmissionMiddleware, RouteLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+# A route that holds its slot until `release` is set
+class SlowApp:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.running = 0
+
+    async def __call__(self, scope, receive, send):
+        self.running += 1
+        if scope["path"] == "/slow":
+            await self.release.wait()
+        await PlainTextResponse("ok")(scope, receive, send)
+
+
+@pytest.fixture(autouse=True)
+def no_cpu(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_CPU_PERCENT", 0.0)
+
+
+def make_client(app, **limiters) -> httpx.AsyncClient:
+    middleware = AdmissionMiddleware(app, {("GET", path): limiter for path, limiter in limiters.items()})
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test")
+
+
+async def until(condition) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("condition never held")
+
+
+async def test_client_over_its_rate_gets_429_with_retry_after():
+    limiter = RouteLimiter("fast", concurrency=4, max_queue=4, rate=0.5, burst=2)
+    async with make_client(SlowApp(), **{"/fast": limiter}) as client:
+        assert [(await client.get("/fast")).status_code for _ in range(2)] == [200, 200]
+        response = await client.get("/fast")
+        assert response.status_code == 429
+        # One token at 0.5 a second
+        assert response.headers["Retry-After"] == "2"
+    assert limiter.rejected["rate"] == 1
+
+
+async def test_other_clients_and_routes_are_not_limited(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_TRUST_FORWARDED", True)
+    limiter = RouteLimiter("fast", concurrency=4, max_queue=4, rate=0.5, burst=1)
+    async with make_client(SlowApp(), **{"/fast": limiter}) as client:
+        assert (await client.get("/fast", headers={"X-Forwarded-For": "10.0.0.1"})).status_code == 200
+        assert (await client.get("/fast", headers={"X-Forwarded-For": "10.0.0.1"})).status_code == 429
+        assert (await client.get("/fast", headers={"X-Forwarded-For": "10.0.0.2"})).status_code == 200
+        assert [(await client.get("/other")).status_code for _ in range(5)] == [200] * 5
+
+
+async def test_full_queue_gets_503_with_retry_after():
+    app = SlowApp()
+    limiter = RouteLimiter("slow", concurrency=1, max_queue=1)
+    async with make_client(app, **{"/slow": limiter}) as client:
+        running = asyncio.create_task(client.get("/slow"))
+        await until(lambda: app.running == 1)
+        waiting = asyncio.create_task(client.get("/slow"))
+        await until(lambda: limiter.queued == 1)
+
+        response = await client.get("/slow")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        app.release.set()
+        assert [r.status_code for r in await asyncio.gather(running, waiting)] == [200, 200]
+    assert limiter.rejected["overload"] == 1
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+
+async def test_request_that_waits_too_long_gets_503(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_QUEUE_TIMEOUT", 0.05)
+    app = SlowApp()
+    limiter = RouteLimiter("slow", concurrency=1, max_queue=4)
+    async with make_client(app, **{"/slow": limiter}) as client:
+        running = asyncio.create_task(client.get("/slow"))
+        await until(lambda: app.running == 1)
+
+        response = await client.get("/slow")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        # The timed-out request left the queue, and the slot is free again afterwards
+        assert limiter.queued == 0
+
+        app.release.set()
+        assert (await running).status_code == 200
+        assert (await client.get("/slow")).status_code == 200
+    assert limiter.rejected["timeout"] == 1
+    assert limiter.active == 0
+
+
+async def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_MAX_RETRY_AFTER", 5.0)
+    limiter = RouteLimiter("fast", concurrency=1, max_queue=1, rate=0.001, burst=1)
+    async with make_client(SlowApp(), **{"/fast": limiter}) as client:
+        await client.get("/fast")
+        response = await client.get("/fast")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,114 @@
+import random
+import numpy as np
+import pytest
+from analytics import DEAL_TYPE_BALANCE, load_deals, max_drawdown, summarize, todays_drawdown_pct
+from equity import DAY, day_start
+
+
+# The plain loops the vectorized code replaces
+def reference_drawdown(curve: list[float]) -> tuple[float, float]:
+    peak = curve[0]
+    deepest = deepest_pct = 0.0
+    for value in curve:
+        peak = max(peak, value)
+        deepest = max(deepest, peak - value)
+        if peak > 0:
+            deepest_pct = max(deepest_pct, (peak - value) / peak)
+    return deepest, deepest_pct
+
+
+def reference_daily(records: list[tuple], starting_balance: float) -> list[tuple]:
+    days, equity, current = [], starting_balance, None
+    for time, _, _, profit, commission, swap, _ in records:
+        opening, equity = equity, equity + profit + commission + swap
+        day = time // DAY
+        if day != current:
+            current, peak, pnl, deepest, deepest_pct = day, opening, 0.0, 0.0, 0.0
+            days.append(None)
+        peak = max(peak, equity)
+        pnl += profit + commission + swap
+        deepest = max(deepest, peak - equity)
+        deepest_pct = max(deepest_pct, (peak - equity) / peak)
+        days[-1] = (day, pnl, deepest, deepest_pct)
+    return days
+
+
+def random_records(seed: int, count: int = 400) -> list[tuple]:
+    rng = random.Random(seed)
+    start = 1_700_000_000
+    times = sorted(rng.randint(start, start + 20 * DAY) for _ in range(count))
+    return [
+        (t, rng.choice((0, 1)), 1, round(rng.gauss(2, 60), 2), -0.5, round(rng.uniform(-1, 1), 2), rng.choice("ABC"))
+        for t in times
+    ]
+
+
+def test_percentage_drawdown_is_not_taken_at_the_largest_absolute_fall():
+    # A halving of a small peak, then a 10% slip from a large one
+    amount, pct = max_drawdown(np.array([100.0, 50.0, 1000.0, 900.0]))
+    assert amount == 100.0
+    assert pct == 0.5
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_max_drawdown_matches_the_reference_loop(seed):
+    rng = random.Random(seed)
+    curve = [1000.0]
+    for _ in range(500):
+        curve.append(max(1.0, curve[-1] + rng.gauss(0, 40)))
+    amount, pct = max_drawdown(np.array(curve))
+    expected_amount, expected_pct = reference_drawdown(curve)
+    assert amount == pytest.approx(expected_amount)
+    assert pct == pytest.approx(expected_pct)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_summary_matches_the_reference_loops(seed):
+    records = random_records(seed)
+    summary = summarize(load_deals(records), starting_balance=10_000.0)
+
+    nets = [profit + commission + swap for _, _, _, profit, commission, swap, _ in records]
+    curve = [10_000.0]
+    for net in nets:
+        curve.append(curve[-1] + net)
+    amount, pct = reference_drawdown(curve)
+    assert summary["net_pnl"] == pytest.approx(sum(nets))
+    assert summary["final_equity"] == pytest.approx(curve[-1])
+    assert summary["max_drawdown"] == pytest.approx(amount)
+    assert summary["max_drawdown_pct"] == pytest.approx(pct * 100)
+    assert summary["win_rate"] == pytest.approx(sum(net > 0 for net in nets) / len(nets))
+    gross_loss = -sum(net for net in nets if net < 0)
+    assert summary["profit_factor"] == pytest.approx(sum(net for net in nets if net > 0) / gross_loss)
+
+    daily = reference_daily(records, 10_000.0)
+    assert len(summary["daily"]) == len(daily)
+    for row, (day, pnl, deepest, deepest_pct) in zip(summary["daily"], daily):
+        assert row["date"] == np.datetime64(day, "D").item().isoformat()
+        assert row["pnl"] == pytest.approx(pnl)
+        assert row["drawdown"] == pytest.approx(deepest)
+        assert row["drawdown_pct"] == pytest.approx(deepest_pct * 100)
+
+    symbols = {}
+    for record, net in zip(records, nets):
+        symbols[record[6]] = symbols.get(record[6], 0.0) + net
+    assert summary["symbols"] == pytest.approx(symbols)
+
+
+def test_balance_operations_count_towards_equity_but_not_trades():
+    records = [(1_700_000_000, DEAL_TYPE_BALANCE, 0, 500.0, 0.0, 0.0, ""), (1_700_000_100, 0, 1, -50.0, 0.0, 0.0, "A")]
+    summary = summarize(load_deals(records), starting_balance=1000.0)
+    assert summary["trades"] == 1 and summary["win_rate"] == 0.0
+    assert summary["final_equity"] == 1450.0
+
+
+def test_todays_drawdown_runs_from_the_opening_balance_to_live_equity():
+    # Opened at 1000, lost 100, made 50 back, and the open positions are 60 down
+    pct = todays_drawdown_pct(950.0, 890.0, np.array([-100.0, 50.0]))
+    assert pct == pytest.approx(11.0)
+    assert todays_drawdown_pct(1000.0, 1000.0, np.array([])) is None
+
+
+def test_days_start_at_midnight_utc():
+    assert day_start(3 * DAY) == 3 * DAY
+    assert day_start(3 * DAY + 86399) == 3 * DAY
+    assert day_start() % DAY == 0
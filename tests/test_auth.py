@@ -0,0 +1,62 @@
+import pytest
+from auth import create_access_token, user_cache
+from db import async_session, track_queries
+from models.user import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_current_user_is_served_from_the_cache(client, add_user):
+    user, headers = await add_user()
+    with track_queries() as stats:
+        assert (await client.get("/auth/user/me", headers=headers)).json()["email"] == user.email
+    assert stats.count == 1
+    with track_queries() as stats:
+        assert (await client.get("/auth/user/me", headers=headers)).status_code == 200
+    assert stats.count == 0
+
+
+async def test_cached_user_is_dropped_when_the_change_commits(client, add_user):
+    user, headers = await add_user()
+    await client.get("/auth/user/me", headers=headers)
+    async with async_session() as session:
+        row = await session.get(User, user.id)
+        row.name = "Renamed"
+        session.add(row)
+        await session.flush()
+        # Not committed yet: other requests still see the old row, so the cached copy stays
+        assert user_cache.get(user.id)["name"] == "Test User"
+        await session.commit()
+    assert (await client.get("/auth/user/me", headers=headers)).json()["name"] == "Renamed"
+
+
+async def test_rolled_back_change_keeps_the_cached_user(client, add_user):
+    user, headers = await add_user()
+    await client.get("/auth/user/me", headers=headers)
+    async with async_session() as session:
+        row = await session.get(User, user.id)
+        row.name = "Never saved"
+        session.add(row)
+        await session.flush()
+        await session.rollback()
+    with track_queries() as stats:
+        assert (await client.get("/auth/user/me", headers=headers)).json()["name"] == "Test User"
+    assert stats.count == 0
+
+
+async def test_deleted_user_is_refused(client, add_user):
+    user, headers = await add_user()
+    await client.get("/auth/user/me", headers=headers)
+    async with async_session() as session:
+        await session.delete(await session.get(User, user.id))
+        await session.commit()
+    response = await client.get("/auth/user/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "User not found"
+
+
+@pytest.mark.parametrize("sub", ["not-an-id", ["1"], {"id": 1}])
+async def test_token_whose_subject_is_not_an_id_is_a_401(client, sub):
+    token = create_access_token({"sub": sub})
+    response = await client.get("/auth/user/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
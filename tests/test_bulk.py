@@ -0,0 +1,142 @@
+import csv
+import io
+import pytest
+from openpyxl import Workbook
+from PIL import Image
+from sqlmodel import func, select
+import config
+from db import async_session, track_queries
+from models.mail import OutboxMail
+from models.order import CompleteOrderModel, OrderModel
+from routes.order import ORDER_IMPORT_COLUMNS
+from storage import blob_store
+
+pytestmark = pytest.mark.anyio
+
+
+def completion(order_id: int) -> dict:
+    return {"order_id": order_id, "server": "Demo-1", "platform_login": str(5000 + order_id), "platform_password": "pw"}
+
+
+def stored_png() -> str:
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), (10, 20, 30)).save(out, format="PNG")
+    return blob_store.put_bytes(out.getvalue())
+
+
+def import_row(txid: str, blob: str, **values) -> dict:
+    row = {
+        "username": "trader", "email": "trader@example.com", "challenge_type": "phase one", "account_size": "100k",
+        "platform": "mt5", "payment_method": "usdt", "txid": txid, "img_blob": blob, "img_size": "68",
+    }
+    row.update(values)
+    return row
+
+
+def as_csv(rows: list[dict]) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=ORDER_IMPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue().encode()
+
+
+def as_xlsx(rows: list[dict]) -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(list(ORDER_IMPORT_COLUMNS))
+    for row in rows:
+        sheet.append([row[name] for name in ORDER_IMPORT_COLUMNS])
+    out = io.BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+async def count(model) -> int:
+    async with async_session() as session:
+        return (await session.exec(select(func.count()).select_from(model))).one()
+
+
+async def test_complete_orders_reports_each_item(client, add_orders):
+    first, second, done = await add_orders(3)
+    assert (await client.post(f"/order/complete_order/{done}", data=completion(done))).status_code == 200
+
+    items = [completion(first), completion(999), completion(done), completion(second), completion(first)]
+    with track_queries() as stats:
+        response = await client.post("/order/complete_orders", json=items)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (2, 3)
+    assert [result["status"] for result in body["results"]] == ["ok", "error", "error", "ok", "error"]
+    assert body["results"][1]["error"] == "Order not found"
+    assert body["results"][2]["error"] == "Order already completed"
+    assert body["results"][4]["error"] == "Order appears more than once in this request"
+    # One lookup, one executemany INSERT and the commit, whatever the batch size
+    assert stats.count == 3
+    assert await count(CompleteOrderModel) == 3
+
+
+async def test_complete_orders_refuses_an_oversized_batch(client, monkeypatch):
+    monkeypatch.setattr(config, "BULK_MAX_ITEMS", 2)
+    response = await client.post("/order/complete_orders", json=[completion(i) for i in range(3)])
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("format", ["csv", "xlsx"])
+async def test_import_creates_the_valid_rows_and_reports_the_rest(client, add_orders, format):
+    blob = stored_png()
+    [taken] = await add_orders(1, txid="0xtaken")
+    rows = [
+        import_row("0x1", blob),
+        import_row("0xtaken", blob),
+        import_row("0x2", blob, email=""),
+        import_row("0x3", blob, img_size="big"),
+        import_row("0x4", "f" * 64),
+        import_row("0x1", blob),
+        import_row("0x5", blob),
+    ]
+    body = as_csv(rows) if format == "csv" else as_xlsx(rows)
+    response = await client.post("/order/orders/import", files={"file": (f"orders.{format}", body)})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["ok", "error", "error", "error", "error", "error", "ok"]
+    assert results[1]["error"] == "This transaction ID has already been used for an order"
+    assert results[2]["error"] == "Missing email"
+    assert results[3]["error"] == "img_size must be a number"
+    assert results[4]["error"] == "Screenshot not found in the blob store"
+    assert results[5]["error"] == "This transaction ID has already been used for an order"
+
+    async with async_session() as session:
+        orders = (await session.exec(select(OrderModel).where(OrderModel.id != taken).order_by(OrderModel.id))).all()
+    assert [order.txid for order in orders] == ["0x1", "0x5"]
+    assert [f"FDH{order.id}" for order in orders] == [results[0]["id"], results[6]["id"]]
+    assert orders[0].img_content_type == "image/png"
+
+
+async def test_import_refuses_a_blob_that_is_not_an_image(client):
+    blob = blob_store.put_bytes(b"<html></html>")
+    response = await client.post("/order/orders/import", files={"file": ("orders.csv", as_csv([import_row("0x1", blob)]))})
+    assert response.json()["results"][0]["error"] == "Screenshot must be a PNG, JPEG, GIF or WebP image"
+    assert await count(OrderModel) == 0
+
+
+async def test_import_can_queue_the_order_emails(client):
+    blob = stored_png()
+    rows = [import_row("0x1", blob), import_row("0x2", blob)]
+    response = await client.post(
+        "/order/orders/import", params={"notify": "true"}, files={"file": ("orders.csv", as_csv(rows))}
+    )
+    assert response.json()["succeeded"] == 2
+    assert await count(OutboxMail) == 2
+
+
+async def test_unreadable_or_oversized_import_is_refused(client, monkeypatch):
+    response = await client.post("/order/orders/import", files={"file": ("orders.xlsx", b"not a workbook")})
+    assert response.status_code == 400
+
+    monkeypatch.setattr(config, "BULK_MAX_ITEMS", 1)
+    blob = stored_png()
+    rows = [import_row("0x1", blob), import_row("0x2", blob)]
+    response = await client.post("/order/orders/import", files={"file": ("orders.csv", as_csv(rows))})
+    assert response.status_code == 413
+    assert await count(OrderModel) == 0
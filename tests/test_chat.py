@@ -0,0 +1,93 @@
+import json
+import uuid
+import pytest
+from conversation import conversation_summarizer
+from ingest import ingestion_worker
+from llm import get_chat_model
+
+pytestmark = pytest.mark.anyio
+
+DOCUMENT = (
+    "Funded accounts are paid out every fourteen days. "
+    "The daily drawdown limit is five percent of the starting balance. "
+    "Weekend holding is allowed on every challenge type."
+)
+
+
+@pytest.fixture
+async def bot(client):
+    # Vector indexes and cached answers outlive the tables, so every test gets its own bot
+    bot_id = f"bot-{uuid.uuid4().hex[:12]}"
+    yield bot_id
+    await ingestion_worker.stop()
+    await conversation_summarizer.stop()
+
+
+async def upload(client, bot_id: str, headers: dict) -> dict:
+    response = await client.post(
+        f"/bots/{bot_id}/documents", files={"files": ("rules.txt", DOCUMENT.encode(), "text/plain")}, headers=headers
+    )
+    assert response.status_code == 202, response.text
+    await ingestion_worker.join()
+    [document] = response.json()["documents"]
+    response = await client.get(f"/bots/{bot_id}/documents/{document['id']}")
+    return response.json()
+
+
+def events(body: str) -> list[tuple[str, dict]]:
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+async def ask(client, bot_id: str, headers: dict, question: str) -> tuple[str, dict]:
+    response = await client.post(f"/chat/{bot_id}", json={"question": question}, headers=headers)
+    assert response.status_code == 200, response.text
+    parsed = events(response.text)
+    text = "".join(data["text"] for event, data in parsed if event == "token")
+    event, done = parsed[-1]
+    assert event == "done"
+    return text, done
+
+
+async def test_answer_is_grounded_in_the_uploaded_document(client, bot, add_user):
+    _, headers = await add_user()
+    document = await upload(client, bot, headers)
+    assert document["status"] == "ready"
+    model = get_chat_model()
+    calls = model.calls
+
+    text, done = await ask(client, bot, headers, "How often are payouts?")
+    assert model.calls == calls + 1
+    assert "fourteen days" in text
+    assert done["cached"] is False
+    assert {source["document_id"] for source in done["sources"]} == {document["id"]}
+
+    response = await client.get(f"/chat/{bot}/conversation", headers=headers)
+    assert [turn["role"] for turn in response.json()["turns"]] == ["user", "assistant"]
+
+
+async def test_same_opening_question_is_answered_from_the_cache(client, bot, add_user):
+    _, first = await add_user("first@example.com")
+    _, second = await add_user("second@example.com")
+    await upload(client, bot, first)
+    text, _ = await ask(client, bot, first, "What is the daily drawdown limit?")
+    calls = get_chat_model().calls
+
+    cached_text, done = await ask(client, bot, second, "What is the daily drawdown limit?")
+    assert done["cached"] is True
+    assert cached_text == text
+    assert get_chat_model().calls == calls
+
+
+async def test_new_document_retires_cached_answers(client, bot, add_user):
+    _, headers = await add_user()
+    _, other = await add_user("other@example.com")
+    await upload(client, bot, headers)
+    await ask(client, bot, headers, "Is weekend holding allowed?")
+    await upload(client, bot, headers)
+    _, done = await ask(client, bot, other, "Is weekend holding allowed?")
+    assert done["cached"] is False
+
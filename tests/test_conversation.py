@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+import config
+import db
+from conversation import (
+    MESSAGE_OVERHEAD, build_prompt, conversation_summarizer, estimate_tokens, load_conversation, record_turns,
+    truncate_to_tokens,
+)
+from models.conversation import Conversation, ConversationTurn
+
+pytestmark = pytest.mark.anyio
+
+BOT = "rules-bot"
+
+
+def turn(role: str, words: int, tag: str = "") -> SimpleNamespace:
+    content = f"{tag} " + " ".join(["word"] * words)
+    return SimpleNamespace(role=role, content=content, tokens=estimate_tokens(content))
+
+
+def chunk(i: int, words: int) -> dict:
+    return {"chunk_id": i, "text": f"chunk{i} " + " ".join(["fact"] * words)}
+
+
+def prompt_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def test_truncation_cuts_to_about_the_token_count():
+    text = " ".join(["word"] * 1000)
+    assert truncate_to_tokens("short text", 100) == "short text"
+    assert estimate_tokens(truncate_to_tokens(text, 100)) <= 100
+
+
+@pytest.mark.parametrize("budget", [500, 1500, 3000])
+def test_prompt_stays_within_the_budget_however_long_the_conversation(budget):
+    turns = [turn("user" if i % 2 == 0 else "assistant", 60, tag=f"t{i}") for i in range(60)]
+    chunks = [chunk(i, 150) for i in range(20)]
+    summary = " ".join(["summary"] * 2000)
+    messages, used, estimate = build_prompt(" ".join(["why"] * 5000), summary, turns, chunks, budget)
+    assert estimate <= budget
+    assert prompt_tokens(messages) <= budget
+    # The newest turns are the ones kept, in order, and the best chunks are the ones used
+    kept = [m["content"].split()[0] for m in messages[1:-1]]
+    assert kept == [f"t{i}" for i in range(60 - len(kept), 60)]
+    assert [c["chunk_id"] for c in used] == list(range(len(used)))
+
+
+def test_history_only_takes_its_share_so_context_still_fits():
+    turns = [turn("user", 200, tag=f"t{i}") for i in range(30)]
+    messages, used, _ = build_prompt("question?", "", turns, [chunk(i, 100) for i in range(5)], 3000)
+    assert len(messages) - 2 < 30
+    assert used
+
+
+async def test_concurrent_first_requests_share_one_conversation(add_user):
+    user, _ = await add_user()
+    (first, _), (second, _) = await asyncio.gather(load_conversation(user.id, BOT), load_conversation(user.id, BOT))
+    assert first.id == second.id
+
+
+@pytest.fixture
+async def foreign_keys():
+    # SQLite only enforces them when asked, per connection
+    def enable(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    await db.engine.dispose()
+    event.listen(db.engine.sync_engine, "connect", enable)
+    yield
+    event.remove(db.engine.sync_engine, "connect", enable)
+    await db.engine.dispose()
+
+
+async def test_conversation_for_a_missing_user_raises_the_insert_error(foreign_keys):
+    with pytest.raises(IntegrityError):
+        await load_conversation(999_999, BOT)
+
+
+async def test_old_turns_are_folded_into_the_summary(add_user, monkeypatch):
+    monkeypatch.setattr(config, "CHAT_HISTORY_TOKENS", 200)
+    user, _ = await add_user()
+    conversation, _ = await load_conversation(user.id, BOT)
+    for i in range(6):
+        pending = await record_turns(conversation.id, f"question {i} " + "about payouts " * 10, f"answer {i} " + "ok " * 30)
+    assert pending > config.CHAT_HISTORY_TOKENS
+
+    conversation_summarizer.schedule(conversation.id)
+    conversation_summarizer.schedule(conversation.id)
+    await conversation_summarizer.join()
+    assert conversation_summarizer.failures == 0
+
+    async with db.async_session() as session:
+        stored = await session.get(Conversation, conversation.id)
+        turns = (await session.exec(
+            select(ConversationTurn).where(ConversationTurn.conversation_id == conversation.id).order_by(ConversationTurn.seq)
+        )).all()
+    assert stored.summary and estimate_tokens(stored.summary) <= config.CHAT_SUMMARY_TOKENS
+    # Whole exchanges were folded, oldest first, down to half the history budget
+    assert turns[0].role == "user" and turns[0].seq == stored.summarized_through + 1
+    assert sum(t.tokens for t in turns) <= config.CHAT_HISTORY_TOKENS // 2 or len(turns) == 2
+    assert turns[-1].content.startswith("answer 5")
+
+    # Nothing left over the budget: a second pass is a no-op
+    assert await conversation_summarizer.summarize(conversation.id) is False
+
+
+async def test_the_latest_exchange_stays_verbatim_whatever_its_size(add_user, monkeypatch):
+    monkeypatch.setattr(config, "CHAT_HISTORY_TOKENS", 50)
+    user, _ = await add_user()
+    conversation, _ = await load_conversation(user.id, BOT)
+    await record_turns(conversation.id, "q " * 100, "a " * 100)
+    assert await conversation_summarizer.summarize(conversation.id) is False
+    await record_turns(conversation.id, "second " * 100, "reply " * 100)
+    assert await conversation_summarizer.summarize(conversation.id) is True
+    _, turns = await load_conversation(user.id, BOT)
+    assert [t.role for t in turns] == ["user", "assistant"]
+    assert turns[0].content.startswith("second")
@@ -0,0 +1,111 @@
+import pytest
+from sqlmodel import func, select
+from db import async_session
+from deal_store import sync_deals
+from models.deal import Deal
+from models.order import CompleteOrderModel
+from mt5_pool import terminal_pool
+
+pytestmark = pytest.mark.anyio
+
+ACCOUNT = 5001
+
+
+def deal(ticket: int, time: int, profit: float) -> dict:
+    return {"ticket": ticket, "time": time, "type": 0, "volume": 0.1, "price": 1.1, "profit": profit, "symbol": "EURUSD"}
+
+
+class FakeTerminal:
+    """Answers history_deals_get with the deals inside the requested window."""
+
+    def __init__(self, deals: list[dict]):
+        self.deals = deals
+        self.windows = []
+
+    async def call(self, method: str, date_from, date_to):
+        assert method == "history_deals_get"
+        self.windows.append((date_from, date_to))
+        return [d for d in self.deals if date_from.timestamp() <= d["time"] <= date_to.timestamp()]
+
+
+async def stored_tickets() -> list[int]:
+    async with async_session() as session:
+        return list((await session.exec(select(Deal.ticket).where(Deal.account == ACCOUNT).order_by(Deal.ticket))).all())
+
+
+async def test_sync_only_adds_deals_past_the_high_water_mark():
+    terminal = FakeTerminal([deal(1, 1_700_000_000, 10.0), deal(2, 1_700_000_100, -4.0)])
+    async with async_session() as session:
+        state = await sync_deals(session, terminal, ACCOUNT, balance=1006.0)
+    assert (state.deal_count, state.total_pnl, state.last_deal_time) == (2, 6.0, 1_700_000_100)
+
+    # One more deal in the same second as the mark, and one later; the mark's own deal comes back too
+    terminal.deals += [deal(3, 1_700_000_100, 5.0), deal(4, 1_700_000_500, 1.5)]
+    async with async_session() as session:
+        state = await sync_deals(session, terminal, ACCOUNT, balance=1012.5)
+    assert terminal.windows[-1][0].timestamp() == 1_700_000_100
+    assert (state.deal_count, state.total_pnl, state.last_deal_time) == (4, 12.5, 1_700_000_500)
+    assert state.balance == 1012.5
+    assert await stored_tickets() == [1, 2, 3, 4]
+
+    # Nothing new: the totals stay put
+    async with async_session() as session:
+        state = await sync_deals(session, terminal, ACCOUNT)
+    assert (state.deal_count, state.total_pnl) == (4, 12.5)
+
+
+async def test_totals_match_the_stored_deals_after_many_syncs():
+    terminal = FakeTerminal([])
+    for i in range(10):
+        terminal.deals.append(deal(100 + i, 1_700_000_000 + 60 * i, float(i)))
+        async with async_session() as session:
+            state = await sync_deals(session, terminal, ACCOUNT)
+    async with async_session() as session:
+        count, pnl = (await session.exec(
+            select(func.count(), func.sum(Deal.profit)).where(Deal.account == ACCOUNT)
+        )).one()
+    assert (state.deal_count, state.total_pnl) == (count, pnl) == (10, 45.0)
+
+
+@pytest.fixture
+async def pool():
+    terminal_pool.start()
+    yield terminal_pool
+    await terminal_pool.close()
+
+
+async def test_fetch_account_details_syncs_incrementally(client, pool):
+    form = {"account_number": ACCOUNT, "password": "pw", "server": "Demo-1", "limit": 50}
+    first = await client.post("/meta/fetch_account_details", data=form)
+    assert first.status_code == 200, first.text
+    body = first.json()
+    total = body["total_closed_trades"]
+    assert total > 0 and len(body["trade_details"]) == 50 and body["next_cursor"]
+    assert len(await stored_tickets()) == total
+
+    second = (await client.post("/meta/fetch_account_details", data={**form, "cursor": body["next_cursor"]})).json()
+    assert second["total_closed_trades"] == total
+    assert second["total_profit_loss"] == pytest.approx(body["total_profit_loss"])
+    assert second["trade_details"][0]["ticket"] > body["trade_details"][-1]["ticket"]
+
+    response = await client.post("/meta/fetch_account_details", data={**form, "password": "wrong"})
+    assert response.status_code == 401
+
+
+async def test_stored_deals_are_only_served_to_the_account_owner(client, add_orders, add_user):
+    terminal = FakeTerminal([deal(1, 1_700_000_000, 10.0)])
+    async with async_session() as session:
+        await sync_deals(session, terminal, ACCOUNT)
+    [order_id] = await add_orders(1, completed=True, email="owner@example.com")
+    async with async_session() as session:
+        completion = (await session.exec(select(CompleteOrderModel).where(CompleteOrderModel.order_id == order_id))).one()
+        completion.platform_login = str(ACCOUNT)
+        session.add(completion)
+        await session.commit()
+    _, owner = await add_user("owner@example.com")
+    _, stranger = await add_user("stranger@example.com")
+
+    response = await client.get(f"/meta/deals/{ACCOUNT}", headers=owner)
+    assert [item["ticket"] for item in response.json()["deals"]] == [1]
+    assert (await client.get(f"/meta/deals/{ACCOUNT}", headers=stranger)).status_code == 404
+    assert (await client.get(f"/meta/deals/{ACCOUNT}")).status_code == 401
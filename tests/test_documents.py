@@ -0,0 +1,141 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+from sqlmodel import func, select
+import config
+from db import async_session
+from ingest import ingestion_worker
+from models.knowledge import Document, DocumentChunk
+from storage import blob_store
+
+pytestmark = pytest.mark.anyio
+
+TEXT = b"Payouts are processed every fourteen days. " * 80
+
+
+@pytest.fixture
+async def bot():
+    # Vector indexes outlive the tables, so every test gets its own bot
+    yield f"bot-{uuid.uuid4().hex[:12]}"
+    await ingestion_worker.stop()
+
+
+@pytest.fixture
+async def headers(add_user):
+    _, headers = await add_user()
+    return headers
+
+
+async def upload(client, bot_id: str, headers: dict, body: bytes = TEXT, name: str = "rules.txt") -> dict:
+    response = await client.post(f"/bots/{bot_id}/documents", files={"files": (name, body, "text/plain")}, headers=headers)
+    assert response.status_code == 202, response.text
+    await ingestion_worker.join()
+    [document] = response.json()["documents"]
+    return (await client.get(f"/bots/{bot_id}/documents/{document['id']}")).json()
+
+
+async def set_document(document_id: int, **values) -> None:
+    async with async_session() as session:
+        await session.execute(update(Document).where(Document.id == document_id).values(**values))
+        await session.commit()
+
+
+async def chunk_count(document_id: int) -> int:
+    async with async_session() as session:
+        return (await session.exec(
+            select(func.count()).select_from(DocumentChunk).where(DocumentChunk.document_id == document_id)
+        )).one()
+
+
+async def test_uploaded_document_is_chunked_and_embedded(client, bot, headers):
+    document = await upload(client, bot, headers)
+    assert document["status"] == "ready" and document["progress"] == 1.0
+    assert document["chunk_count"] == document["embedded_count"] > 1
+    assert await chunk_count(document["id"]) == document["chunk_count"]
+    listed = (await client.get(f"/bots/{bot}/documents", params={"status": "ready"})).json()
+    assert [item["id"] for item in listed] == [document["id"]]
+
+
+async def test_unsupported_type_is_refused(client, bot, headers):
+    response = await client.post(
+        f"/bots/{bot}/documents", files={"files": ("sheet.xlsx", b"PK", "application/octet-stream")}, headers=headers
+    )
+    assert response.status_code == 415
+
+
+async def test_document_changes_need_a_signed_in_user(client, bot, headers):
+    response = await client.post(f"/bots/{bot}/documents", files={"files": ("rules.txt", TEXT, "text/plain")})
+    assert response.status_code == 401
+    document = await upload(client, bot, headers)
+    assert (await client.post(f"/bots/{bot}/documents/{document['id']}/retry")).status_code == 401
+    assert (await client.delete(f"/bots/{bot}/documents/{document['id']}")).status_code == 401
+
+
+async def test_ready_document_cannot_be_retried(client, bot, headers):
+    document = await upload(client, bot, headers)
+    response = await client.post(f"/bots/{bot}/documents/{document['id']}/retry", headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Document is ready"
+
+
+async def test_only_failed_or_stalled_documents_are_retried(client, bot, headers):
+    document = await upload(client, bot, headers)
+    retry = f"/bots/{bot}/documents/{document['id']}/retry"
+
+    # Still being worked on: updated_at is recent
+    await set_document(document["id"], status="parsing", updated_at=datetime.utcnow())
+    assert (await client.post(retry, headers=headers)).status_code == 409
+
+    # No heartbeat for longer than INGEST_STALE_SECONDS: the worker is gone
+    await set_document(document["id"], updated_at=datetime.utcnow() - timedelta(seconds=config.INGEST_STALE_SECONDS + 1))
+    response = await client.post(retry, headers=headers)
+    assert response.status_code == 202
+    await ingestion_worker.join()
+    assert (await client.get(f"/bots/{bot}/documents/{document['id']}")).json()["status"] == "ready"
+
+    await set_document(document["id"], status="failed", error="ValueError: boom")
+    assert (await client.post(retry, headers=headers)).status_code == 202
+    await ingestion_worker.join()
+    document = (await client.get(f"/bots/{bot}/documents/{document['id']}")).json()
+    assert document["status"] == "ready" and document["error"] is None
+    assert await chunk_count(document["id"]) == document["chunk_count"]
+
+
+async def test_heartbeat_keeps_a_slow_parse_from_looking_stale(bot, headers, client, monkeypatch):
+    document = await upload(client, bot, headers)
+    old = datetime.utcnow() - timedelta(seconds=config.INGEST_STALE_SECONDS + 1)
+    await set_document(document["id"], status="parsing", updated_at=old)
+    monkeypatch.setattr(config, "INGEST_HEARTBEAT_SECONDS", 0.01)
+    heartbeat = asyncio.create_task(ingestion_worker._heartbeat(document["id"]))
+    await asyncio.sleep(0.1)
+    heartbeat.cancel()
+
+    response = await client.post(f"/bots/{bot}/documents/{document['id']}/retry", headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Document is parsing"
+
+
+async def test_deleting_a_document_removes_its_chunks_and_file(client, bot, headers):
+    document = await upload(client, bot, headers)
+    # A second document with the same content shares the stored file
+    shared = await upload(client, bot, headers, name="copy.txt")
+    own = await upload(client, bot, headers, body=b"Weekend holding is allowed. " * 40)
+    async with async_session() as session:
+        blobs = {row.id: row.blob for row in (await session.exec(select(Document))).all()}
+
+    assert (await client.delete(f"/bots/{bot}/documents/{document['id']}", headers=headers)).status_code == 204
+    assert await chunk_count(document["id"]) == 0
+    assert (await client.get(f"/bots/{bot}/documents/{document['id']}")).status_code == 404
+    assert blob_store.exists(blobs[shared["id"]])
+
+    assert (await client.delete(f"/bots/{bot}/documents/{own['id']}", headers=headers)).status_code == 204
+    assert not blob_store.exists(blobs[own["id"]])
+
+
+async def test_document_being_ingested_is_not_deleted(client, bot, headers):
+    document = await upload(client, bot, headers)
+    await set_document(document["id"], status="embedding")
+    response = await client.delete(f"/bots/{bot}/documents/{document['id']}", headers=headers)
+    assert response.status_code == 409
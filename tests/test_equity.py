@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import insert
+from sqlmodel import select
+import config
+from db import async_session
+from equity import DAY, HOUR, RAW, EquitySnapshotter, equity_points, max_drawdown_pct, resolution_for
+from models.equity import EquitySnapshot
+from mt5_pool import terminal_pool
+
+pytestmark = pytest.mark.anyio
+
+ACCOUNT = 7001
+# A day boundary, so hours and days line up with it
+T0 = 1_700_006_400
+
+
+async def add_raw(*points: tuple[int, float]) -> None:
+    async with async_session() as session:
+        await session.execute(insert(EquitySnapshot), [
+            {"account": ACCOUNT, "resolution": RAW, "time": time, "equity": equity, "equity_min": equity,
+             "equity_max": equity, "balance": 1000.0}
+            for time, equity in points
+        ])
+        await session.commit()
+
+
+async def stored(resolution: int) -> list[EquitySnapshot]:
+    async with async_session() as session:
+        return list((await session.exec(
+            select(EquitySnapshot).where(EquitySnapshot.resolution == resolution).order_by(EquitySnapshot.time)
+        )).all())
+
+
+async def test_rollups_keep_the_close_and_the_range_of_complete_buckets():
+    await add_raw((T0, 1000.0), (T0 + 600, 950.0), (T0 + 1200, 1040.0), (T0 + 3000, 1010.0),
+                  (T0 + HOUR + 60, 990.0), (T0 + 2 * HOUR + 60, 1005.0))
+    # Halfway through the third hour: that bucket is still open
+    await EquitySnapshotter().maintain(now=T0 + 2 * HOUR + 1800)
+
+    hours = await stored(HOUR)
+    assert [(h.time, h.equity, h.equity_min, h.equity_max) for h in hours] == [
+        (T0, 1010.0, 950.0, 1040.0),
+        (T0 + HOUR, 990.0, 990.0, 990.0),
+    ]
+    assert await stored(DAY) == []
+
+    # The next pass only adds what completed since, and a finished day rolls up from the hours
+    await EquitySnapshotter().maintain(now=T0 + DAY + 60)
+    hours = await stored(HOUR)
+    assert [h.time for h in hours] == [T0, T0 + HOUR, T0 + 2 * HOUR]
+    [day] = await stored(DAY)
+    assert (day.time, day.equity, day.equity_min, day.equity_max) == (T0, 1005.0, 950.0, 1040.0)
+
+
+async def test_maintenance_is_idempotent():
+    await add_raw(*((T0 + 300 * i, 1000.0 + i) for i in range(30)))
+    snapshotter = EquitySnapshotter()
+    await snapshotter.maintain(now=T0 + DAY + 60)
+    first = [(row.resolution, row.time, row.equity) for row in await stored(HOUR) + await stored(DAY)]
+    await snapshotter.maintain(now=T0 + DAY + 120)
+    assert [(row.resolution, row.time, row.equity) for row in await stored(HOUR) + await stored(DAY)] == first
+
+
+async def test_retention_drops_old_raw_points_but_keeps_their_rollups(monkeypatch):
+    monkeypatch.setattr(config, "EQUITY_RAW_RETENTION_DAYS", 2.0)
+    monkeypatch.setattr(config, "EQUITY_HOURLY_RETENTION_DAYS", 0.0)
+    await add_raw((T0, 1000.0), (T0 + 3 * DAY, 1100.0))
+    await EquitySnapshotter().maintain(now=T0 + 3 * DAY + 60)
+    assert [row.time for row in await stored(RAW)] == [T0 + 3 * DAY]
+    assert [row.time for row in await stored(HOUR)] == [T0]
+    assert [row.time for row in await stored(DAY)] == [T0]
+
+
+async def test_rollup_reads_are_filled_in_from_the_finer_resolution():
+    await add_raw((T0, 1000.0), (T0 + 600, 900.0), (T0 + HOUR + 60, 1100.0), (T0 + HOUR + 120, 1080.0))
+    await EquitySnapshotter().maintain(now=T0 + HOUR + 600)
+    async with async_session() as session:
+        points = await equity_points(session, ACCOUNT, HOUR, T0, T0 + HOUR + 601)
+    # One closed hour, then the raw points of the hour still in progress
+    assert [(p.resolution, p.time) for p in points] == [(HOUR, T0), (RAW, T0 + HOUR + 60), (RAW, T0 + HOUR + 120)]
+    # The hour's low counts against the running peak even though its close recovered
+    assert max_drawdown_pct(points) == 10.0
+
+
+def test_the_finest_retained_resolution_is_chosen(monkeypatch):
+    monkeypatch.setattr(config, "EQUITY_RAW_RETENTION_DAYS", 2.0)
+    monkeypatch.setattr(config, "EQUITY_HOURLY_RETENTION_DAYS", 90.0)
+    now = T0 + 100 * DAY
+    assert resolution_for(now - DAY, now) == RAW
+    assert resolution_for(now - 30 * DAY, now) == HOUR
+    assert resolution_for(now - 95 * DAY, now) == DAY
+
+
+async def test_snapshots_are_polled_from_the_terminal_and_served_to_the_owner(client, add_orders, add_user):
+    [order_id] = await add_orders(1, completed=True, email="owner@example.com")
+    account = 1000 + order_id
+    _, headers = await add_user("owner@example.com")
+    terminal_pool.start()
+    try:
+        snapshotter = EquitySnapshotter()
+        assert await snapshotter.snapshot_once() == 1
+        assert snapshotter.failures == 0
+    finally:
+        await terminal_pool.close()
+
+    response = await client.get(f"/meta/equity/{account}", headers=headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["resolution"] == "raw"
+    [point] = body["points"]
+    assert point["equity"] == point["equity_min"] == point["equity_max"]
+    assert body["max_drawdown"] == body["daily_drawdown"] == 0.0
+
+    _, stranger = await add_user("stranger@example.com")
+    assert (await client.get(f"/meta/equity/{account}", headers=stranger)).status_code == 404
@@ -0,0 +1,71 @@
+import csv
+import io
+import pytest
+from openpyxl import load_workbook
+
+pytestmark = pytest.mark.anyio
+
+
+def read_csv(response) -> list[dict]:
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+
+async def test_orders_export_streams_every_matching_row(client, add_orders, add_user):
+    _, headers = await add_user()
+    ids = await add_orders(5, platform="mt5")
+    await add_orders(2, platform="ctrader")
+
+    response = await client.get("/order/orders/export", params={"platform": "mt5"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="orders.csv"'
+    rows = read_csv(response)
+    assert [row["id"] for row in rows] == [f"FDH{i}" for i in ids]
+
+    response = await client.get("/order/orders/export", params={"fields": "id,email"}, headers=headers)
+    assert list(read_csv(response)[0]) == ["id", "email"]
+
+
+async def test_xlsx_export_matches_the_csv(client, add_orders, add_user):
+    _, headers = await add_user()
+    await add_orders(3)
+    params = {"fields": "id,username,created_at"}
+    rows = read_csv(await client.get("/order/orders/export", params=params, headers=headers))
+
+    response = await client.get("/order/orders/export", params={**params, "format": "xlsx"}, headers=headers)
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    sheet = load_workbook(io.BytesIO(response.content), read_only=True).active
+    header, *cells = list(sheet.values)
+    assert list(header) == ["id", "username", "created_at"]
+    assert [(r[0], r[1]) for r in cells] == [(row["id"], row["username"]) for row in rows]
+
+
+async def test_users_export_leaves_out_password_hashes(client, add_user):
+    _, headers = await add_user("a@example.com", country="PK")
+    await add_user("b@example.com", country="AE")
+    rows = read_csv(await client.get("/auth/users/export", params={"country": "PK"}, headers=headers))
+    assert [row["email"] for row in rows] == ["a@example.com"]
+    assert "hashed_password" not in rows[0]
+
+
+async def test_completed_orders_export_never_includes_trading_passwords(client, add_orders, add_user):
+    _, headers = await add_user()
+    await add_orders(2, completed=True)
+    rows = read_csv(await client.get("/order/completed_orders/export", headers=headers))
+    assert len(rows) == 2
+    assert "platform_password" not in rows[0] and rows[0]["platform_login"]
+
+    response = await client.get(
+        "/order/completed_orders/export", params={"fields": "platform_password"}, headers=headers
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("url", ["/auth/users/export", "/order/orders/export", "/order/completed_orders/export"])
+async def test_exports_need_a_signed_in_user(client, url):
+    assert (await client.get(url)).status_code == 401
+
+
+async def test_unknown_format_is_refused(client, add_user):
+    _, headers = await add_user()
+    assert (await client.get("/order/orders/export", params={"format": "pdf"}, headers=headers)).status_code == 422
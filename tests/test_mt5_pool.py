@@ -0,0 +1,74 @@
+import anyio
+import pytest
+import config
+from mt5_pool import MT5BusyError, MT5Error, MT5LoginError, TerminalPool
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pool():
+    pool = TerminalPool(2)
+    pool.start()
+    yield pool
+    await pool.close()
+
+
+async def test_calls_run_in_a_worker_logged_into_the_account(pool):
+    async with pool.session(1001, "pw", "Demo-1") as session:
+        info = await session.call("account_info")
+        worker = session.worker
+    assert info["login"] == 1001 and info["server"] == "Demo-1"
+    assert worker.account == 1001
+    # The same account goes back to the terminal already logged into it
+    async with pool.session(1001, "pw", "Demo-1") as session:
+        assert session.worker is worker
+    async with pool.session(1002, "pw", "Demo-1") as session:
+        assert session.worker is not worker
+        assert (await session.call("account_info"))["login"] == 1002
+
+
+async def test_failed_login_is_reported(pool):
+    async with pool.session(1001, "wrong", "Demo-1") as session:
+        with pytest.raises(MT5LoginError):
+            await session.call("account_info")
+        assert session.worker.account is None
+
+
+async def test_busy_pool_times_out(pool, monkeypatch):
+    monkeypatch.setattr(config, "MT5_ACQUIRE_TIMEOUT", 0.1)
+    async with pool.session(1001, "pw", "Demo-1"), pool.session(1002, "pw", "Demo-1"):
+        with pytest.raises(MT5BusyError):
+            async with pool.session(1003, "pw", "Demo-1"):
+                pass
+
+
+async def test_idle_workers_are_stopped(pool, monkeypatch):
+    async with pool.session(1001, "pw", "Demo-1") as session:
+        await session.call("account_info")
+        worker = session.worker
+    assert worker.alive
+    monkeypatch.setattr(config, "MT5_IDLE_TIMEOUT", 0.0)
+    await pool.check()
+    assert not worker.alive
+
+
+async def test_sessions_started_during_close_are_refused(pool):
+    closed = anyio.Event()
+
+    async def close():
+        await pool.close()
+        closed.set()
+
+    async with anyio.create_task_group() as group:
+        async with pool.session(1001, "pw", "Demo-1") as session:
+            await session.call("account_info")
+            # close() waits for this session; new ones fail cleanly meanwhile
+            group.start_soon(close)
+            await anyio.sleep(0.05)
+            assert not closed.is_set()
+            with pytest.raises(MT5Error, match="shut down"):
+                async with pool.session(1002, "pw", "Demo-1"):
+                    pass
+        await closed.wait()
+    assert not any(worker.alive for worker in pool.workers)
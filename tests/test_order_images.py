@@ -0,0 +1,113 @@
+import hashlib
+import io
+import sqlite3
+import pytest
+from PIL import Image
+import config
+import routes.order
+from db import async_session
+from storage import blob_store, delete_unreferenced
+
+pytestmark = pytest.mark.anyio
+
+
+def png(color=(200, 30, 30), size=(64, 48)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+def order_form(txid: str = "0xabc") -> dict:
+    return {
+        "username": "trader", "email": "trader@example.com", "challenge_type": "phase one", "account_size": "100k",
+        "platform": "mt5", "payment_method": "usdt", "txid": txid,
+    }
+
+
+async def create_order(client, image: bytes, txid: str = "0xabc", content_type: str = "image/png"):
+    return await client.post("/order/order", data=order_form(txid), files={"img": ("shot.png", image, content_type)})
+
+
+async def test_screenshot_is_served_with_etag_and_ranges(client):
+    image = png()
+    response = await create_order(client, image)
+    assert response.status_code == 200, response.text
+    order_id = int(response.json()["id"].removeprefix("FDH"))
+    ref = (await client.get(f"/order/order/{order_id}")).json()["img"]
+    assert ref["content_type"] == "image/png" and ref["size"] == len(image)
+
+    response = await client.get(ref["url"])
+    assert response.content == image
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    etag = response.headers["ETag"]
+    assert (await client.get(ref["url"], headers={"If-None-Match": etag})).status_code == 304
+
+    response = await client.get(ref["url"], headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == image[:8]
+    assert response.headers["Content-Range"] == f"bytes 0-7/{len(image)}"
+    response = await client.get(ref["url"], headers={"Range": "bytes=-4"})
+    assert response.content == image[-4:]
+    # A stale If-Range gets the whole body
+    response = await client.get(ref["url"], headers={"Range": "bytes=0-7", "If-Range": '"other"'})
+    assert response.status_code == 200 and response.content == image
+    response = await client.get(ref["url"], headers={"Range": f"bytes={len(image)}-"})
+    assert response.status_code == 416
+
+    response = await client.get(ref["thumbnail_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size[0] <= config.THUMBNAIL_SIZE
+
+
+async def test_non_image_is_refused_whatever_the_client_claims(client):
+    html = b"<html><script>alert(1)</script></html>"
+    response = await create_order(client, html)
+    assert response.status_code == 415
+    # A PNG signature in front of bytes that don't decode
+    response = await create_order(client, b"\x89PNG\r\n\x1a\n" + b"\0" * 64)
+    assert response.status_code == 415
+    assert (await client.get("/order/orders")).json() == []
+
+
+async def test_upload_over_the_size_cap_is_refused(client, monkeypatch):
+    image = png(size=(256, 256))
+    monkeypatch.setattr(config, "BLOB_MAX_BYTES", len(image) - 1)
+    response = await create_order(client, image)
+    assert response.status_code == 413
+    assert (await client.get("/order/orders")).json() == []
+
+
+async def test_lost_txid_race_does_not_leave_the_screenshot_behind(client, monkeypatch):
+    image = png(color=(1, 2, 3))
+    make_thumbnail = routes.order.make_thumbnail
+
+    # Another request commits an order with the same txid after the early check
+    def thumbnail_then_race(key):
+        with sqlite3.connect(config.DATABASE_URL.removeprefix("sqlite:///")) as conn:
+            conn.execute(
+                "INSERT INTO ordermodel (username, email, challenge_type, account_size, platform, payment_method,"
+                " txid, img_blob, img_size, img_content_type, created_at)"
+                " VALUES ('other', 'o@example.com', 'phase one', '100k', 'mt5', 'usdt', '0xrace', ?, 1, 'image/png',"
+                " '2024-01-01 00:00:00')",
+                ("f" * 64,),
+            )
+        return make_thumbnail(key)
+
+    monkeypatch.setattr(routes.order, "make_thumbnail", thumbnail_then_race)
+    response = await create_order(client, image, txid="0xrace")
+    assert response.status_code == 409
+    key = hashlib.sha256(image).hexdigest()
+    assert not blob_store.exists(key)
+
+
+async def test_blobs_still_in_use_are_kept(client):
+    image = png(color=(9, 9, 9))
+    assert (await create_order(client, image)).status_code == 200
+    ref = (await client.get("/order/orders", params={"fields": "img"})).json()[0]["img"]
+    unused = blob_store.put_bytes(b"left over")
+    async with async_session() as session:
+        await delete_unreferenced(session, [ref["blob"], unused])
+    assert blob_store.exists(ref["blob"])
+    assert not blob_store.exists(unused)
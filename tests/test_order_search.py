@@ -0,0 +1,90 @@
+import hashlib
+import io
+import pytest
+from PIL import Image
+from db import async_session
+from models.order import OrderModel
+from storage import blob_store
+
+pytestmark = pytest.mark.anyio
+
+
+async def search(client, q: str, **params) -> list[dict]:
+    response = await client.get("/order/orders/search", params={"q": q, "fields": "id,username,email,txid", **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_every_word_must_match_one_of_the_searched_fields(client, add_orders):
+    await add_orders(1, username="alice", email="alice@fundhub.io", txid="0xdeadbeef01")
+    await add_orders(1, username="bob", email="bob@fundhub.io", txid="0xcafebabe02")
+    await add_orders(1, username="carol", email="carol@example.com", txid="0xdeadbeef03")
+
+    assert [o["username"] for o in await search(client, "alice")] == ["alice"]
+    assert {o["username"] for o in await search(client, "fundhub")} == {"alice", "bob"}
+    assert {o["username"] for o in await search(client, "0xdeadbeef")} == {"alice", "carol"}
+    assert [o["username"] for o in await search(client, "0xdeadbeef example")] == ["carol"]
+    # Case doesn't matter, and a word found nowhere matches nothing
+    assert [o["username"] for o in await search(client, "BOB")] == ["bob"]
+    assert await search(client, "nobody") == []
+
+
+async def test_better_matches_rank_first(client, add_orders):
+    await add_orders(1, username="trader", email="someone@example.com")
+    await add_orders(1, username="tradertrader", email="trader@example.com")
+    found = await search(client, "trader")
+    assert [o["username"] for o in found] == ["tradertrader", "trader"]
+
+
+async def test_search_keeps_the_list_filters_and_pages(client, add_orders):
+    await add_orders(5, email="vip@example.com", platform="mt5")
+    await add_orders(3, email="vip@example.com", platform="mt4")
+    await add_orders(4, email="other@example.com", platform="mt5")
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "vip", "platform": "mt5", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/order/orders/search", params=params)
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert len(seen) == len({o["id"] for o in seen}) == 5
+    assert all(o["email"] == "vip@example.com" and o["platform"] == "mt5" for o in seen)
+
+
+async def test_searches_with_no_usable_words_are_refused(client):
+    response = await client.get("/order/orders/search", params={"q": "   "})
+    assert response.status_code == 400
+    # Trigrams need three characters
+    response = await client.get("/order/orders/search", params={"q": "ab"})
+    assert response.status_code == 400
+
+
+async def test_changes_to_orders_reach_the_search_index(client, add_orders):
+    [order_id] = await add_orders(1, username="before")
+    async with async_session() as session:
+        order = await session.get(OrderModel, order_id)
+        order.username = "after"
+        session.add(order)
+        await session.commit()
+    assert await search(client, "before") == []
+    assert [o["username"] for o in await search(client, "after")] == ["after"]
+    async with async_session() as session:
+        await session.delete(await session.get(OrderModel, order_id))
+        await session.commit()
+    assert await search(client, "after") == []
+
+
+async def test_duplicate_txid_is_refused_before_the_screenshot_is_stored(client, add_orders):
+    await add_orders(1, txid="0xused")
+    out = io.BytesIO()
+    Image.new("RGB", (16, 16), (4, 5, 6)).save(out, format="PNG")
+    form = {
+        "username": "trader", "email": "trader@example.com", "challenge_type": "phase one", "account_size": "100k",
+        "platform": "mt5", "payment_method": "usdt", "txid": " 0xused ",
+    }
+    response = await client.post("/order/order", data=form, files={"img": ("shot.png", out.getvalue(), "image/png")})
+    assert response.status_code == 409
+    assert response.json()["detail"] == "This transaction ID has already been used for an order"
+    assert not blob_store.exists(hashlib.sha256(out.getvalue()).hexdigest())
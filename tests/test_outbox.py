@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import select
+import config
+from benchmarks.load import FakeSMTP, free_port
+from db import async_session
+from mailer import OutboxSender, queue_email
+from models.mail import OutboxMail
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    with FakeSMTP() as server:
+        monkeypatch.setattr(config, "SMTP_PORT", server.port)
+        yield server
+
+
+@pytest.fixture
+async def sender():
+    sender = OutboxSender()
+    yield sender
+    await sender.stop()
+
+
+async def queue(count: int) -> None:
+    async with async_session() as session:
+        for i in range(count):
+            queue_email(session, f"trader{i}@example.com", "Order received", "Thanks for your order")
+        await session.commit()
+
+
+async def outbox() -> list[OutboxMail]:
+    async with async_session() as session:
+        return (await session.exec(select(OutboxMail).order_by(OutboxMail.id))).all()
+
+
+async def test_drain_delivers_queued_mail(smtp, sender):
+    await queue(3)
+    assert await sender.drain_once() == 3
+    assert smtp.received == 3
+    mails = await outbox()
+    assert [mail.status for mail in mails] == ["sent"] * 3
+    assert all(mail.attempts == 1 and mail.sent_at is not None for mail in mails)
+    # Nothing left to send
+    assert await sender.drain_once() == 0
+
+
+async def test_unreachable_server_keeps_mail_pending_without_an_attempt(monkeypatch, sender):
+    monkeypatch.setattr(config, "SMTP_PORT", free_port())
+    await queue(2)
+    assert await sender.drain_once() == 0
+    mails = await outbox()
+    assert [mail.status for mail in mails] == ["pending"] * 2
+    assert all(mail.attempts == 0 and mail.last_error for mail in mails)
+    assert all(mail.next_attempt_at > datetime.utcnow() for mail in mails)
+
+
+async def test_leased_mail_is_not_claimed_twice(sender):
+    await queue(2)
+    claimed = await sender._claim()
+    assert len(claimed) == 2
+    assert await OutboxSender()._claim() == []
+    assert [mail.status for mail in await outbox()] == ["sending"] * 2
+
+
+async def test_expired_lease_is_claimed_again(smtp, sender):
+    await queue(1)
+    await sender._claim()
+    # The sender holding the lease died; once it runs out another sender takes the mail over
+    async with async_session() as session:
+        mail = (await session.exec(select(OutboxMail))).one()
+        mail.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        session.add(mail)
+        await session.commit()
+    assert await sender.drain_once() == 1
+    assert smtp.received == 1
+    [mail] = await outbox()
+    assert mail.status == "sent" and mail.attempts == 1
+
+
+async def test_signup_mail_is_committed_with_the_user_and_sent_later(client, smtp, sender):
+    signup = {
+        "username": "trader", "email": "trader@example.com", "password": "secret", "name": "Trader",
+        "phone_no": "0", "country": "PK", "address": "Street 1",
+    }
+    response = await client.post("/auth/signup", json=signup)
+    assert response.status_code == 200, response.text
+    # Nothing is sent on the request path
+    assert smtp.received == 0
+    [mail] = await outbox()
+    assert (mail.to_email, mail.status) == ("trader@example.com", "pending")
+
+    # A rejected signup rolls its mail back with it
+    assert (await client.post("/auth/signup", json=signup)).status_code == 400
+    assert len(await outbox()) == 1
+
+    assert await sender.drain_once() == 1
+    assert smtp.received == 1
@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from pagination import encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+async def walk(client, path: str, **params) -> tuple[list, int]:
+    items, pages, cursor = [], 0, None
+    while True:
+        response = await client.get(path, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        items += response.json()
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return items, pages
+
+
+async def test_users_by_created_at_walk_ties_without_gaps_or_repeats(client, add_user):
+    start = datetime(2024, 1, 1)
+    # Three users share each timestamp, so pages must break ties on id
+    for i in range(9):
+        await add_user(f"user{i}@example.com", created_at=start + timedelta(minutes=i // 3))
+    items, pages = await walk(client, "/auth/users", sort="created_at", limit=2, fields="id,created_at")
+    assert pages == 5
+    ids = [item["id"] for item in items]
+    assert len(ids) == len(set(ids)) == 9
+    keys = [(item["created_at"], item["id"]) for item in items]
+    assert keys == sorted(keys)
+
+
+async def test_order_filters_hold_across_pages(client, add_orders):
+    day = datetime(2024, 3, 1)
+    await add_orders(5, email="a@example.com", platform="mt5", created_at=day)
+    await add_orders(3, email="a@example.com", platform="mt4", created_at=day)
+    await add_orders(4, email="b@example.com", platform="mt5", created_at=day)
+    await add_orders(2, email="a@example.com", platform="mt5", created_at=day + timedelta(days=2))
+    items, pages = await walk(
+        client, "/order/orders", email="a@example.com", platform="mt5",
+        created_from=day.isoformat(), created_to=(day + timedelta(days=1)).isoformat(), limit=2,
+    )
+    assert pages == 3
+    assert len(items) == 5
+    assert {(item["email"], item["platform"]) for item in items} == {("a@example.com", "mt5")}
+    assert [item["id"] for item in items] == sorted(item["id"] for item in items)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", encode_cursor([1, 2]), encode_cursor([])])
+async def test_invalid_cursor_is_a_400(client, cursor):
+    response = await client.get("/order/orders", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+async def test_id_cursor_does_not_fit_the_created_at_sort(client, add_user):
+    for i in range(3):
+        await add_user(f"user{i}@example.com")
+    response = await client.get("/auth/users", params={"limit": 1})
+    cursor = response.headers["X-Next-Cursor"]
+    response = await client.get("/auth/users", params={"sort": "created_at", "cursor": cursor})
+    assert response.status_code == 400
+
+
+async def test_ndjson_streams_the_same_rows_as_the_pages(client, add_orders):
+    await add_orders(7)
+    items, _ = await walk(client, "/order/orders", limit=3, fields="id,email,created_at")
+    response = await client.get("/order/orders", params={"format": "ndjson", "fields": "id,email,created_at"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == items
+
+    # A cursor picks the stream up after that row
+    first_page = await client.get("/order/orders", params={"limit": 3, "fields": "id,email,created_at"})
+    response = await client.get(
+        "/order/orders",
+        params={"format": "ndjson", "fields": "id,email,created_at", "cursor": first_page.headers["X-Next-Cursor"]},
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == items[3:]
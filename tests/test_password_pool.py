@@ -0,0 +1,68 @@
+import threading
+import anyio
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+import config
+from auth import PasswordPool, password_pool
+from db import async_session
+from models.user import User
+
+pytestmark = pytest.mark.anyio
+
+
+async def login(client, email: str, password: str):
+    return await client.post("/auth/login", data={"username": email, "password": password})
+
+
+async def test_full_pool_sheds_with_503_and_retry_after():
+    pool = PasswordPool("thread", workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        async with anyio.create_task_group() as group:
+            # One job running, one queued: the pool is full
+            group.start_soon(pool.run, release.wait)
+            group.start_soon(pool.run, release.wait)
+            await anyio.sleep(0.05)
+            with pytest.raises(HTTPException) as shed:
+                await pool.run(release.wait)
+            assert shed.value.status_code == 503
+            assert shed.value.headers["Retry-After"] == str(config.PASSWORD_POOL_RETRY_AFTER)
+            assert pool.rejected == 1
+            release.set()
+        # Drained: new work is accepted again
+        assert pool.in_flight == 0
+        assert await pool.run(lambda: 42) == 42
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+async def test_login_is_shed_when_the_pool_is_full(client, add_user, monkeypatch):
+    user, _ = await add_user(hashed_password=bcrypt.using(rounds=config.BCRYPT_ROUNDS).hash("secret"))
+    monkeypatch.setattr(password_pool, "in_flight", password_pool.workers + password_pool.max_queue)
+    response = await login(client, user.email, "secret")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+async def test_login_rehashes_an_outdated_cost(client, add_user):
+    old_hash = bcrypt.using(rounds=config.BCRYPT_ROUNDS + 1).hash("secret")
+    user, _ = await add_user(hashed_password=old_hash)
+    response = await login(client, user.email, "secret")
+    assert response.status_code == 200, response.text
+    async with async_session() as session:
+        new_hash = (await session.get(User, user.id)).hashed_password
+    assert new_hash != old_hash
+    assert bcrypt.from_string(new_hash).rounds == config.BCRYPT_ROUNDS
+    assert bcrypt.verify("secret", new_hash)
+
+    # Current hashes are left alone
+    assert (await login(client, user.email, "secret")).status_code == 200
+    async with async_session() as session:
+        assert (await session.get(User, user.id)).hashed_password == new_hash
+
+
+async def test_wrong_password_is_refused(client, add_user):
+    user, _ = await add_user(hashed_password=bcrypt.using(rounds=config.BCRYPT_ROUNDS).hash("secret"))
+    assert (await login(client, user.email, "wrong")).status_code == 400
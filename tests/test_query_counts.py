@@ -0,0 +1,45 @@
+import pytest
+from db import track_queries
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_account_detail_is_one_query(client, add_orders):
+    [order_id] = await add_orders(1, completed=True)
+    with track_queries() as stats:
+        response = await client.get(f"/order/account_detail/{order_id}")
+    assert response.status_code == 200
+    assert response.json()["platform_login"] == str(1000 + order_id)
+    assert stats.count == 1
+
+    # Served from the response cache without touching the database
+    with track_queries() as stats:
+        response = await client.get(f"/order/account_detail/{order_id}")
+    assert response.headers["X-Cache"] == "HIT"
+    assert stats.count == 0
+
+
+async def test_account_detail_of_an_open_order_is_one_query(client, add_orders):
+    [order_id] = await add_orders(1)
+    with track_queries() as stats:
+        response = await client.get(f"/order/account_detail/{order_id}")
+    assert response.status_code == 200
+    assert "server" not in response.json()
+    assert stats.count == 1
+
+
+async def test_completed_orders_is_one_query_per_page(client, add_orders):
+    await add_orders(5, completed=True)
+    seen, cursor = [], None
+    for _ in range(3):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        with track_queries() as stats:
+            response = await client.get("/order/completed_orders", params=params)
+        assert response.status_code == 200
+        assert stats.count == 1
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+    assert cursor is None
+    assert len(seen) == 5
+    # The order's fields come from the same joined query
+    assert all(item["username"].startswith("trader") for item in seen)
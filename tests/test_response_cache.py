@@ -0,0 +1,98 @@
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+import config
+import response_cache
+from db import async_session, engine, track_queries
+from models.order import OrderModel
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_etag_is_answered_with_304_while_the_body_is_cached(client, add_orders):
+    [order_id] = await add_orders(1)
+    first = await client.get(f"/order/order/{order_id}")
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+    etag = first.headers["ETag"]
+
+    with track_queries() as stats:
+        response = await client.get(f"/order/order/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    assert stats.count == 0
+
+    response = await client.get(f"/order/order/{order_id}")
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.json() == first.json()
+
+
+async def test_a_write_through_the_orm_changes_the_etag(client, add_orders):
+    [order_id] = await add_orders(1)
+    etag = (await client.get(f"/order/order/{order_id}")).headers["ETag"]
+
+    async with async_session() as session:
+        order = await session.get(OrderModel, order_id)
+        order.account_size = "200k"
+        session.add(order)
+        await session.commit()
+
+    response = await client.get(f"/order/order/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.headers["ETag"] != etag
+    assert response.json()["account_size"] == "200k"
+
+
+async def test_completing_an_order_changes_its_account_detail(client, add_orders):
+    [order_id] = await add_orders(1)
+    etag = (await client.get(f"/order/account_detail/{order_id}")).headers["ETag"]
+    response = await client.post(
+        f"/order/complete_order/{order_id}",
+        data={"server": "Demo-1", "platform_login": "5001", "platform_password": "pw"},
+    )
+    assert response.status_code < 300, response.text
+    response = await client.get(f"/order/account_detail/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["platform_login"] == "5001"
+
+
+# A write the cache never hears of (another process, without a shared backend) shows up once
+# the version expires: the old ETag then gets the fresh body, not a 304
+async def test_unseen_write_is_served_once_the_version_expires(client, add_orders, monkeypatch):
+    monkeypatch.setattr(config, "RESPONSE_CACHE_TTL", 0.2)
+    monkeypatch.setattr(response_cache, "response_cache", response_cache.ResponseCache())
+    [order_id] = await add_orders(1)
+    etag = (await client.get(f"/order/order/{order_id}")).headers["ETag"]
+
+    async with engine.begin() as conn:
+        await conn.execute(OrderModel.__table__.update().values(account_size="50k"))
+    response = await client.get(f"/order/order/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    await asyncio.sleep(0.3)
+    response = await client.get(f"/order/order/{order_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["account_size"] == "50k"
+
+
+async def test_missing_order_is_not_cached(client):
+    response = await client.get("/order/order/999")
+    assert response.json() == {"error": "Order not found"}
+    assert "ETag" not in response.headers
+
+
+# Settings are read at import, so each default is checked in a fresh interpreter
+@pytest.mark.parametrize("backend, ttl", [("", 5.0), ("memory", 5.0), ("redis", 300.0)])
+def test_versions_only_live_long_when_they_are_shared(backend, ttl):
+    env = {**os.environ, "RESPONSE_CACHE_BACKEND": backend}
+    env.pop("RESPONSE_CACHE_TTL", None)
+    printed = subprocess.run(
+        [sys.executable, "-c", "import config; print(config.RESPONSE_CACHE_TTL)"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    assert float(printed.stdout) == ttl
@@ -0,0 +1,153 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import config
+from vector_index import BotIndex, IndexRegistry, VectorIndexError, normalize
+
+DIM = 16
+
+
+def vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "bot")
+
+
+def stored_ids(path: str) -> list[int]:
+    index = BotIndex(path)
+    return sorted(int(i) for i in index._ids) if index.rows else []
+
+
+def test_second_index_on_the_same_directory_does_not_overwrite_rows(path):
+    a = BotIndex(path)
+    a.add([1, 2], vectors(2))
+    b = BotIndex(path)
+    a.add([3], vectors(1, seed=1))
+    b.add([4], vectors(1, seed=2))
+    assert stored_ids(path) == [1, 2, 3, 4]
+    # Each sees the other's rows in searches
+    assert a.search(vectors(1, seed=2)[0], 1)[0][0] == 4
+    assert b.search(vectors(1, seed=1)[0], 1)[0][0] == 3
+
+
+def test_appends_from_two_processes_all_land(path):
+    script = (
+        "import sys, numpy as np\n"
+        "from vector_index import BotIndex\n"
+        "index = BotIndex(sys.argv[1])\n"
+        "start = int(sys.argv[2])\n"
+        "for i in range(start, start + 100):\n"
+        f"    index.add([i], np.ones((1, {DIM}), np.float32))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workers = [
+        subprocess.Popen([sys.executable, "-c", script, path, str(start)], cwd=root) for start in (1, 1001)
+    ]
+    assert [worker.wait() for worker in workers] == [0, 0]
+    assert stored_ids(path) == list(range(1, 101)) + list(range(1001, 1101))
+
+
+def test_search_ranks_by_cosine_similarity_and_skips_tombstones(path):
+    index = BotIndex(path)
+    data = vectors(50)
+    index.add(range(1, 51), data)
+    hits = index.search(data[9], 3)
+    assert hits[0][0] == 10 and hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    assert index.delete([10, 10, 999]) == 1
+    assert index.delete([10]) == 0
+    assert 10 not in [chunk_id for chunk_id, _ in index.search(data[9], 50)]
+    reopened = BotIndex(path)
+    assert (reopened.rows, reopened.tombstones) == (50, 1)
+    assert 10 not in [chunk_id for chunk_id, _ in reopened.search(data[9], 50)]
+
+
+def test_dimension_mismatch_is_refused(path):
+    index = BotIndex(path)
+    index.add([1], vectors(1))
+    with pytest.raises(VectorIndexError):
+        index.add([2], np.ones((1, DIM + 1), np.float32))
+    with pytest.raises(VectorIndexError):
+        index.search(np.ones(DIM + 1), 1)
+
+
+def test_compaction_drops_tombstones_for_every_open_index(path):
+    index = BotIndex(path)
+    other = BotIndex(path)
+    data = vectors(40)
+    index.add(range(1, 41), data)
+    index.delete(range(1, 21))
+    index.compact()
+    assert (index.rows, index.tombstones, index.generation) == (20, 0, 1)
+    assert stored_ids(path) == list(range(21, 41))
+
+    # The other object notices the swap, and its appends go after the compacted rows
+    assert other.search(data[29], 1)[0][0] == 30
+    other.add([41], vectors(1, seed=9))
+    assert stored_ids(path) == list(range(21, 42))
+    assert BotIndex(path).tombstones == 0
+
+
+def test_short_files_are_rebuilt_from_the_database(path):
+    index = BotIndex(path)
+    index.add([1, 2, 3], vectors(3))
+    with open(os.path.join(path, "ids.i64"), "r+b") as f:
+        f.truncate(8)
+    assert BotIndex(path).needs_rebuild
+
+
+def test_ivf_search_recalls_what_exact_search_finds(path, monkeypatch):
+    rng = np.random.default_rng(0)
+    centers = normalize(rng.normal(size=(20, DIM)))
+    data = centers[rng.integers(0, 20, 4000)] + rng.normal(scale=0.15, size=(4000, DIM))
+    index = BotIndex(path)
+    index.add(range(1, 4001), data)
+    index.build_ivf(seed=0)
+
+    # Rows added after the build are scanned exactly
+    extra = normalize(rng.normal(size=(1, DIM)))
+    index.add([5000], extra)
+    assert index.search(extra[0], 1, nprobe=1)[0][0] == 5000
+
+    queries = data[rng.choice(4000, 50, replace=False)] + rng.normal(scale=0.05, size=(50, DIM))
+    found = 0
+    for query in queries:
+        exact = {chunk_id for chunk_id, _ in index.search(query, 10, nprobe=0)}
+        found += len(exact & {chunk_id for chunk_id, _ in index.search(query, 10, nprobe=16)})
+    assert found / (50 * 10) >= 0.9
+    # The lists survive a reopen
+    assert BotIndex(path)._ivf is not None
+
+
+def test_maintenance_compacts_and_builds_the_ivf(path, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_COMPACT_RATIO", 0.25)
+    monkeypatch.setattr(config, "VECTOR_IVF_MIN_ROWS", 100)
+    index = BotIndex(path)
+    index.add(range(1, 201), vectors(200))
+    index.delete(range(1, 61))
+    index.maintain()
+    assert (index.rows, index.tombstones) == (140, 0)
+    assert int(index._ivf["covered"]) == 140
+
+
+def test_an_index_in_use_is_never_evicted(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "VECTOR_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "VECTOR_INDEX_CACHE_SIZE", 1)
+    registry = IndexRegistry()
+    first = registry.acquire("a")
+    with registry.use("b") as second:
+        # Over the limit, but both are held
+        assert len(registry) == 2 and registry.evictions == 0
+    # Released, "b" is the one over the limit that nobody holds
+    assert len(registry) == 1 and registry.evictions == 1
+    registry.release("a")
+    assert registry.acquire("a") is first
+    registry.release("a")
+    with registry.use("b") as index:
+        assert index is not second
+    assert registry.evictions == 2
@@ -0,0 +1,430 @@
+"""Per-bot retrieval indexes over chunk embeddings.
+
+Every bot gets a directory under VECTOR_INDEX_DIR:
+
+  vectors.f32  float32 matrix, one L2-normalized row per chunk
+  ids.i64      the DocumentChunk id of each row
+  live.u8      1 per row; 0 once the chunk is deleted (a tombstone)
+  meta.json    dim, row count, tombstones, embedder and a generation that each
+               compaction bumps. Written last, so an append cut short leaves
+               trailing bytes that the next open ignores
+  ivf.npz      optional inverted-file index: k-means centroids and the rows of
+               each list; rows added after it was built are scanned exactly
+
+The files are memory-mapped: an open index costs address space rather than heap,
+and the page cache decides how much of it stays resident. Several processes (or
+several BotIndex objects) may have the same directory open: every change takes
+an flock on <bot_id>.lock beside the directory and starts from the meta.json on
+disk, and searches pick up other writers' changes when meta.json has moved on. The database stays the
+source of truth; an index that is missing or damaged is rebuilt from its rows
+(see retrieval.bot_index).
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+import numpy as np
+import config
+
+# Rows assigned to IVF lists per matmul while building, to bound the score buffer
+ASSIGN_BLOCK = 65536
+KMEANS_ITERATIONS = 10
+# Rows sampled per list to train the centroids
+KMEANS_SAMPLE_PER_LIST = 64
+
+_FILES = {"vectors": "vectors.f32", "ids": "ids.i64", "live": "live.u8"}
+
+
+class VectorIndexError(Exception):
+    pass
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+# The k best (id, score) pairs of `scores`, a score per entry of `ids`, best first
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> list[tuple[int, float]]:
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [(int(ids[row]), float(scores[row])) for row in best if scores[row] != -np.inf]
+
+
+class BotIndex:
+    """One bot's vectors. Appends and tombstones write through to the files; searches
+    work on a snapshot of the mapped arrays and never wait for a writer."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self.tombstones = 0
+        self.embedder: Optional[str] = None
+        self.generation = 0
+        # True when there was nothing usable on disk, so the caller should load it from the database
+        self.needs_rebuild = False
+        # Highest chunk id copied in by the last rebuild. Chunks committed while it ran may
+        # already be in, so appends at or below it skip the ids that are
+        self.loaded_through = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._live: Optional[np.ndarray] = None
+        self._ivf: Optional[dict] = None
+        # os.stat() of meta.json and ivf.npz as last read, to notice other writers cheaply
+        self._meta_seen: Optional[tuple] = None
+        self._ivf_seen: Optional[tuple] = None
+        self._lock = threading.RLock()
+        # Serializes compaction and IVF builds; only compaction also holds _lock throughout,
+        # so appends and deletes wait for it but not for a build
+        self._maintain_lock = threading.Lock()
+        self._open()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    # Exclusive across processes and across BotIndex objects on this directory. The lock file
+    # sits beside the directory, which compaction replaces
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def _open(self) -> None:
+        with self._file_lock():
+            # A compaction interrupted between its two renames leaves the previous index behind
+            if not os.path.isdir(self.path) and os.path.isdir(self.path + ".old"):
+                os.rename(self.path + ".old", self.path)
+            try:
+                self._reload()
+            except FileNotFoundError:
+                self.needs_rebuild = True
+            except VectorIndexError:
+                # Files shorter than the metadata promises: start over from the database
+                self._reset()
+                self.needs_rebuild = True
+
+    @staticmethod
+    def _stat(path: str) -> tuple:
+        st = os.stat(path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    # Catch up with meta.json (and ivf.npz) as another writer may have left them. Raises
+    # FileNotFoundError when there is no index on disk
+    def _reload(self) -> None:
+        stamp = self._stat(self._file("meta.json"))
+        if stamp != self._meta_seen:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+            rows, dim = meta["rows"], meta["dim"]
+            sizes = {"vectors": rows * dim * 4, "ids": rows * 8, "live": rows}
+            if any(os.path.getsize(self._file(_FILES[name])) < size for name, size in sizes.items() if size):
+                raise VectorIndexError(f"{self.path} is shorter than its metadata")
+            # Map before changing anything, so a failure leaves the previous view intact
+            arrays = self._arrays(rows, dim)
+            self.dim, self.rows = dim, rows
+            self.tombstones, self.embedder = meta["tombstones"], meta.get("embedder")
+            self.generation = meta.get("generation", 0)
+            self._meta_seen = stamp
+            self._vectors, self._ids, self._live = arrays
+        try:
+            stamp = self._stat(self._file("ivf.npz"))
+        except FileNotFoundError:
+            self._ivf = self._ivf_seen = None
+            return
+        if stamp != self._ivf_seen:
+            with np.load(self._file("ivf.npz")) as ivf:
+                ivf = {name: ivf[name] for name in ivf.files}
+            # Written after the meta.json just read (a later append or compaction): wait for that
+            if int(ivf.get("generation", 0)) != self.generation or int(ivf["covered"]) > self.rows:
+                self._ivf = self._ivf_seen = None
+                return
+            self._ivf, self._ivf_seen = ivf, stamp
+
+    # _reload for writers, under the file lock: no meta.json there means no index at all
+    def _sync(self) -> None:
+        try:
+            self._reload()
+        except FileNotFoundError:
+            self._forget()
+
+    def _arrays(self, rows: int, dim: int) -> tuple:
+        if not rows:
+            return None, None, None
+        return (
+            np.memmap(self._file(_FILES["vectors"]), dtype="<f4", mode="r", shape=(rows, dim)),
+            np.memmap(self._file(_FILES["ids"]), dtype="<i8", mode="r", shape=(rows,)),
+            np.memmap(self._file(_FILES["live"]), dtype=np.uint8, mode="r+", shape=(rows,)),
+        )
+
+    def _map(self) -> None:
+        self._vectors, self._ids, self._live = self._arrays(self.rows, self.dim)
+
+    def _meta(self, rows: int, tombstones: int, generation: int) -> dict:
+        return {
+            "dim": self.dim, "rows": rows, "tombstones": tombstones, "embedder": self.embedder,
+            "generation": generation,
+        }
+
+    def _write_meta(self) -> None:
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._meta(self.rows, self.tombstones, self.generation), f)
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_seen = self._stat(self._file("meta.json"))
+
+    def _forget(self) -> None:
+        self.dim, self.rows, self.tombstones, self.generation = None, 0, 0, 0
+        self._vectors = self._ids = self._live = self._ivf = None
+        self._meta_seen = self._ivf_seen = None
+
+    def _reset(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._forget()
+
+    # Drop everything on disk, ready to be loaded again from the database
+    def clear(self) -> None:
+        with self._maintain_lock, self._lock, self._file_lock():
+            self._reset()
+
+    @property
+    def live_rows(self) -> int:
+        return self.rows - self.tombstones
+
+    def add(self, ids, vectors, embedder: Optional[str] = None) -> None:
+        ids = np.asarray(ids, dtype="<i8")
+        vectors = normalize(vectors).astype("<f4", copy=False)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one vector per id")
+        if not len(ids):
+            return
+        with self._lock, self._file_lock():
+            # Append after the rows on disk, which may be more than this object has seen
+            self._sync()
+            known = ids <= self.loaded_through
+            if self.rows and known.any():
+                known[known] = np.isin(ids[known], self._ids)
+                if known.any():
+                    ids, vectors = ids[~known], vectors[~known]
+                    if not len(ids):
+                        return
+            if self.dim is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.dim = vectors.shape[1]
+                self.embedder = embedder
+            elif vectors.shape[1] != self.dim:
+                raise VectorIndexError(f"Index holds {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            for name, data in (("vectors", vectors), ("ids", ids), ("live", np.ones(len(ids), np.uint8))):
+                # Write at the end the metadata knows about, over anything a failed append left
+                fd = os.open(self._file(_FILES[name]), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    offset = self.rows * data.itemsize * (data.shape[1] if data.ndim == 2 else 1)
+                    os.pwrite(fd, data.tobytes(), offset)
+                    os.ftruncate(fd, offset + data.nbytes)
+                finally:
+                    os.close(fd)
+            self.rows += len(ids)
+            self._write_meta()
+            self._map()
+
+    # Tombstone the rows of these chunk ids; returns how many rows were live
+    def delete(self, ids) -> int:
+        with self._lock, self._file_lock():
+            self._sync()
+            if not self.rows:
+                return 0
+            rows = np.flatnonzero(np.isin(self._ids, np.asarray(ids, dtype="<i8")) & (self._live == 1))
+            if len(rows):
+                self._live[rows] = 0
+                self._live.flush()
+                self.tombstones += len(rows)
+                self._write_meta()
+            return len(rows)
+
+    def _snapshot(self):
+        with self._lock:
+            try:
+                self._reload()
+            except (FileNotFoundError, ValueError, VectorIndexError):
+                # Caught mid-compaction elsewhere (the directory is being swapped) or cleared for
+                # a rebuild: the current mapping is still a consistent view
+                pass
+            return self.rows, self._vectors, self._ids, self._live, self._ivf
+
+    # Best-matching chunk ids for a query vector, as (id, cosine similarity) pairs. Exact
+    # unless an IVF index exists and `nprobe` (default VECTOR_IVF_NPROBE) is not 0
+    def search(self, query, k: int, nprobe: Optional[int] = None) -> list[tuple[int, float]]:
+        rows, vectors, ids, live, ivf = self._snapshot()
+        if not rows:
+            return []
+        query = normalize(query)
+        if query.shape != (vectors.shape[1],):
+            raise VectorIndexError(f"Index holds {vectors.shape[1]}-dimensional vectors, got a {query.shape} query")
+        nprobe = config.VECTOR_IVF_NPROBE if nprobe is None else nprobe
+        if ivf is None or not nprobe:
+            scores = vectors @ query
+            scores[live == 0] = -np.inf
+            return top_k(ids, scores, k)
+        centroids, offsets, members = ivf["centroids"], ivf["offsets"], ivf["rows"]
+        nprobe = min(nprobe, len(centroids))
+        probed = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        covered = int(ivf["covered"])
+        candidates = np.concatenate(
+            [members[offsets[lst]:offsets[lst + 1]] for lst in probed] + [np.arange(covered, rows)]
+        )
+        # Row order turns the gather into mostly sequential reads of the mapped file
+        candidates.sort()
+        scores = vectors[candidates] @ query
+        scores[live[candidates] == 0] = -np.inf
+        return top_k(ids[candidates], scores, k)
+
+    # Rewrite the files without tombstoned rows. The new files go to a sibling directory that
+    # then replaces this one; searches keep their old mapping meanwhile
+    def compact(self) -> None:
+        with self._maintain_lock, self._lock, self._file_lock():
+            self._sync()
+            if not self.rows:
+                return
+            keep = np.flatnonzero(self._live == 1)
+            tmp = self.path + ".compact"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            with open(os.path.join(tmp, _FILES["vectors"]), "wb") as f:
+                for start in range(0, len(keep), ASSIGN_BLOCK):
+                    f.write(np.ascontiguousarray(self._vectors[keep[start:start + ASSIGN_BLOCK]]).tobytes())
+            np.asarray(self._ids[keep]).tofile(os.path.join(tmp, _FILES["ids"]))
+            np.ones(len(keep), np.uint8).tofile(os.path.join(tmp, _FILES["live"]))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(self._meta(len(keep), 0, self.generation + 1), f)
+            shutil.rmtree(self.path + ".old", ignore_errors=True)
+            os.rename(self.path, self.path + ".old")
+            os.rename(tmp, self.path)
+            shutil.rmtree(self.path + ".old")
+            self._reload()
+
+    # Cluster the rows with spherical k-means into `lists` lists (default about sqrt(rows))
+    def build_ivf(self, lists: Optional[int] = None, seed: int = 0) -> None:
+        with self._maintain_lock:
+            rows, vectors, _, _, _ = self._snapshot()
+            if not rows:
+                return
+            generation = self.generation
+            lists = lists or config.VECTOR_IVF_LISTS or max(1, int(np.sqrt(rows)))
+            lists = min(lists, rows)
+            rng = np.random.default_rng(seed)
+            sample = np.asarray(vectors[np.sort(rng.choice(rows, min(rows, lists * KMEANS_SAMPLE_PER_LIST), replace=False))])
+            centroids = sample[rng.choice(len(sample), lists, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                assigned = np.argmax(sample @ centroids.T, axis=1)
+                counts = np.bincount(assigned, minlength=lists)
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+                sums = np.empty_like(centroids)
+                sums[counts > 0] = np.add.reduceat(sample[np.argsort(assigned)], starts[counts > 0])
+                # Reseed empty lists with random sample rows
+                sums[counts == 0] = sample[rng.choice(len(sample), int((counts == 0).sum()))]
+                centroids = normalize(sums)
+            assigned = np.concatenate([
+                np.argmax(vectors[start:start + ASSIGN_BLOCK] @ centroids.T, axis=1)
+                for start in range(0, rows, ASSIGN_BLOCK)
+            ])
+            members = np.argsort(assigned, kind="stable")
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assigned, minlength=lists))])
+            ivf = {
+                "centroids": centroids, "offsets": offsets, "rows": members.astype(np.int64),
+                "covered": np.int64(rows), "generation": np.int64(generation),
+            }
+            with self._lock, self._file_lock():
+                # A compaction renumbers rows. This object's compactions wait for _maintain_lock,
+                # but another process may have compacted meanwhile; these lists are then stale
+                self._sync()
+                if self.generation != generation or self.rows < rows:
+                    return
+                tmp = self._file("ivf.tmp.npz")
+                np.savez(tmp, **ivf)
+                os.replace(tmp, self._file("ivf.npz"))
+                self._ivf, self._ivf_seen = ivf, self._stat(self._file("ivf.npz"))
+
+    # Compact once enough rows are tombstones, then build or refresh the IVF index of a large
+    # enough index once the rows added since the last build are a sizable share
+    def maintain(self) -> None:
+        self._snapshot()
+        if self.rows and self.tombstones >= self.rows * config.VECTOR_COMPACT_RATIO:
+            self.compact()
+        if not config.VECTOR_IVF_MIN_ROWS or self.live_rows < config.VECTOR_IVF_MIN_ROWS:
+            return
+        covered = int(self._ivf["covered"]) if self._ivf is not None else 0
+        if self.rows - covered > covered * config.VECTOR_IVF_REBUILD_RATIO:
+            self.build_ivf()
+
+
+class IndexRegistry:
+    """The open indexes, least recently used first. Beyond VECTOR_INDEX_CACHE_SIZE, or after
+    VECTOR_INDEX_IDLE_SECONDS without use, an index is dropped and its files unmapped, but
+    never while it is acquired: a second BotIndex on the same files would be opened meanwhile."""
+
+    def __init__(self):
+        # bot_id -> [index, last used, holders]
+        self._open: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def path(self, bot_id: str) -> str:
+        return os.path.join(config.VECTOR_INDEX_DIR, bot_id)
+
+    def _evict(self, now: float) -> None:
+        for bot_id, (_, used, holders) in list(self._open.items()):
+            if len(self._open) <= config.VECTOR_INDEX_CACHE_SIZE and now - used < config.VECTOR_INDEX_IDLE_SECONDS:
+                break
+            if holders:
+                continue
+            del self._open[bot_id]
+            self.evictions += 1
+
+    # The bot's index, kept open until the matching release()
+    def acquire(self, bot_id: str) -> BotIndex:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._open.pop(bot_id, None)
+            if entry is None:
+                entry = [BotIndex(self.path(bot_id)), now, 0]
+            entry[1] = now
+            entry[2] += 1
+            self._open[bot_id] = entry
+            self._evict(now)
+            return entry[0]
+
+    def release(self, bot_id: str) -> None:
+        with self._lock:
+            entry = self._open[bot_id]
+            entry[1] = time.monotonic()
+            entry[2] -= 1
+            self._evict(entry[1])
+
+    @contextmanager
+    def use(self, bot_id: str):
+        index = self.acquire(bot_id)
+        try:
+            yield index
+        finally:
+            self.release(bot_id)
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+
+vector_indexes = IndexRegistry()